@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the markdown converter.
+
+Usage:
+    python benchmarks/bench_converter.py            # run every benchmark
+    python benchmarks/bench_converter.py parser     # run selected benchmarks
+"""
+import os
+import re
+import sys
+import time
+import timeit
+import argparse
+import tracemalloc
+
+# Skip the server import (and its Lark configuration) in the package __init__
+os.environ.setdefault("TESTING", "true")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+import logging
+
+logging.disable(logging.CRITICAL)
+
+import mistune
+from collections import OrderedDict
+from mcp_lark_doc_manage import markdown_converter
+from mcp_lark_doc_manage.markdown_converter import convert_markdown_to_blocks, encode_descendant_body
+
+SHORT_NOTE = "# 会议纪要\n\n今天讨论了 **发布计划**，结论如下：\n\n- 周五冻结代码\n- 下周一发布\n"
+
+
+def _per_call(func, number):
+    """Best-of-five seconds per call of func"""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+
+def bench_parser(args):
+    """Per-call overhead of building the mistune parser versus reusing the cached one"""
+    number = args.number
+
+    def build_parser():
+        return mistune.create_markdown(hard_wrap=True, renderer='ast', plugins=['strikethrough', 'task_lists', 'table'])
+
+    def fresh_parser_convert():
+        # What every conversion paid before the parser was cached
+        build_parser()(SHORT_NOTE)
+
+    def cold_parser_convert():
+        # A fresh parser once other code has pushed its patterns out of the re module cache
+        re.purge()
+        build_parser()(SHORT_NOTE)
+
+    cached = markdown_converter.get_markdown_parser()
+    build = _per_call(build_parser, number)
+    parse = _per_call(lambda: cached(SHORT_NOTE), number)
+    fresh = _per_call(fresh_parser_convert, number)
+    cold = _per_call(cold_parser_convert, max(1, number // 10))
+    convert = _per_call(lambda: convert_markdown_to_blocks(SHORT_NOTE), number)
+
+    print(f"short note ({len(SHORT_NOTE)} chars), {number} calls x 5")
+    print(f"  build parser          {build * 1e6:9.1f} us")
+    print(f"  parse, cached parser  {parse * 1e6:9.1f} us")
+    print(f"  parse, fresh parser   {fresh * 1e6:9.1f} us")
+    print(f"  parse, fresh, cold re {cold * 1e6:9.1f} us")
+    print(f"  full conversion       {convert * 1e6:9.1f} us")
+    print(f"  saved per call        {(fresh - parse) * 1e6:9.1f} us ({fresh / parse:.2f}x faster parse, "
+          f"{cold / parse:.0f}x with a cold re cache)")
+
+
+def _nested_list(items):
+    """Markdown list of items entries, every other one nested under the previous"""
+    return "".join(f"- item {i}\n  - child {i}\n" for i in range(items // 2))
+
+
+def bench_nested_list(args):
+    """Conversion time of long nested lists, with the block index and with the old linear parent scan"""
+    def convert(markdown, scan=False):
+        original = markdown_converter.BlockList
+        if scan:
+            # A plain list makes find_block fall back to scanning every block
+            markdown_converter.BlockList = list
+        try:
+            started = time.perf_counter()
+            convert_markdown_to_blocks(markdown)
+            return time.perf_counter() - started
+        finally:
+            markdown_converter.BlockList = original
+
+    for items in (5000, 10000, args.items):
+        markdown = _nested_list(items)
+        indexed = convert(markdown)
+        line = f"  {items:6d} items: indexed {indexed:7.3f}s ({indexed / items * 1e6:5.1f} us/item)"
+        if items <= 10000 or args.full:
+            scan = convert(markdown, scan=True)
+            line += f", linear scan {scan:7.3f}s ({scan / indexed:.1f}x slower)"
+        print(line)
+
+
+def _large_document(sections):
+    """Markdown mixing every construct the converter handles, repeated per section"""
+    section = (
+        "## Section {i}\n\n"
+        "Some **bold**, *italic*, `code`, ~~struck~~ and a [link](https://example.com/{i}) text.\n\n"
+        "- first item\n  - nested item\n- second item\n\n"
+        "1. one\n2. two\n\n"
+        "- [ ] open task\n- [x] done task\n\n"
+        "> quoted line\n\n"
+        "```python\nprint({i})\n```\n\n"
+    )
+    return "".join(section.format(i=i) for i in range(sections))
+
+
+def bench_memory(args):
+    """Allocations and peak memory converting a large document, with shared and per-block styles"""
+    def convert(markdown, shared=True):
+        # Start from empty caches so the shared run pays for building its styles
+        markdown_converter.create_text_element_style.cache_clear()
+        markdown_converter.style_template.cache_clear()
+        patched = {}
+        if not shared:
+            # Bypass the style caches so every block builds its own OrderedDicts
+            patched = {
+                "FrozenStyle": OrderedDict,
+                "style_template": lambda *items: OrderedDict(items),
+                "create_text_element_style": markdown_converter.create_text_element_style.__wrapped__,
+            }
+        originals = {name: getattr(markdown_converter, name) for name in patched}
+        for name, value in patched.items():
+            setattr(markdown_converter, name, value)
+        try:
+            tracemalloc.start()
+            started = time.perf_counter()
+            result = convert_markdown_to_blocks(markdown)
+            elapsed = time.perf_counter() - started
+            live = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return len(result["descendants"]), live, current, peak, elapsed
+        finally:
+            for name, value in originals.items():
+                setattr(markdown_converter, name, value)
+
+    markdown = _large_document(args.items // 16)
+    print(f"document of {len(markdown)} chars")
+    rows = [("shared styles", convert(markdown)), ("per-block styles", convert(markdown, shared=False))]
+    for label, (blocks, live, current, peak, elapsed) in rows:
+        print(f"  {label:17s} {blocks} blocks, {live:8d} live allocations, "
+              f"{current / 2 ** 20:6.1f} MiB retained, {peak / 2 ** 20:6.1f} MiB peak ({elapsed:.2f}s traced)")
+    shared, unshared = rows[0][1], rows[1][1]
+    print(f"  per-block / shared: {unshared[1] / shared[1]:.2f}x allocations, {unshared[2] / shared[2]:.2f}x retained, "
+          f"{unshared[3] / shared[3]:.2f}x peak")
+
+
+def bench_body(args):
+    """Time and extra peak memory of encoding a descendant create request body"""
+    from httpx._content import encode_json
+
+    result = convert_markdown_to_blocks(_large_document(args.items // 16))
+
+    def httpx_json():
+        # What passing json= to httpx does: build the body, dump it to a str, encode that
+        body = {"index": 0, "children_id": result["children_id"], "descendants": result["descendants"]}
+        return b"".join(encode_json(body)[1])
+
+    def streamed():
+        return encode_descendant_body(0, result["children_id"], result["descendants"])
+
+    print(f"{len(result['descendants'])} blocks, {len(streamed()) / 2 ** 20:.1f} MiB body")
+    for label, func in (("httpx json=", httpx_json), ("encode_descendant_body", streamed)):
+        elapsed = _per_call(func, 1)
+        tracemalloc.start()
+        body = func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"  {label:23s} {elapsed:6.3f}s, peak {peak / 2 ** 20:6.1f} MiB ({peak / len(body):.2f}x the body)")
+
+
+BENCHMARKS = {
+    "parser": bench_parser,
+    "nested_list": bench_nested_list,
+    "memory": bench_memory,
+    "body": bench_body,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("--number", type=int, default=200, help="Calls per timing run for micro-benchmarks")
+    parser.add_argument("--items", type=int, default=20000, help="Largest document size for scaling benchmarks")
+    parser.add_argument("--full", action="store_true", help="Also time slow baselines on the largest documents")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+
+    for name in args.names or BENCHMARKS:
+        print(f"== {name}")
+        started = time.perf_counter()
+        BENCHMARKS[name](args)
+        print(f"   ({time.perf_counter() - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+import difflib
+import urllib.parse
+from typing import Any, Dict, List, Tuple
+
+# Fields every block carries besides its type specific payload
+META_KEYS = {"block_id", "block_type", "parent_id", "children", "comment_ids"}
+# Text styles markdown can express; underline and colors are lost when a document is read as markdown
+TEXT_STYLE_FLAGS = ("bold", "inline_code", "italic", "strikethrough")
+# Block style fields the markdown converter sets, with the value Lark assumes when omitted
+BLOCK_STYLE_DEFAULTS = {"align": 1, "done": False, "folded": False, "language": 1, "sequence": None, "wrap": False}
+# Block types whose markdown form converts back to an equivalent block: text, headings, lists, code,
+# quote, equation, todo and quote container. Anything else (images, tables, dividers, ...) is kept as is.
+MARKDOWN_BLOCK_TYPES = set(range(2, 18)) | {34}
+TEXT_BLOCK = 2
+CODE_BLOCK = 14
+
+
+def payload_key(block: Dict[str, Any]) -> str:
+    """Name of the type specific field of a block (e.g. "text", "heading1"), or None."""
+    return next((key for key in block if key not in META_KEYS), None)
+
+
+def _element_run(element: Dict[str, Any]) -> tuple:
+    """(style key, text) of one text element as markdown shows it, or None if markdown drops it.
+
+    A document mention reads back as a link and an inline equation as its
+    $...$ text, so they compare equal to what the converter makes of them.
+    """
+    if "text_run" in element:
+        run = element["text_run"]
+        style = run.get("text_element_style") or {}
+        content = run.get("content", "")
+        link = (style.get("link") or {}).get("url")
+        if style.get("inline_code"):
+            # The renderer drops other styles inside inline code
+            flags = tuple(flag == "inline_code" for flag in TEXT_STYLE_FLAGS)
+        else:
+            flags = tuple(bool(style.get(flag, False)) for flag in TEXT_STYLE_FLAGS)
+    elif "mention_doc" in element:
+        mention = element["mention_doc"]
+        content, link = mention.get("title", ""), mention.get("url")
+        flags = (False,) * len(TEXT_STYLE_FLAGS)
+    elif "equation" in element:
+        content, link = f"${element['equation'].get('content', '').strip()}$", None
+        flags = (False,) * len(TEXT_STYLE_FLAGS)
+    else:
+        return None
+    return (flags, urllib.parse.unquote(link) if link else None), content
+
+
+def _elements_key(block: Dict[str, Any]) -> tuple:
+    """Comparable form of a block's text, as far as markdown can express it.
+
+    Adjacent runs with the same style are merged and empty runs dropped, since
+    Lark normalizes text that way when it stores it. Elements markdown cannot
+    express (user mentions, reminders, ...) are left out, so a block whose
+    markdown did not change is not patched and keeps them. Trailing newlines
+    of code, which a fenced block does not keep, are ignored as well.
+    """
+    payload = block.get(payload_key(block)) or {}
+    merged = []
+    for element in payload.get("elements") or []:
+        run = _element_run(element)
+        if run is None or not run[1]:
+            continue
+        key, content = run
+        if merged and merged[-1][0] == key:
+            merged[-1][1] += content
+        else:
+            merged.append([key, content])
+    if block.get("block_type") == CODE_BLOCK and merged:
+        merged[-1][1] = merged[-1][1].rstrip("\n")
+        if not merged[-1][1]:
+            merged.pop()
+    return tuple((key, content) for key, content in merged)
+
+
+def _is_blank(block: Dict[str, Any]) -> bool:
+    """Whether a block is an empty paragraph, which markdown shows as nothing but a blank line."""
+    return block.get("block_type") == TEXT_BLOCK and not block.get("children") and not _elements_key(block)
+
+
+def _style_key(block: Dict[str, Any]) -> tuple:
+    """Comparable form of a block's style."""
+    payload = block.get(payload_key(block)) or {}
+    style = dict(BLOCK_STYLE_DEFAULTS)
+    style.update((key, value) for key, value in (payload.get("style") or {}).items() if key in BLOCK_STYLE_DEFAULTS)
+    return tuple(sorted(style.items(), key=lambda item: item[0]))
+
+
+class _Tree:
+    """Block lookup with memoized subtree signatures."""
+
+    def __init__(self, blocks: Dict[str, Dict[str, Any]]):
+        self.blocks = blocks
+        self._signatures = {}
+
+    def items(self, block_id: str, children: List[str] = None, top_index: int = None) -> List[tuple]:
+        """Markdown blocks under a block, in document order.
+
+        Blocks markdown cannot express are left out and never changed; the
+        markdown blocks nested in them (e.g. table cell text) are listed in
+        their place, as the markdown renderer outputs them. Empty paragraphs
+        are left out too: markdown only has blank lines for them, which the
+        renderer puts between all blocks and the converter turns into empty
+        paragraphs wherever they appear.
+
+        Returns:
+            list: (block_id, parent_id, index among the parent's children,
+                index of the enclosing child of block_id) tuples
+        """
+        if children is None:
+            children = self.blocks[block_id].get("children") or []
+        items = []
+        for index, child in enumerate(children):
+            block = self.blocks.get(child)
+            if block is None:
+                continue
+            top = index if top_index is None else top_index
+            if block.get("block_type") in MARKDOWN_BLOCK_TYPES:
+                if not _is_blank(block):
+                    items.append((child, block_id, index, top))
+            else:
+                items.extend(self.items(child, top_index=top))
+        return items
+
+    def children(self, block_id: str) -> List[str]:
+        return [item[0] for item in self.items(block_id)]
+
+    def shape(self, block_id: str) -> tuple:
+        """What must match for a block to be edited in place rather than replaced."""
+        block = self.blocks[block_id]
+        return (block.get("block_type"), payload_key(block), _style_key(block))
+
+    def signature(self, block_id: str) -> tuple:
+        """Content of a whole subtree; equal signatures need no change."""
+        if block_id not in self._signatures:
+            self._signatures[block_id] = (
+                self.shape(block_id),
+                _elements_key(self.blocks[block_id]),
+                tuple(self.signature(child) for child in self.children(block_id)),
+            )
+        return self._signatures[block_id]
+
+
+def diff_blocks(
+    old_blocks: Dict[str, Dict[str, Any]],
+    old_children: List[str],
+    new_blocks: Dict[str, Dict[str, Any]],
+    new_children: List[str],
+    parent_id: str,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Compute the block operations turning one block tree into another.
+
+    Siblings are matched by subtree content. Unmatched blocks of the same type
+    and style are edited in place: their text is patched and their children
+    are diffed recursively. Everything else is deleted and re-inserted.
+
+    Existing blocks markdown cannot express (images, tables, dividers, ...)
+    are never deleted, since markdown read back from a document drops them.
+    Text nested in them is diffed in place of the block, so an edited table
+    cell is patched like any other paragraph. Empty paragraphs are not
+    matched either way: the blank lines of the new markdown add none, and
+    existing ones stay unless they separate blocks that are deleted.
+
+    Args:
+        old_blocks: Existing blocks by block ID
+        old_children: Existing child IDs of the parent
+        new_blocks: Target blocks by block ID (e.g. converter descendants)
+        new_children: Target child IDs of the parent
+        parent_id: Existing block ID of the parent
+
+    Returns:
+        tuple: (structural operations, text patches). Structural operations
+            are {"op": "delete", parent_id, start_index, end_index} and
+            {"op": "insert", parent_id, index, children_id} with children_id
+            referring to new_blocks; applying them in the returned order keeps
+            every index valid. Patches are {"block_id", "elements"} and do not
+            move blocks.
+    """
+    old_tree = _Tree(old_blocks)
+    new_tree = _Tree(new_blocks)
+    operations = []
+    patches = []
+
+    def siblings(parent: str) -> List[str]:
+        return old_children if parent == parent_id else old_blocks[parent].get("children") or []
+
+    def blank(children: List[str], index: int) -> bool:
+        return 0 <= index < len(children) and children[index] in old_blocks and _is_blank(old_blocks[children[index]])
+
+    def replace(parent: str, items: List[tuple], start: int, end: int, new_ids: List[str]) -> None:
+        """Delete items[start:end] and insert new_ids in their place."""
+        # Items may sit under different parents around kept blocks; delete each contiguous run,
+        # counting the empty paragraphs between its blocks as part of it
+        runs = []
+        for _, item_parent, index, _ in items[start:end]:
+            children = siblings(item_parent)
+            if runs and runs[-1][0] == item_parent and all(blank(children, i) for i in range(runs[-1][2], index)):
+                runs[-1][2] = index + 1
+            else:
+                runs.append([item_parent, index, index + 1])
+        for run in runs:
+            # Take the empty paragraphs before a run along when one follows it too, so no double gap is left
+            children = siblings(run[0])
+            first = run[1]
+            while blank(children, first - 1):
+                first -= 1
+            if run[2] == len(children) or blank(children, run[2]):
+                run[1] = first
+        for item_parent, first, last in reversed(runs):
+            operations.append({"op": "delete", "parent_id": item_parent, "start_index": first, "end_index": last})
+        if not new_ids:
+            return
+        previous = items[start - 1] if start > 0 else None
+        following = items[start] if start < len(items) else None
+        if end > start:
+            # Take the place of the first deleted block
+            where, index = runs[0][0], runs[0][1]
+        elif previous is None:
+            where, index = parent, 0
+        elif previous[1] == parent or (following is not None and following[1] == previous[1]):
+            where, index = previous[1], previous[2] + 1
+        else:
+            # Only add to a kept block (e.g. a table cell) between two of its own items
+            where, index = parent, previous[3] + 1
+        operations.append({"op": "insert", "parent_id": where, "index": index, "children_id": list(new_ids)})
+
+    def edit(old_id: str, new_id: str) -> None:
+        old_block, new_block = old_blocks[old_id], new_blocks[new_id]
+        if _elements_key(old_block) != _elements_key(new_block):
+            patches.append({"block_id": old_id, "elements": new_block[payload_key(new_block)].get("elements") or []})
+        diff(old_id, old_tree.items(old_id), new_tree.children(new_id))
+
+    def diff(parent: str, old_items: List[tuple], new_ids: List[str]) -> None:
+        old_ids = [item[0] for item in old_items]
+        matcher = difflib.SequenceMatcher(
+            None,
+            [old_tree.signature(block_id) for block_id in old_ids],
+            [new_tree.signature(block_id) for block_id in new_ids],
+            autojunk=False,
+        )
+        # Work from the end so edits never shift the indexes of ranges still to do
+        for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+            if tag == "equal":
+                continue
+            paired = min(i2 - i1, j2 - j1)
+            replace(parent, old_items, i1 + paired, i2, new_ids[j1 + paired:j2])
+            run_end = paired
+            for offset in reversed(range(paired)):
+                old_id, new_id = old_ids[i1 + offset], new_ids[j1 + offset]
+                if old_tree.shape(old_id) == new_tree.shape(new_id):
+                    replace(parent, old_items, i1 + offset + 1, i1 + run_end, new_ids[j1 + offset + 1:j1 + run_end])
+                    run_end = offset
+                    edit(old_id, new_id)
+            replace(parent, old_items, i1, i1 + run_end, new_ids[j1:j1 + run_end])
+
+    new_ids = [item[0] for item in new_tree.items(None, list(new_children))]
+    diff(parent_id, old_tree.items(parent_id, list(old_children)), new_ids)
+    return operations, patches
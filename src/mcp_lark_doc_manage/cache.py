@@ -0,0 +1,131 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+_MISSING = object()  # Sentinel distinguishing "not cached" from a cached None
+
+
+class TTLCache:
+    """Size-bounded in-memory cache whose entries expire after a time-to-live.
+
+    Entries are evicted least-recently-used first once ``maxsize`` is reached.
+    Each entry may carry its own TTL, which lets callers cache negative results
+    (e.g. "node not found") for a shorter time than positive ones.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        """Initialize the cache.
+
+        Args:
+            maxsize: Maximum number of entries kept
+            ttl: Default time-to-live of an entry in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for key, or default if missing or expired."""
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Cache value under key.
+
+        Args:
+            key: Cache key
+            value: Value to cache
+            ttl: Time-to-live in seconds (optional, defaults to the cache TTL)
+        """
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop the entry for key, if any."""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        self._entries.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RevisionCache:
+    """Size-bounded LRU cache of values tagged with the revision they were read at.
+
+    A lookup only hits when the caller's current revision matches the cached
+    one, so callers can revalidate with a cheap revision check instead of
+    re-downloading the value. Hits and misses are counted for diagnostics.
+    """
+
+    def __init__(self, maxsize: int):
+        """Initialize the cache.
+
+        Args:
+            maxsize: Maximum number of entries kept
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, revision: Any) -> Any:
+        """Return the value cached for key at revision, or None.
+
+        Args:
+            key: Cache key
+            revision: Current revision of the underlying object
+
+        Returns:
+            Any: Cached value, or None if missing or cached at another revision
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != revision:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: Hashable, revision: Any, value: Any) -> None:
+        """Cache value for key at revision, evicting the least recently used entry if full."""
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (revision, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop the entry for key, if any."""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop all entries and reset the counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and current size."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,192 @@
+import re
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+SNIPPET_RADIUS = 60  # Characters of context kept on each side of a match
+
+# CJK ideographs, kana and hangul; runs of these carry no word separators
+_CJK_RUN = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+")
+
+
+def _bigrams(run: str) -> List[str]:
+    """Split a run of CJK characters into overlapping bigrams."""
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def _index_terms(run: str) -> List[str]:
+    """Bigrams of a CJK run, plus its last character so every character starts a term."""
+    terms = _bigrams(run)
+    if len(run) > 1:
+        terms.append(run[-1])
+    return terms
+
+
+def segment(text: str) -> str:
+    """Rewrite text so the unicode61 tokenizer indexes CJK runs as bigrams.
+
+    FTS5's default tokenizer treats a whole run of Chinese characters as one
+    token, so a search for a word inside a sentence would never match. Each
+    run is replaced by its overlapping bigrams; other text is kept as is.
+
+    Args:
+        text: Original text
+
+    Returns:
+        str: Text ready to be stored in the FTS5 index
+    """
+    return _CJK_RUN.sub(lambda match: " " + " ".join(_index_terms(match.group(0))) + " ", text)
+
+
+def build_match_query(query: str) -> str:
+    """Translate user search keywords into an FTS5 MATCH expression.
+
+    Every whitespace-separated term must match. CJK runs become phrases of
+    adjacent bigrams, so they match the same bigrams produced by ``segment``.
+
+    Args:
+        query: Search keywords
+
+    Returns:
+        str: FTS5 query, or an empty string if the query has no searchable terms
+    """
+    phrases = []
+    for term in query.split():
+        for part in re.split(f"({_CJK_RUN.pattern})", term):
+            if not part:
+                continue
+            if _CJK_RUN.fullmatch(part):
+                tokens = _bigrams(part)
+                phrase = '"' + " ".join(tokens) + '"'
+                # A single character matches any term it starts
+                phrases.append(phrase + "*" if len(part) == 1 else phrase)
+            else:
+                words = re.findall(r"\w+", part)
+                if words:
+                    phrases.append('"' + " ".join(words) + '"')
+    return " AND ".join(phrases)
+
+
+def _snippet(content: str, query: str) -> str:
+    """Cut a short excerpt of content around the first matching term."""
+    lowered = content.lower()
+    positions = [lowered.find(term.lower()) for term in query.split()]
+    positions = [position for position in positions if position >= 0]
+    start = min(positions) if positions else 0
+    begin = max(0, start - SNIPPET_RADIUS)
+    end = min(len(content), start + SNIPPET_RADIUS)
+    excerpt = content[begin:end].replace("\n", " ").strip()
+    return ("..." if begin > 0 else "") + excerpt + ("..." if end < len(content) else "")
+
+
+class LocalIndex:
+    """SQLite FTS5 full-text index over documents fetched from Lark.
+
+    The connection is shared between threads and guarded by a lock, so the
+    blocking calls can be moved off the event loop with ``asyncio.to_thread``.
+    """
+
+    def __init__(self, path: str = ":memory:", max_documents: int = 0):
+        """Open (and create if needed) the index.
+
+        Args:
+            path: SQLite database file, or ":memory:" for a per-process index
+            max_documents: Documents kept before the least recently indexed are
+                evicted, 0 for no limit
+
+        Raises:
+            sqlite3.OperationalError: If SQLite was built without FTS5
+        """
+        self.path = path
+        self.max_documents = max_documents
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS documents USING fts5("
+                "document_id UNINDEXED, url UNINDEXED, title UNINDEXED, content UNINDEXED, "
+                "revision UNINDEXED, indexed_at UNINDEXED, title_terms, body_terms)"
+            )
+
+    def add(self, document_id: str, content: str, url: str = None, title: str = None, revision: Any = None) -> None:
+        """Index a document, replacing any earlier version of it.
+
+        Beyond max_documents, the least recently indexed documents are dropped.
+
+        Args:
+            document_id: Docx document ID
+            content: Raw document text
+            url: URL the document was fetched from (optional)
+            title: Document title (optional)
+            revision: Document revision the content belongs to (optional)
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+            self._conn.execute(
+                "INSERT INTO documents (document_id, url, title, content, revision, indexed_at, title_terms, body_terms) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (document_id, url, title, content, revision, time.time(), segment(title or ""), segment(content)),
+            )
+            if self.max_documents > 0:
+                self._conn.execute(
+                    "DELETE FROM documents WHERE rowid IN (SELECT rowid FROM documents "
+                    "ORDER BY indexed_at DESC, rowid DESC LIMIT -1 OFFSET ?)",
+                    (self.max_documents,),
+                )
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Search the index.
+
+        Args:
+            query: Search keywords
+            limit: Maximum number of results
+
+        Returns:
+            list: Matches ordered by relevance, each with document_id, url,
+                title, snippet and score
+        """
+        match = build_match_query(query)
+        if not match:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT document_id, url, title, content, bm25(documents) AS score FROM documents "
+                "WHERE documents MATCH ? ORDER BY score LIMIT ?",
+                (match, limit),
+            ).fetchall()
+        return [
+            {
+                "document_id": document_id,
+                "url": url,
+                "title": title,
+                "snippet": _snippet(content, query),
+                "score": -score,
+            }
+            for document_id, url, title, content, score in rows
+        ]
+
+    def remove(self, document_id: str) -> None:
+        """Drop a document from the index."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+
+    def clear(self) -> None:
+        """Drop all documents from the index."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM documents")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
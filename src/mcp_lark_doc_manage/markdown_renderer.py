@@ -0,0 +1,198 @@
+import urllib.parse
+from typing import Any, Dict, Iterable, Iterator, List
+
+from mcp_lark_doc_manage.markdown_converter import CODE_LANGUAGES
+
+PAGE_BLOCK = 1
+TEXT_BLOCK = 2
+HEADING_LEVELS = {block_type: block_type - 2 for block_type in range(3, 12)}  # heading1 .. heading9
+BULLET_BLOCK = 12
+ORDERED_BLOCK = 13
+CODE_BLOCK = 14
+QUOTE_BLOCK = 15
+TODO_BLOCK = 17
+DIVIDER_BLOCK = 22
+QUOTE_CONTAINER_BLOCK = 34
+LIST_BLOCKS = {BULLET_BLOCK, ORDERED_BLOCK, TODO_BLOCK}
+# Blocks that only group their children and render nothing themselves
+CONTAINER_BLOCKS = {19, 24, 25, 31, 32, QUOTE_CONTAINER_BLOCK}  # callout, grid, grid column, table, table cell
+
+# Markdown info string for each Lark code language: the first name CODE_LANGUAGES lists for it
+LANGUAGE_NAMES = {}
+for _name, _language in CODE_LANGUAGES.items():
+    LANGUAGE_NAMES.setdefault(_language, _name)
+
+
+def render_elements(elements: List[Dict[str, Any]]) -> str:
+    """Render the text elements of a block as inline markdown.
+
+    Args:
+        elements: Block text elements (text_run, mention_doc, equation, ...)
+
+    Returns:
+        str: Inline markdown
+    """
+    parts = []
+    for element in elements or []:
+        if "text_run" in element:
+            run = element["text_run"]
+            text = run.get("content", "")
+            if not text:
+                continue
+            style = run.get("text_element_style") or {}
+            if style.get("inline_code"):
+                text = f"`{text}`"
+            else:
+                if style.get("bold"):
+                    text = f"**{text}**"
+                if style.get("italic"):
+                    text = f"*{text}*"
+                if style.get("strikethrough"):
+                    text = f"~~{text}~~"
+            link = (style.get("link") or {}).get("url")
+            if link:
+                text = f"[{text}]({urllib.parse.unquote(link)})"
+        elif "mention_doc" in element:
+            mention = element["mention_doc"]
+            text = f"[{mention.get('title', '')}]({urllib.parse.unquote(mention.get('url', ''))})"
+        elif "equation" in element:
+            text = f"${element['equation'].get('content', '').strip()}$"
+        else:
+            continue
+        parts.append(text)
+    return "".join(parts)
+
+
+def _payload(block: Dict[str, Any]) -> Dict[str, Any]:
+    """Type specific field of a block (e.g. block["text"])."""
+    for key, value in block.items():
+        if key not in ("block_id", "block_type", "parent_id", "children", "comment_ids"):
+            return value if isinstance(value, dict) else {}
+    return {}
+
+
+class MarkdownRenderer:
+    """Incremental renderer turning docx blocks back into markdown.
+
+    This is the inverse of ``convert_markdown_to_blocks``. Blocks are fed one at
+    a time in document order (each parent before its children, siblings in
+    order), which is how the blocks API lists them. Only the chain of open
+    ancestors is kept, so a document is rendered while its pages are still
+    being fetched and the block tree is never held in memory.
+    """
+
+    def __init__(self):
+        # Open ancestors; the bottom frame stands for the document root
+        self._stack = [{"block_id": None, "quote": False, "indent": 0, "ordered": 0, "last": None}]
+        self._previous = None  # (is list item, quote depth) of the last rendered block
+
+    def feed(self, block: Dict[str, Any]) -> str:
+        """Render one block.
+
+        Args:
+            block: Block as returned by the blocks API
+
+        Returns:
+            str: Markdown for the block, including the separator from the previous one
+        """
+        block_type = block.get("block_type")
+        if block_type == PAGE_BLOCK:
+            self._stack[0]["block_id"] = block.get("block_id")
+            return ""
+
+        # Close the ancestors this block is not nested in
+        while len(self._stack) > 1 and self._stack[-1]["block_id"] != block.get("parent_id"):
+            self._stack.pop()
+        parent = self._stack[-1]
+        quote_depth = sum(1 for frame in self._stack if frame["quote"])
+        indent = "".join(" " * frame["indent"] for frame in self._stack)
+
+        if block_type == ORDERED_BLOCK:
+            parent["ordered"] += 1
+        else:
+            parent["ordered"] = 0
+        # A list item continues the list above it unless it follows a sibling of another kind
+        previous_sibling, parent["last"] = parent["last"], block_type
+
+        marker, lines = self._render_body(block, block_type, parent["ordered"])
+        self._stack.append({
+            "block_id": block.get("block_id"),
+            "quote": block_type == QUOTE_CONTAINER_BLOCK,
+            # Nested items align with the item text; a task's checkbox belongs to its text
+            "indent": 2 if block_type == TODO_BLOCK else len(marker) if block_type in LIST_BLOCKS else 0,
+            "ordered": 0,
+            "last": None,
+        })
+        if lines is None:
+            return ""
+
+        is_list = block_type in LIST_BLOCKS
+        prefix = "> " * quote_depth
+        if block_type == QUOTE_BLOCK:
+            prefix += "> "
+        rendered = [prefix + indent + marker + lines[0]]
+        continuation = prefix + indent + " " * len(marker)
+        rendered.extend((continuation + line).rstrip() if line else continuation.rstrip() for line in lines[1:])
+
+        separator = ""
+        if self._previous is not None:
+            previous_list, previous_quote = self._previous
+            if is_list and previous_list and previous_sibling in (None, block_type):
+                separator = "\n"
+            else:
+                separator = "\n" + ("> " * min(quote_depth, previous_quote)).rstrip() + "\n"
+        self._previous = (is_list, quote_depth)
+        return separator + "\n".join(rendered)
+
+    def _render_body(self, block: Dict[str, Any], block_type: int, ordinal: int) -> tuple:
+        """Return (list marker, lines) for a block; lines is None if it renders nothing."""
+        payload = _payload(block)
+        if block_type in CONTAINER_BLOCKS:
+            return "", None
+        if block_type == CODE_BLOCK:
+            code = "".join((element.get("text_run") or {}).get("content", "") for element in payload.get("elements") or [])
+            language = LANGUAGE_NAMES.get((payload.get("style") or {}).get("language"), "")
+            return "", [f"```{language}"] + code.rstrip("\n").split("\n") + ["```"]
+        if block_type == DIVIDER_BLOCK:
+            return "", ["---"]
+
+        if "elements" not in payload:
+            # Images, files, sheets, ... have no markdown form
+            return "", [f"<!-- unsupported block type {block_type} -->"]
+        text = render_elements(payload.get("elements"))
+        if block_type in HEADING_LEVELS:
+            return "#" * HEADING_LEVELS[block_type] + " ", [text]
+        if block_type == BULLET_BLOCK:
+            return "- ", text.split("\n")
+        if block_type == ORDERED_BLOCK:
+            return f"{ordinal}. ", text.split("\n")
+        if block_type == TODO_BLOCK:
+            done = (payload.get("style") or {}).get("done")
+            return "- [x] " if done else "- [ ] ", text.split("\n")
+        if not text:
+            # Empty paragraphs stand for blank lines, which separators already provide
+            return "", None
+        return "", text.split("\n")
+
+    def close(self) -> str:
+        """Finish the document, returning the final newline if anything was rendered."""
+        return "\n" if self._previous is not None else ""
+
+
+def render_markdown(blocks: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """Render blocks in document order to markdown, chunk by chunk.
+
+    Args:
+        blocks: Blocks as returned by the blocks API
+
+    Yields:
+        str: Consecutive pieces of the markdown document
+    """
+    renderer = MarkdownRenderer()
+    for block in blocks:
+        chunk = renderer.feed(block)
+        if chunk:
+            yield chunk
+    tail = renderer.close()
+    if tail:
+        yield tail
@@ -5,18 +5,25 @@ import httpx
 from mcp.server.fastmcp import FastMCP
 import re
 import lark_oapi as lark
-from lark_oapi.api.docx.v1 import *
-from lark_oapi.api.auth.v3 import *
-from lark_oapi.api.wiki.v2 import *
 import json
+import base64
+import contextlib
 import os
 import asyncio  # Add to imports at the beginning
-from lark_oapi.api.search.v2 import *
 from aiohttp import web
 import secrets
+import uuid
 from urllib.parse import quote
 import logging
-from mcp_lark_doc_manage.markdown_converter import convert_markdown_to_blocks
+import sqlite3
+from mcp_lark_doc_manage.markdown_converter import convert_markdown_to_blocks, encode_descendant_body, split_into_batches
+from mcp_lark_doc_manage.transport import lark_request, LarkAPIError
+from mcp_lark_doc_manage.token_store import TokenStore
+from mcp_lark_doc_manage.token_manager import TokenManager
+from mcp_lark_doc_manage.cache import TTLCache, RevisionCache
+from mcp_lark_doc_manage.local_index import LocalIndex
+from mcp_lark_doc_manage.block_diff import diff_blocks
+from mcp_lark_doc_manage.markdown_renderer import MarkdownRenderer
 from mcp.types import CallToolResult, TextContent
 from unittest.mock import MagicMock
 
@@ -34,11 +41,39 @@ LARK_APP_SECRET = os.getenv("LARK_APP_SECRET", "")
 OAUTH_HOST = os.getenv("OAUTH_HOST", "localhost")  # OAuth host configuration
 OAUTH_PORT = int(os.getenv("OAUTH_PORT", "9997"))  # OAuth port configuration
 REDIRECT_URI = f"http://{OAUTH_HOST}:{OAUTH_PORT}/oauth/callback"
-USER_ACCESS_TOKEN = None  # Global variable for user access token
-TOKEN_EXPIRES_AT = None  # Token expiration timestamp
+OAUTH_TIMEOUT = 300  # Seconds to wait for the user to complete browser authorization
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN", "300"))  # Seconds before expiry to refresh in background
+TOKEN_REFRESH_RETRY_DELAY = 5.0  # First wait before retrying a failed background refresh
+TOKEN_REFRESH_RETRY_MAX_DELAY = 300.0  # Cap of the background refresh backoff
+# Token endpoint error codes meaning the refresh token itself is invalid, expired, revoked or already used
+REFRESH_TOKEN_INVALID_CODES = {20026, 20037, 20064, 20073, 20074}
+TOKEN_STORE_PATH = os.getenv("TOKEN_STORE_PATH", "")  # Optional file persisting tokens across restarts
+TOKEN_STORE_KEY = os.getenv("TOKEN_STORE_KEY", "")  # Optional passphrase encrypting the token store
 FEISHU_AUTHORIZE_URL = "https://accounts.feishu.cn/open-apis/authen/v1/authorize"
 FOLDER_TOKEN = os.getenv("FOLDER_TOKEN", "")  # Global folder token
-token_lock = asyncio.Lock()  # Token lock for thread safety
+WIKI_NODE_CACHE_TTL = float(os.getenv("WIKI_NODE_CACHE_TTL", "600"))  # Seconds a resolved wiki node stays cached
+WIKI_NODE_NEGATIVE_TTL = float(os.getenv("WIKI_NODE_NEGATIVE_TTL", "60"))  # Seconds a missing wiki node stays cached
+WIKI_NODE_CACHE_SIZE = int(os.getenv("WIKI_NODE_CACHE_SIZE", "1024"))  # Max cached wiki node resolutions
+WIKI_NODE_NOT_FOUND_CODES = {131005}  # get_node error codes meaning the node does not exist
+DOC_CONTENT_CACHE_SIZE = int(os.getenv("DOC_CONTENT_CACHE_SIZE", "128"))  # Max cached document contents, 0 disables
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "5"))  # Documents fetched at once by batch tools
+BLOCK_PAGE_SIZE = 500  # Blocks per page when reading a document's block tree (API maximum)
+BLOCK_PATCH_BATCH_SIZE = 200  # Block updates per batch_update request (API maximum)
+DESCENDANT_BATCH_SIZE = int(os.getenv("DESCENDANT_BATCH_SIZE", "1000"))  # Max blocks inserted per descendant create call
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "")  # SQLite full-text index of fetched docs, empty disables
+LOCAL_INDEX_SIZE = int(os.getenv("LOCAL_INDEX_SIZE", "1000"))  # Max documents in the local index, 0 for no limit
+token_manager = TokenManager()  # User token state: lock-free reads, single guarded write path
+_refresh_task = None  # Background task renewing the user token ahead of expiry
+_oauth_waiter = None  # Future completed by the OAuth callback handler
+wiki_node_cache = TTLCache(WIKI_NODE_CACHE_SIZE, WIKI_NODE_CACHE_TTL)  # Wiki node token -> (node, error)
+doc_content_cache = RevisionCache(DOC_CONTENT_CACHE_SIZE)  # Document ID -> raw content at a revision
+local_index = None  # Local full-text index over fetched documents
+_index_tasks = set()  # Background writes to the local index still in progress
+if LOCAL_INDEX_PATH:
+    try:
+        local_index = LocalIndex(os.path.expanduser(LOCAL_INDEX_PATH), LOCAL_INDEX_SIZE)
+    except sqlite3.Error as e:
+        logger.warning(f"Local full-text index disabled: {str(e)}")
 
 # Validate required environment variables
 if not LARK_APP_ID or not LARK_APP_SECRET:
@@ -66,6 +101,9 @@ except Exception as e:
     if os.getenv("TESTING") != "true":
         raise
 
+# Initialize persistent token store
+token_store = TokenStore(TOKEN_STORE_PATH, TOKEN_STORE_KEY) if TOKEN_STORE_PATH else None
+
 # Initialize FastMCP server
 try:
     # 在测试环境中，跳过 FastMCP 初始化
@@ -76,17 +114,260 @@ try:
     else:
         logger.info("Testing mode, creating mock FastMCP server")
         mcp = MagicMock()
+        # Keep decorated tools as the real coroutine functions so tests can call them
+        mcp.tool.return_value = lambda fn: fn
 except Exception as e:
     logger.error(f"Failed to initialize FastMCP server: {str(e)}", exc_info=True)
     if os.getenv("TESTING") != "true":
         raise
 
+async def _resolve_wiki_node(wiki_token: str, user_access_token: str) -> tuple:
+    """Resolve a wiki node token to the document it points to
+
+    Resolutions are cached for WIKI_NODE_CACHE_TTL seconds; nodes that do not
+    exist are cached for WIKI_NODE_NEGATIVE_TTL seconds so repeated lookups of
+    a dead link do not hit the API either.
+
+    Args:
+        wiki_token: Node token from a /wiki/ URL
+        user_access_token: User access token
+
+    Returns:
+        tuple: (node, error) where node holds obj_token/obj_type on success,
+            and error is a message when the node could not be resolved
+    """
+    cached = wiki_node_cache.get(wiki_token)
+    if cached is not None:
+        return cached
+
+    wikiResponse = await lark_request(
+        "GET",
+        "/open-apis/wiki/v2/spaces/get_node",
+        user_access_token=user_access_token,
+        queries={"token": wiki_token, "obj_type": "wiki"},
+    )
+    if not wikiResponse.success():
+        result = (None, f"Failed to get wiki document real ID: code {wikiResponse.code}, message: {wikiResponse.msg}")
+        if wikiResponse.code in WIKI_NODE_NOT_FOUND_CODES:
+            wiki_node_cache.set(wiki_token, result, ttl=WIKI_NODE_NEGATIVE_TTL)
+        return result
+
+    node = wikiResponse.data.get("node") or {}
+    if not node.get("obj_token"):
+        result = (None, f"Failed to get wiki document node info, response: {wikiResponse.data}")
+        wiki_node_cache.set(wiki_token, result, ttl=WIKI_NODE_NEGATIVE_TTL)
+        return result
+
+    result = ({"obj_token": node["obj_token"], "obj_type": node.get("obj_type")}, None)
+    wiki_node_cache.set(wiki_token, result)
+    return result
+
+async def _get_document_meta(document_id: str, user_access_token: str) -> dict:
+    """Get the metadata (title, revision_id, ...) of a document
+
+    Args:
+        document_id: Docx document ID
+        user_access_token: User access token
+
+    Returns:
+        dict: Document metadata, empty if it could not be read
+    """
+    response = await lark_request(
+        "GET",
+        f"/open-apis/docx/v1/documents/{document_id}",
+        user_access_token=user_access_token,
+    )
+    if not response.success():
+        logger.warning(f"Failed to get document metadata: code {response.code}, message: {response.msg}")
+        return {}
+    return response.data.get("document") or {}
+
+async def _index_document(document_id: str, content: str, url: str, meta: dict) -> None:
+    """Add fetched content to the local full-text index, if it is enabled"""
+    if local_index is None:
+        return
+    try:
+        await asyncio.to_thread(
+            local_index.add, document_id, content,
+            url=url, title=meta.get("title"), revision=meta.get("revision_id")
+        )
+    except Exception as e:
+        logger.warning(f"Failed to index document {document_id}: {str(e)}")
+
+def _schedule_index_document(document_id: str, content: str, url: str, meta: dict) -> None:
+    """Index fetched content in the background so the fetch does not wait for it"""
+    if local_index is None:
+        return
+    task = asyncio.ensure_future(_index_document(document_id, content, url, meta))
+    _index_tasks.add(task)
+    task.add_done_callback(_index_tasks.discard)
+
+async def _resolve_document_id(documentUrl: str, user_access_token: str) -> tuple:
+    """Get the docx document ID a Lark document URL points to
+
+    Args:
+        documentUrl: Lark document URL (docx or wiki)
+        user_access_token: User access token
+
+    Returns:
+        tuple: (document_id, error) where error is a message when the URL
+            could not be resolved
+    """
+    docMatch = re.search(r'/(?:docx|wiki)/([A-Za-z0-9]+)', documentUrl)
+    if not docMatch:
+        return None, "Invalid Lark document URL format"
+
+    docID = docMatch.group(1)
+    # For wiki documents, need to make an additional request to get the actual docID
+    if '/wiki/' in documentUrl:
+        node, error = await _resolve_wiki_node(docID, user_access_token)
+        if error:
+            return None, error
+        docID = node["obj_token"]
+    return docID, None
+
+async def _fetch_doc_content(documentUrl: str, user_access_token: str) -> tuple:
+    """Fetch the raw text content of a Lark document
+
+    Args:
+        documentUrl: Lark document URL (docx or wiki)
+        user_access_token: User access token
+
+    Returns:
+        tuple: (content, error) where error is a message when the content
+            could not be fetched
+    """
+    # 1-2. Extract document ID, resolving wiki links to the actual docID
+    docID, error = await _resolve_document_id(documentUrl, user_access_token)
+    if error:
+        return None, error
+
+    # 3. Serve from cache if the document has not changed since it was cached.
+    # The revision is read before the content, so a concurrent edit can only
+    # make the cached revision older than the content, never newer.
+    meta = {}
+    revision = None
+    if DOC_CONTENT_CACHE_SIZE > 0:
+        meta = await _get_document_meta(docID, user_access_token)
+        revision = meta.get("revision_id")
+        if revision is not None:
+            content = doc_content_cache.get(docID, revision)
+            logger.debug(f"Document content cache stats: {doc_content_cache.stats()}")
+            if content is not None:
+                return content, None
+
+    # 4. Get actual document content
+    contentResponse = await lark_request(
+        "GET",
+        f"/open-apis/docx/v1/documents/{docID}/raw_content",
+        user_access_token=user_access_token,
+        queries={"lang": 0},
+    )
+
+    if not contentResponse.success():
+        return None, f"Failed to get document content: code {contentResponse.code}, message: {contentResponse.msg}"
+ 
+    if not contentResponse.data.get("content"):
+        return None, f"Document content is empty, {contentResponse}"
+
+    if revision is not None:
+        doc_content_cache.set(docID, revision, contentResponse.data["content"])
+    _schedule_index_document(docID, contentResponse.data["content"], documentUrl, meta)
+    return contentResponse.data["content"], None
+
+async def _iter_document_blocks(document_id: str, user_access_token: str, page_size: int = BLOCK_PAGE_SIZE):
+    """Yield every block of a document in document order, prefetching the next page
+
+    While the caller consumes one page, the request for the next page is
+    already in flight.
+
+    Args:
+        document_id: Docx document ID
+        user_access_token: User access token
+        page_size: Blocks requested per page
+
+    Raises:
+        LarkAPIError: If a page could not be fetched
+    """
+    async def fetch(page_token):
+        queries = {"page_size": page_size, "document_revision_id": -1}
+        if page_token:
+            queries["page_token"] = page_token
+        return await lark_request(
+            "GET",
+            f"/open-apis/docx/v1/documents/{document_id}/blocks",
+            user_access_token=user_access_token,
+            queries=queries,
+        )
+
+    pending = asyncio.ensure_future(fetch(None))
+    try:
+        while pending is not None:
+            response = await pending
+            pending = None
+            if not response.success():
+                raise LarkAPIError(f"Failed to get document blocks: code {response.code}, message: {response.msg}", response)
+
+            page_token = response.data.get("page_token")
+            if response.data.get("has_more") and page_token:
+                pending = asyncio.ensure_future(fetch(page_token))
+            for block in response.data.get("items") or []:
+                yield block
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+async def _fetch_doc_markdown(documentUrl: str, user_access_token: str) -> tuple:
+    """Fetch a Lark document as markdown rendered from its block tree
+
+    Blocks are rendered as pages arrive, so only the markdown text is kept,
+    never the whole block tree.
+
+    Args:
+        documentUrl: Lark document URL (docx or wiki)
+        user_access_token: User access token
+
+    Returns:
+        tuple: (markdown, error) where error is a message when the document
+            could not be fetched
+    """
+    docID, error = await _resolve_document_id(documentUrl, user_access_token)
+    if error:
+        return None, error
+
+    cache_key = (docID, "markdown")
+    revision = None
+    if DOC_CONTENT_CACHE_SIZE > 0:
+        revision = (await _get_document_meta(docID, user_access_token)).get("revision_id")
+        if revision is not None:
+            content = doc_content_cache.get(cache_key, revision)
+            if content is not None:
+                return content, None
+
+    renderer = MarkdownRenderer()
+    chunks = []
+    try:
+        async with contextlib.aclosing(_iter_document_blocks(docID, user_access_token)) as blocks:
+            async for block in blocks:
+                chunks.append(renderer.feed(block))
+    except LarkAPIError as e:
+        return None, str(e)
+    chunks.append(renderer.close())
+    content = "".join(chunks)
+
+    if revision is not None:
+        doc_content_cache.set(cache_key, revision, content)
+    return content, None
+
+
 @mcp.tool()
-async def get_lark_doc_content(documentUrl: str) -> CallToolResult:
+async def get_lark_doc_content(documentUrl: str, mode: str = "text") -> CallToolResult:
     """Get Lark document content
     
     Args:
         documentUrl: Lark document URL
+        mode: "text" returns the plain text, "markdown" renders headings, lists, code
+            and links from the document's blocks (default: "text")
     """
     try:
         if not larkClient or not larkClient.auth or not larkClient.docx or not larkClient.wiki:
@@ -94,10 +375,15 @@ async def get_lark_doc_content(documentUrl: str) -> CallToolResult:
                 isError=True,
                 content=[TextContent(type="text", text="Lark client not properly initialized")]
             )
+
+        if mode not in ("text", "markdown"):
+            return CallToolResult(
+                isError=True,
+                content=[TextContent(type="text", text=f"Invalid content mode: {mode}")]
+            )
                     
-        async with token_lock:
-            current_token = USER_ACCESS_TOKEN
-        if not current_token or await _check_token_expired():
+        current_token = token_manager.valid_token()
+        if not current_token:
             try:
                 current_token = await _auth_flow()
             except Exception as e:
@@ -106,62 +392,18 @@ async def get_lark_doc_content(documentUrl: str) -> CallToolResult:
                     content=[TextContent(type="text", text=f"Failed to get user access token: {str(e)}")]
                 )
 
-        # 1. Extract document ID
-        docMatch = re.search(r'/(?:docx|wiki)/([A-Za-z0-9]+)', documentUrl)
-        if not docMatch:
-            return CallToolResult(
-                isError=True,
-                content=[TextContent(type="text", text="Invalid Lark document URL format")]
-            )
-
-        docID = docMatch.group(1)
-        isWiki = '/wiki/' in documentUrl
-        
-        option = lark.RequestOption.builder().user_access_token(current_token).build()
-
-        # 3. For wiki documents, need to make an additional request to get the actual docID
-        if isWiki:
-            # Construct request object
-            wikiRequest: GetNodeSpaceRequest = GetNodeSpaceRequest.builder() \
-                .token(docID) \
-                .obj_type("wiki") \
-                .build()
-            wikiResponse: GetNodeSpaceResponse = larkClient.wiki.v2.space.get_node(wikiRequest, option)    
-            if not wikiResponse.success():
-                return CallToolResult(
-                    isError=True,
-                    content=[TextContent(type="text", text=f"Failed to get wiki document real ID: code {wikiResponse.code}, message: {wikiResponse.msg}")]
-                )
-                
-            if not wikiResponse.data or not wikiResponse.data.node or not wikiResponse.data.node.obj_token:
-                return CallToolResult(
-                    isError=True,
-                    content=[TextContent(type="text", text=f"Failed to get wiki document node info, response: {wikiResponse.data}")]
-                )
-            docID = wikiResponse.data.node.obj_token    
-
-        # 4. Get actual document content
-        contentRequest: RawContentDocumentRequest = RawContentDocumentRequest.builder() \
-            .document_id(docID) \
-            .lang(0) \
-            .build()
-            
-        contentResponse: RawContentDocumentResponse = larkClient.docx.v1.document.raw_content(contentRequest, option)
-
-        if not contentResponse.success():
-            return CallToolResult(
-                isError=True,
-                content=[TextContent(type="text", text=f"Failed to get document content: code {contentResponse.code}, message: {contentResponse.msg}")]
-            )
-     
-        if not contentResponse.data or not contentResponse.data.content:
+        if mode == "markdown":
+            content, error = await _fetch_doc_markdown(documentUrl, current_token)
+        else:
+            content, error = await _fetch_doc_content(documentUrl, current_token)
+        if error:
             return CallToolResult(
                 isError=True,
-                content=[TextContent(type="text", text=f"Document content is empty, {contentResponse}")]
+                content=[TextContent(type="text", text=error)]
             )
             
         return CallToolResult(
-            content=[TextContent(type="text", text=contentResponse.data.content)]
+            content=[TextContent(type="text", text=content)]
         )
     except Exception as e:
         return CallToolResult(
@@ -171,26 +413,28 @@ async def get_lark_doc_content(documentUrl: str) -> CallToolResult:
 
 
 @mcp.tool()
-async def search_wiki(query: str, page_size: int = 10) -> CallToolResult:
-    """Search Lark Wiki
+async def get_lark_doc_contents(urls: list, max_concurrency: int = None) -> CallToolResult:
+    """Get the content of multiple Lark documents in one call
     
     Args:
-        query: Search keywords
-        page_size: Number of results to return (default: 10)
+        urls: List of Lark document URLs (docx or wiki)
+        max_concurrency: Maximum number of documents fetched at once (default: BATCH_CONCURRENCY)
     """
     try:
-        if not larkClient or not larkClient.auth or not larkClient.wiki:
+        if not larkClient or not larkClient.auth or not larkClient.docx or not larkClient.wiki:
             return CallToolResult(
                 isError=True,
                 content=[TextContent(type="text", text="Lark client not properly initialized")]
             )
 
-        # Check if user token exists
-        async with token_lock:
-            current_token = USER_ACCESS_TOKEN
+        if not urls:
+            return CallToolResult(
+                isError=True,
+                content=[TextContent(type="text", text="No document URLs provided")]
+            )
 
-        # Check token existence and expiration
-        if not current_token or await _check_token_expired():
+        current_token = token_manager.valid_token()
+        if not current_token:
             try:
                 current_token = await _auth_flow()
             except Exception as e:
@@ -199,60 +443,204 @@ async def search_wiki(query: str, page_size: int = 10) -> CallToolResult:
                     content=[TextContent(type="text", text=f"Failed to get user access token: {str(e)}")]
                 )
 
-        # Construct search request using raw API mode
-        request: lark.BaseRequest = lark.BaseRequest.builder() \
-            .http_method(lark.HttpMethod.POST) \
-            .uri("/open-apis/wiki/v1/nodes/search") \
-            .token_types({lark.AccessTokenType.USER}) \
-            .body({
-                "page_size": page_size,
-                "query": query
-            }) \
-            .build()
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or BATCH_CONCURRENCY))
 
-        option = lark.RequestOption.builder().user_access_token(current_token).build()
-        
-        # Send search request
-        response: lark.BaseResponse = larkClient.request(request, option)
+        async def fetch(url: str) -> dict:
+            async with semaphore:
+                try:
+                    content, error = await _fetch_doc_content(url, current_token)
+                except Exception as e:
+                    content, error = None, f"Error getting document content: {str(e)}"
+            if error:
+                return {"url": url, "error": error}
+            return {"url": url, "content": content}
 
-        if not response.success():
+        # Fetch each distinct URL once, then report results in request order
+        unique_urls = list(dict.fromkeys(urls))
+        fetched = await asyncio.gather(*[fetch(url) for url in unique_urls])
+        by_url = dict(zip(unique_urls, fetched))
+        results = [by_url[url] for url in urls]
+
+        return CallToolResult(
+            isError=all("error" in result for result in results),
+            content=[TextContent(type="text", text=json.dumps(results, ensure_ascii=False, indent=2))]
+        )
+    except Exception as e:
+        return CallToolResult(
+            isError=True,
+            content=[TextContent(type="text", text=f"Error getting document contents: {str(e)}")]
+        )
+
+
+async def _iter_wiki_search(query: str, user_access_token: str, page_size: int = 20,
+                            start: dict = None, limit: int = None):
+    """Iterate over wiki search results, prefetching the next page
+
+    While the caller consumes one page, the request for the next page is
+    already in flight. No page is prefetched once limit results are covered.
+
+    Args:
+        query: Search keywords
+        user_access_token: User access token
+        page_size: Number of results requested per page
+        start: Pagination state to resume from, as returned alongside an earlier item
+        limit: Number of results the caller intends to consume (optional)
+
+    Yields:
+        tuple: (item, resume) where resume is the pagination state that continues
+            after this item, or None if it is the last one
+
+    Raises:
+        LarkAPIError: If a page request fails
+    """
+    async def fetch(page_token):
+        queries = {"page_size": page_size}
+        if page_token:
+            queries["page_token"] = page_token
+        return await lark_request(
+            "POST",
+            "/open-apis/wiki/v1/nodes/search",
+            user_access_token=user_access_token,
+            queries=queries,
+            body={"query": query},
+            idempotent=True,
+        )
+
+    page_token = (start or {}).get("page_token")
+    offset = (start or {}).get("offset", 0)
+    yielded = 0
+    pending = asyncio.ensure_future(fetch(page_token))
+    try:
+        while pending is not None:
+            response = await pending
+            pending = None
+            if not response.success():
+                raise LarkAPIError(f"Failed to search wiki: code {response.code}, message: {response.msg}", response)
+
+            items = response.data.get("items") or []
+            next_page_token = response.data.get("page_token") if response.data.get("has_more") else None
+            if next_page_token and (limit is None or yielded + len(items) - offset < limit):
+                pending = asyncio.ensure_future(fetch(next_page_token))
+
+            for index in range(offset, len(items)):
+                if index + 1 < len(items):
+                    resume = {"page_token": page_token, "offset": index + 1}
+                elif next_page_token:
+                    resume = {"page_token": next_page_token, "offset": 0}
+                else:
+                    resume = None
+                yielded += 1
+                yield items[index], resume
+
+            if next_page_token and pending is None:
+                # The limit hint was reached but the caller kept consuming
+                pending = asyncio.ensure_future(fetch(next_page_token))
+            page_token, offset = next_page_token, 0
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+@mcp.tool()
+async def search_wiki(query: str, page_size: int = 20, limit: int = None, cursor: str = None,
+                      mode: str = "remote", fallback: bool = False) -> CallToolResult:
+    """Search Lark Wiki
+    
+    Follows pagination until limit results are collected or no results remain.
+    
+    Args:
+        query: Search keywords
+        page_size: Number of results requested per page (default: 20)
+        limit: Maximum number of results to return (default: page_size)
+        cursor: Continuation cursor returned by a previous call (optional)
+        mode: "remote" searches Lark, "local" searches documents already fetched (default: "remote")
+        fallback: In local mode, search Lark when the local index has no match (default: False)
+    """
+    try:
+        if not larkClient or not larkClient.auth or not larkClient.wiki:
             return CallToolResult(
                 isError=True,
-                content=[TextContent(type="text", text=f"Failed to search wiki: code {response.code}, message: {response.msg}")]
+                content=[TextContent(type="text", text="Lark client not properly initialized")]
             )
 
-        if not response.raw or not response.raw.content:
+        if mode not in ("remote", "local"):
             return CallToolResult(
                 isError=True,
-                content=[TextContent(type="text", text=f"Search response content is empty, {response}")]
+                content=[TextContent(type="text", text=f"Invalid search mode: {mode}")]
             )
 
-        # Parse response content
+        if limit is None:
+            limit = page_size
+
         try:
-            result = json.loads(response.raw.content.decode('utf-8'))
-            if not result.get("data") or not result["data"].get("items"):
+            start = _decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return CallToolResult(
+                isError=True,
+                content=[TextContent(type="text", text=str(e))]
+            )
+
+        # Answer from the local index of fetched documents
+        if mode == "local":
+            if local_index is None:
                 return CallToolResult(
-                    content=[TextContent(type="text", text="No results found")]
+                    isError=True,
+                    content=[TextContent(type="text", text="Local index is not enabled, set LOCAL_INDEX_PATH to enable it")]
                 )
-            
-            # Format search results
-            results = []
-            for item in result["data"]["items"]:
-                results.append({
-                    "title": item.get("title"),
-                    "url": item.get("url"),
-                    "create_time": item.get("create_time"),
-                    "update_time": item.get("update_time")
-                })
-            
+            if _index_tasks:
+                # Let documents fetched just before the search land in the index
+                await asyncio.gather(*_index_tasks)
+            local_results = await asyncio.to_thread(local_index.search, query, limit or 20)
+            if local_results or not fallback:
+                if not local_results:
+                    return CallToolResult(
+                        content=[TextContent(type="text", text="No results found")]
+                    )
+                return CallToolResult(
+                    content=[TextContent(type="text", text=json.dumps(local_results, ensure_ascii=False, indent=2))]
+                )
+            logger.debug(f"No local results for {query!r}, falling back to remote search")
+
+        # Check token existence and expiration
+        current_token = token_manager.valid_token()
+        if not current_token:
+            try:
+                current_token = await _auth_flow()
+            except Exception as e:
+                return CallToolResult(
+                    isError=True,
+                    content=[TextContent(type="text", text=f"Failed to get user access token: {str(e)}")]
+                )
+
+        # Collect results page by page, formatting while the next page loads
+        results = []
+        next_cursor = None
+        try:
+            async with contextlib.aclosing(_iter_wiki_search(query, current_token, page_size, start, limit)) as search:
+                async for item, resume in search:
+                    results.append({
+                        "title": item.get("title"),
+                        "url": item.get("url"),
+                        "create_time": item.get("create_time"),
+                        "update_time": item.get("update_time")
+                    })
+                    if limit and len(results) >= limit:
+                        next_cursor = _encode_cursor(resume) if resume else None
+                        break
+        except LarkAPIError as e:
             return CallToolResult(
-                content=[TextContent(type="text", text=json.dumps(results, ensure_ascii=False, indent=2))]
+                isError=True,
+                content=[TextContent(type="text", text=str(e))]
             )
-        except Exception as e:
+
+        if not results:
             return CallToolResult(
-                isError=True,
-                content=[TextContent(type="text", text=f"Failed to parse search results: {str(e)}")]
+                content=[TextContent(type="text", text="No results found")]
             )
+
+        content = [TextContent(type="text", text=json.dumps(results, ensure_ascii=False, indent=2))]
+        if next_cursor:
+            content.append(TextContent(type="text", text=json.dumps({"next_cursor": next_cursor})))
+        return CallToolResult(content=content)
     except Exception as e:
         return CallToolResult(
             isError=True,
@@ -263,17 +651,168 @@ async def search_wiki(query: str, page_size: int = 10) -> CallToolResult:
 
 # Add a function to check if token has expired
 async def _check_token_expired() -> bool:
-    """Check if the current token has expired"""
-    async with token_lock:
-        if not TOKEN_EXPIRES_AT or not USER_ACCESS_TOKEN:
-            return True
-        # Consider token expired 60 seconds early to avoid edge cases
-        return time.time() + 60 >= TOKEN_EXPIRES_AT
+    """Check if the current token has expired (lock-free)"""
+    return token_manager.snapshot.is_expired()
+
+async def _store_token(result: dict) -> None:
+    """Store the tokens returned by the OAuth token endpoint
+
+    Args:
+        result: JSON body of a successful /authen/v2/oauth/token response
+    """
+    now = time.time()
+    expires_in = result.get("expires_in", 0)
+    changes = {
+        "access_token": result.get("access_token"),
+        "expires_at": now + expires_in if expires_in else None
+    }
+    if result.get("refresh_token"):
+        refresh_expires_in = result.get("refresh_token_expires_in", 0)
+        changes["refresh_token"] = result["refresh_token"]
+        changes["refresh_token_expires_at"] = now + refresh_expires_in if refresh_expires_in else None
+    token_manager.update(**changes)
+    await _persist_tokens()
+    _schedule_token_refresh()
+
+async def _persist_tokens() -> None:
+    """Write the current tokens to the token store, if one is configured"""
+    if not token_store:
+        return
+    snapshot = token_manager.snapshot
+    state = {
+        "app_id": LARK_APP_ID,
+        "access_token": snapshot.access_token,
+        "expires_at": snapshot.expires_at,
+        "refresh_token": snapshot.refresh_token,
+        "refresh_token_expires_at": snapshot.refresh_token_expires_at
+    }
+    try:
+        await asyncio.to_thread(token_store.save, state)
+    except Exception as e:
+        logger.warning(f"Failed to persist tokens: {str(e)}")
+
+async def _load_stored_tokens() -> bool:
+    """Load tokens from the token store if they are newer than the in-memory ones
+
+    Returns:
+        bool: True if tokens were loaded from the store
+    """
+    if not token_store:
+        return False
+    current = token_manager.snapshot
+    state = await asyncio.to_thread(token_store.load)
+    if not state or state.get("app_id") != LARK_APP_ID:
+        return False
+    if current.expires_at and (state.get("expires_at") or 0) <= current.expires_at:
+        return False
+    loaded = token_manager.update(
+        expected=current,
+        access_token=state.get("access_token"),
+        expires_at=state.get("expires_at"),
+        refresh_token=state.get("refresh_token"),
+        refresh_token_expires_at=state.get("refresh_token_expires_at")
+    )
+    if not loaded:
+        # Tokens changed while reading the store; keep the newer in-memory ones
+        return False
+    logger.info("Loaded user access token from token store")
+    _schedule_token_refresh()
+    return True
+
+async def _refresh_user_token() -> str:
+    """Renew the user access token with the stored refresh token
+
+    Returns:
+        str: New user access token, or None if no usable refresh token exists
+            or the refresh failed. The refresh token is only discarded when Lark
+            rejects it; after transient failures it is kept for another attempt
+    """
+    snapshot = token_manager.snapshot
+    if not snapshot.refresh_token:
+        return None
+    if not snapshot.has_usable_refresh_token():
+        logger.info("Refresh token expired, interactive authorization required")
+        return None
+
+    response = await lark_request("POST", "/open-apis/authen/v2/oauth/token", body={
+        "grant_type": "refresh_token",
+        "client_id": LARK_APP_ID,
+        "client_secret": LARK_APP_SECRET,
+        "refresh_token": snapshot.refresh_token
+    })
+    if not response.success() or not response.body.get("access_token"):
+        logger.warning(f"Failed to refresh user access token: code {response.code}, message: {response.msg}")
+        if response.code in REFRESH_TOKEN_INVALID_CODES:
+            # Refresh tokens are single-use; a rejected one will not work again
+            token_manager.update(expected=snapshot, refresh_token=None, refresh_token_expires_at=None)
+            await _persist_tokens()
+        return None
+
+    await _store_token(response.body)
+    logger.info("User access token refreshed")
+    return response.body["access_token"]
+
+async def _token_refresh_loop() -> None:
+    """Keep the user access token fresh by renewing it ahead of its expiry
+
+    Failed refreshes are retried with exponential backoff for as long as the
+    refresh token stays usable. Each refresh goes through token_manager.acquire,
+    so a tool call needing a token at the same time joins it instead of posting
+    the same single-use refresh token again.
+    """
+    failures = 0
+    while True:
+        snapshot = token_manager.snapshot
+        if not snapshot.expires_at or not snapshot.refresh_token:
+            return
+        delay = snapshot.expires_at - TOKEN_REFRESH_MARGIN - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+            # The token may have been replaced while sleeping; re-check its expiry
+            continue
+        try:
+            token = await token_manager.acquire(_refresh_user_token)
+        except Exception as e:
+            logger.warning(f"Background token refresh failed: {str(e)}")
+            token = None
+        if token:
+            failures = 0
+            continue
+        if not token_manager.snapshot.has_usable_refresh_token():
+            # Rejected or expired; the next tool call falls back to interactive authorization
+            return
+        failures += 1
+        retry_delay = min(TOKEN_REFRESH_RETRY_MAX_DELAY, TOKEN_REFRESH_RETRY_DELAY * 2 ** (failures - 1))
+        logger.warning(f"Background token refresh failed, retrying in {retry_delay:.0f}s")
+        await asyncio.sleep(retry_delay)
+
+def _schedule_token_refresh() -> None:
+    """Start the background refresh task if a refresh token is available"""
+    global _refresh_task
+    if not token_manager.snapshot.refresh_token:
+        return
+    if _refresh_task is not None and not _refresh_task.done():
+        # The running loop re-reads the token expiry on every iteration
+        return
+    _refresh_task = asyncio.get_running_loop().create_task(_token_refresh_loop())
+
+def _complete_oauth_waiter(token: str = None, error: Exception = None) -> None:
+    """Wake up the authorization flow waiting for the OAuth callback"""
+    if _oauth_waiter is None or _oauth_waiter.done():
+        return
+    if error is not None:
+        _oauth_waiter.set_exception(error)
+    else:
+        _oauth_waiter.set_result(token)
 
 async def _handle_oauth_callback(webReq: web.Request) -> web.Response:
     """Handle OAuth callback from Feishu"""
     code = webReq.query.get('code')
     if not code:
+        error = webReq.query.get('error')
+        if error:
+            # The user denied access; fail the waiting flow instead of letting it time out
+            _complete_oauth_waiter(error=Exception(f"Authorization failed: {error}"))
         return web.Response(text="No authorization code received", status=400)
         
     # Exchange code for user_access_token using raw API mode
@@ -285,71 +824,46 @@ async def _handle_oauth_callback(webReq: web.Request) -> web.Response:
         "redirect_uri": REDIRECT_URI
     }
     
-    request: lark.BaseRequest  = lark.BaseRequest.builder() \
-        .http_method(lark.HttpMethod.POST) \
-        .uri("/open-apis/authen/v2/oauth/token") \
-        .body(request_body) \
-        .headers({
-            "content-type": "application/json"
-        }) \
-        .build()
-            
-    # Use an empty RequestOption object instead of None for the request method
-    # Create an empty RequestOption object to replace None
-    option = lark.RequestOption.builder().build()
     if not larkClient:
         return web.Response(text="Lark client not initialized", status=500)
 
-    response: lark.BaseResponse = larkClient.request(request, option)
+    response = await lark_request("POST", "/open-apis/authen/v2/oauth/token", body=request_body)
     
     if not response.success():
-        # print(f"OAuth token request failed:")
-        # print(f"Response code: {response.code}")
-        # print(f"Response msg: {response.msg}")
-        # print(f"Raw response: {response.raw.content if response.raw else 'No raw content'}")
+        # Authorization codes are single-use, so the waiting flow cannot succeed anymore
+        _complete_oauth_waiter(error=Exception(f"Failed to get token: {response.msg} (code: {response.code})"))
         return web.Response(text=f"Failed to get token: {response.msg} (code: {response.code})", status=500)
         
-    # Parse response
-    if not response.raw or not response.raw.content:
-        return web.Response(text="Empty response from server", status=500)
-        
-    result = json.loads(response.raw.content.decode('utf-8'))
-    if result.get("code") != 0:
-        return web.Response(
-            text=f"Failed to get token: {result.get('error_description', 'Unknown error')}",
-            status=500
-        )
-    
     # Store token
-    global USER_ACCESS_TOKEN, TOKEN_EXPIRES_AT
-    async with token_lock:
-        USER_ACCESS_TOKEN = result.get("access_token")
-        expires_in = result.get("expires_in", 0)
-        TOKEN_EXPIRES_AT = time.time() + expires_in if expires_in else None
+    await _store_token(response.body)
+    _complete_oauth_waiter(token=response.body.get("access_token"))
         
     return web.Response(text="Authorization successful! You can close this window.")
 
 async def _start_oauth_server() -> str:
     """Start local server to handle OAuth callback"""
+    global _oauth_waiter
     # CI环境检测 - 避免在CI中启动真实服务器和浏览器
     if os.getenv("CI") == "true" or os.getenv("PYTEST_RUNNING") == "true":
         logger.info("CI environment detected, using mock token instead of starting OAuth server")
-        async with token_lock:
-            # 设置mock token用于测试
-            global USER_ACCESS_TOKEN, TOKEN_EXPIRES_AT
-            USER_ACCESS_TOKEN = "mock_oauth_token_for_ci"
-            TOKEN_EXPIRES_AT = time.time() + 3600  # 设置1小时过期时间
-            return USER_ACCESS_TOKEN
+        # 设置mock token用于测试，1小时过期
+        token_manager.update(access_token="mock_oauth_token_for_ci", expires_at=time.time() + 3600)
+        return token_manager.snapshot.access_token
+    
+    # Create the waiter before the server starts so no callback can be missed
+    waiter = asyncio.get_running_loop().create_future()
+    _oauth_waiter = waiter
     
     app = web.Application()
     app.router.add_get('/oauth/callback', _handle_oauth_callback)
     
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, 'localhost', 9997)
-    await site.start()
     
     try:
+        site = web.TCPSite(runner, 'localhost', OAUTH_PORT)
+        await site.start()
+        
         # Generate state for CSRF protection
         state = secrets.token_urlsafe(16)
         
@@ -359,7 +873,7 @@ async def _start_oauth_server() -> str:
             "redirect_uri": REDIRECT_URI,
             "response_type": "code",
             "state": state,
-            "scope": "wiki:wiki:readonly drive:drive space:document:retrieve drive:drive.search:readonly docx:document docx:document:readonly"  # 移除 %20，使用普通空格
+            "scope": "wiki:wiki:readonly drive:drive space:document:retrieve drive:drive.search:readonly docx:document docx:document:readonly offline_access"  # 移除 %20，使用普通空格
         }
         
         query = "&".join([f"{k}={quote(str(v))}" for k, v in params.items()])
@@ -368,39 +882,51 @@ async def _start_oauth_server() -> str:
         # Open browser for authorization
         webbrowser.open(auth_url)
         
-        # Wait for callback to set the token with timeout
-        start_time = asyncio.get_event_loop().time()
-        while True:
-            if asyncio.get_event_loop().time() - start_time > 300:  # 5分钟超时
-                raise TimeoutError("Authorization timeout after 5 minutes")
-                
-            await asyncio.sleep(1)
-            async with token_lock:
-                if USER_ACCESS_TOKEN:
-                    return USER_ACCESS_TOKEN
+        # Wait for the callback handler to complete the waiter
+        try:
+            return await asyncio.wait_for(waiter, timeout=OAUTH_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Authorization timeout after {OAUTH_TIMEOUT // 60} minutes")
     finally:
+        if _oauth_waiter is waiter:
+            _oauth_waiter = None
         # 确保服务器总是被清理
         await runner.cleanup()
-        
-    return None
+
+async def _acquire_token() -> str:
+    """Obtain a new user access token, silently if a stored or refresh token is available"""
+    if await _load_stored_tokens() and token_manager.valid_token():
+        return token_manager.valid_token()
+    token = await _refresh_user_token()
+    if token:
+        return token
+    if token_manager.valid_token():
+        # Renewed elsewhere while this refresh was failing
+        return token_manager.valid_token()
+    token = await _start_oauth_server()
+    if not token:
+        raise Exception("Failed to get user access token")
+    return token
 
 # Update _auth_flow to use the server
 async def _auth_flow() -> str:
-    """Internal method to handle Feishu authentication flow"""
-    # Using global USER_ACCESS_TOKEN from module scope
-    
-    async with token_lock:
-        if USER_ACCESS_TOKEN and not await _check_token_expired():
-            return USER_ACCESS_TOKEN
+    """Internal method to handle Feishu authentication flow
+
+    Concurrent callers that find the token missing or expired share a single
+    in-flight acquisition instead of each starting their own OAuth server.
+    """
+    current_token = token_manager.valid_token()
+    if current_token:
+        return current_token
 
     if not larkClient or not larkClient.auth:
         raise Exception("Lark client not properly initialized")
         
-    # Start OAuth flow
-    token = await _start_oauth_server()
+    # Start OAuth flow, or join the one already in progress
+    token = await token_manager.acquire(_acquire_token)
     if not token:
-        raise Exception("Failed to get user access token")
-        
+        # Joined a background refresh that failed; run a full acquisition
+        token = await token_manager.acquire(_acquire_token)
     return token
 
 async def get_folder_token() -> str:
@@ -413,12 +939,93 @@ async def get_folder_token() -> str:
     # 如果环境变量中没有设置 FOLDER_TOKEN，可以在这里添加获取逻辑
     # 比如从 API 获取根目录或特定目录的 token
     return FOLDER_TOKEN
+def _encode_cursor(state: dict) -> str:
+    """Encode pagination state as an opaque cursor string"""
+    return base64.urlsafe_b64encode(json.dumps(state).encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str) -> dict:
+    """Decode a cursor produced by _encode_cursor
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(state, dict):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return state
+
+async def _iter_folder_files(folder_token: str, user_access_token: str, page_size: int = 50, start: dict = None):
+    """Iterate over all files in a folder, requesting one page at a time
+
+    Args:
+        folder_token: Folder token
+        user_access_token: User access token
+        page_size: Number of files requested per page
+        start: Pagination state to resume from, as returned alongside an earlier item
+
+    Yields:
+        tuple: (file, resume) where resume is the pagination state that continues
+            after this file, or None if it is the last one
+
+    Raises:
+        LarkAPIError: If a page request fails
+    """
+    page_token = (start or {}).get("page_token")
+    offset = (start or {}).get("offset", 0)
+    while True:
+        queries = {"folder_token": folder_token, "page_size": page_size}
+        if page_token:
+            queries["page_token"] = page_token
+        response = await lark_request(
+            "GET",
+            "/open-apis/drive/v1/files",
+            user_access_token=user_access_token,
+            queries=queries,
+        )
+        if not response.success():
+            raise LarkAPIError(f"Failed to list files: code {response.code}, message: {response.msg}", response)
+
+        files = response.data.get("files") or []
+        next_page_token = response.data.get("next_page_token") if response.data.get("has_more") else None
+        for index in range(offset, len(files)):
+            if index + 1 < len(files):
+                resume = {"page_token": page_token, "offset": index + 1}
+            elif next_page_token:
+                resume = {"page_token": next_page_token, "offset": 0}
+            else:
+                resume = None
+            yield files[index], resume
+
+        if not next_page_token:
+            return
+        page_token, offset = next_page_token, 0
+
+def _format_file(item: dict) -> dict:
+    """Pick the fields returned to the caller from a drive file entry"""
+    return {
+        "name": item.get("name"),
+        "type": item.get("type"),  # "doc"/"sheet"/"file" etc
+        "token": item.get("token"),
+        "url": item.get("url"),
+        "created_time": item.get("created_time"),
+        "modified_time": item.get("modified_time"),
+        "owner_id": item.get("owner_id"),
+        "parent_token": item.get("parent_token")
+    }
+
 @mcp.tool()
-async def list_folder_content(page_size: int = 10) -> CallToolResult:
+async def list_folder_content(page_size: int = 50, limit: int = None, cursor: str = None) -> CallToolResult:
     """List contents of a Lark folder
     
+    Follows pagination until every file is listed or limit is reached.
+    
     Args:
-        page_size: Number of results to return (default: 10)
+        page_size: Number of files requested per page (default: 50, max: 200)
+        limit: Maximum number of files to return (default: no limit)
+        cursor: Continuation cursor returned by a previous call (optional)
     """
     try:
         if not larkClient or not larkClient.auth:
@@ -427,12 +1034,17 @@ async def list_folder_content(page_size: int = 10) -> CallToolResult:
                 content=[TextContent(type="text", text="Lark client not properly initialized")]
             )
 
-        # Check if user token exists
-        async with token_lock:
-            current_token = USER_ACCESS_TOKEN
+        try:
+            start = _decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return CallToolResult(
+                isError=True,
+                content=[TextContent(type="text", text=str(e))]
+            )
 
         # Check token existence and expiration
-        if not current_token or await _check_token_expired():
+        current_token = token_manager.valid_token()
+        if not current_token:
             try:
                 current_token = await _auth_flow()
             except Exception as e:
@@ -449,60 +1061,299 @@ async def list_folder_content(page_size: int = 10) -> CallToolResult:
                 content=[TextContent(type="text", text="Folder token not configured")]
             )
 
-        # Construct file list request using SDK
-        request: lark.BaseRequest = lark.BaseRequest.builder() \
-            .http_method(lark.HttpMethod.GET) \
-            .uri("/open-apis/drive/v1/files") \
-            .token_types({lark.AccessTokenType.USER}) \
-            .queries([("folder_token", folder_token), ("page_size", page_size)]) \
-            .build()
+        # Walk the pages until done or the limit is reached
+        items = []
+        next_cursor = None
+        try:
+            async for item, resume in _iter_folder_files(folder_token, current_token, page_size, start):
+                items.append(_format_file(item))
+                if limit and len(items) >= limit:
+                    next_cursor = _encode_cursor(resume) if resume else None
+                    break
+        except LarkAPIError as e:
+            return CallToolResult(
+                isError=True,
+                content=[TextContent(type="text", text=str(e))]
+            )
 
-        option = lark.RequestOption.builder().user_access_token(current_token).build()
-        
-        # Send list request
-        response: lark.BaseResponse = larkClient.request(request, option)
+        if not items:
+            return CallToolResult(
+                content=[TextContent(type="text", text="No files found in folder")]
+            )
 
-        if not response.success():
+        content = [TextContent(type="text", text=json.dumps(items, ensure_ascii=False, indent=2))]
+        if next_cursor:
+            content.append(TextContent(type="text", text=json.dumps({"next_cursor": next_cursor})))
+        return CallToolResult(content=content)
+    except Exception as e:
+        return CallToolResult(
+            isError=True,
+            content=[TextContent(type="text", text=f"Error listing folder content: {str(e)}")]
+        )
+
+@mcp.tool()
+async def list_folder_tree(folder_token: str = None, max_depth: int = 5, types: list = None,
+                           nested: bool = False, max_concurrency: int = None) -> CallToolResult:
+    """List a Lark folder and its sub-folders recursively
+    
+    Sub-folders are listed concurrently, with at most max_concurrency folder
+    listings in flight at once.
+    
+    Args:
+        folder_token: Folder to start from (default: FOLDER_TOKEN)
+        max_depth: Number of folder levels to descend, 1 lists only the folder itself (default: 5)
+        types: Only return files of these types, e.g. ["docx", "sheet"] (default: all types)
+        nested: Return a nested tree instead of a flat list (default: False)
+        max_concurrency: Maximum number of folders listed at once (default: BATCH_CONCURRENCY)
+    """
+    try:
+        if not larkClient or not larkClient.auth:
             return CallToolResult(
                 isError=True,
-                content=[TextContent(type="text", text=f"Failed to list files: code {response.code}, message: {response.msg}")]
+                content=[TextContent(type="text", text="Lark client not properly initialized")]
             )
 
-        # Parse response content
-        try:
-            result = json.loads(response.raw.content.decode('utf-8'))
-            if not result.get("data") or not result["data"].get("files"):
+        # Check token existence and expiration
+        current_token = token_manager.valid_token()
+        if not current_token:
+            try:
+                current_token = await _auth_flow()
+            except Exception as e:
                 return CallToolResult(
-                    content=[TextContent(type="text", text="No files found in folder")]
+                    isError=True,
+                    content=[TextContent(type="text", text=f"Failed to get user access token: {str(e)}")]
                 )
-            
-            # Format file contents
-            items = []
-            for item in result["data"]["files"]:
-                items.append({
-                    "name": item.get("name"),
-                    "type": item.get("type"),  # "doc"/"sheet"/"file" etc
-                    "token": item.get("token"),
-                    "url": item.get("url"),
-                    "created_time": item.get("created_time"),
-                    "modified_time": item.get("modified_time"),
-                    "owner_id": item.get("owner_id"),
-                    "parent_token": item.get("parent_token")
-                })
-            
-            return CallToolResult(
-                content=[TextContent(type="text", text=json.dumps(items, ensure_ascii=False, indent=2))]
-            )
-        except Exception as e:
+
+        root_token = folder_token or await get_folder_token()
+        if not root_token:
             return CallToolResult(
                 isError=True,
-                content=[TextContent(type="text", text=f"Failed to parse file contents: {str(e)}")]
+                content=[TextContent(type="text", text="Folder token not configured")]
             )
+
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or BATCH_CONCURRENCY))
+        wanted = set(types) if types else None
+        visited = {root_token}
+        flat = []
+        errors = []
+
+        async def crawl(token: str, depth: int, path: str) -> list:
+            # Hold the semaphore only while listing, so waiting on children cannot starve the pool
+            try:
+                async with semaphore:
+                    entries = [item async for item, _ in _iter_folder_files(token, current_token, 200)]
+            except Exception as e:
+                errors.append({"token": token, "path": path, "error": str(e)})
+                return []
+
+            nodes = []
+            subfolders = []
+            for entry in entries:
+                item = _format_file(entry)
+                item["path"] = f"{path}/{item['name']}"
+                item["depth"] = depth
+                is_folder = item["type"] == "folder"
+                if is_folder and depth < max_depth and item["token"] not in visited:
+                    visited.add(item["token"])
+                    subfolders.append(item)
+                if not is_folder and wanted is not None and item["type"] not in wanted:
+                    continue
+                if not is_folder or wanted is None or "folder" in wanted:
+                    flat.append(item)
+                nodes.append(item)
+
+            children = await asyncio.gather(*[
+                crawl(folder["token"], depth + 1, folder["path"]) for folder in subfolders
+            ])
+            for folder, folder_children in zip(subfolders, children):
+                folder["children"] = folder_children
+            return nodes
+
+        tree = await crawl(root_token, 1, "")
+        if nested:
+            items = tree
+        else:
+            # Folders finish in any order; sort so the flat index is stable
+            items = [
+                {key: value for key, value in item.items() if key != "children"}
+                for item in sorted(flat, key=lambda item: item["path"])
+            ]
+
+        return CallToolResult(
+            isError=bool(errors) and not items,
+            content=[TextContent(type="text", text=json.dumps({"items": items, "errors": errors}, ensure_ascii=False, indent=2))]
+        )
     except Exception as e:
         return CallToolResult(
             isError=True,
-            content=[TextContent(type="text", text=f"Error listing folder content: {str(e)}")]
+            content=[TextContent(type="text", text=f"Error listing folder tree: {str(e)}")]
+        )
+
+async def _create_blocks(doc_id: str, blocks_data: dict, user_access_token: str,
+                         parent_id: str = None, index: int = 0) -> tuple:
+    """Insert converted markdown blocks into a document, in batches if needed.
+
+    Batches are sent in order. Blocks continuing a subtree split across batches
+    are inserted under the real block ID Lark assigned to their parent.
+
+    Args:
+        doc_id: Document ID
+        blocks_data: Result of convert_markdown_to_blocks
+        user_access_token: User access token
+        parent_id: Block to insert under (default: the document root)
+        index: Position among the parent's children to insert at (default: 0)
+
+    Returns:
+        tuple: (number of blocks created, error message or None)
+    """
+    batches = split_into_batches(blocks_data, DESCENDANT_BATCH_SIZE)
+    block_ids = {}  # Temporary block ID -> block ID assigned by Lark
+    created = 0
+    for number, batch in enumerate(batches, 1):
+        if batch["parent_id"] is None:
+            batch_parent, batch_index = parent_id or doc_id, index + batch["index"]
+        else:
+            batch_parent, batch_index = block_ids.get(batch["parent_id"]), batch["index"]
+        if not batch_parent:
+            return created, f"Failed to create blocks: parent block {batch['parent_id']} of batch {number}/{len(batches)} was not created"
+
+        logger.debug(f"Creating block batch {number}/{len(batches)} ({len(batch['descendants'])} blocks) under {batch_parent}")
+        # The client_token makes Lark deduplicate the insert, so it is safe to retry
+        response = await lark_request(
+            "POST",
+            f"/open-apis/docx/v1/documents/{doc_id}/blocks/{batch_parent}/descendant",
+            user_access_token=user_access_token,
+            queries={"document_revision_id": "-1", "client_token": str(uuid.uuid4())},
+            idempotent=True,
+            content=encode_descendant_body(batch_index, batch["children_id"], batch["descendants"]),
         )
+        if not response.success():
+            return created, (f"Failed to create blocks: code {response.code}, message: {response.msg}, "
+                             f"batch {number}/{len(batches)}, create_blocks_response: {response}")
+
+        created += len(batch["descendants"])
+        for relation in (response.data or {}).get("block_id_relations", []):
+            block_ids[relation.get("temporary_block_id")] = relation.get("block_id")
+    return created, None
+
+
+async def _create_document(title: str, content: str, target_space_id: str, user_access_token: str,
+                           folder_token: str) -> tuple:
+    """Create a document, fill it with converted markdown and optionally move it to a wiki space
+
+    Args:
+        title: Document title
+        content: Markdown content (may be empty)
+        target_space_id: Target wiki space ID (optional)
+        user_access_token: User access token
+        folder_token: Folder the document is created in
+
+    Returns:
+        tuple: (dict with document_id, title and url, error message or None)
+    """
+    # Convert markdown off the event loop while the document is being created
+    convert_task = asyncio.ensure_future(asyncio.to_thread(convert_markdown_to_blocks, content)) if content else None
+    try:
+        # Step 1: Create document
+        logger.info(f"Creating document with title: {title}")
+        create_response = await lark_request(
+            "POST",
+            "/open-apis/docx/v1/documents",
+            user_access_token=user_access_token,
+            body={
+                "folder_token": folder_token,
+                "title": title
+            },
+        )
+
+        if not create_response.success():
+            logger.error(f"Failed to create document: code {create_response.code}, message: {create_response.msg}")
+            return None, f"Failed to create document: code {create_response.code}, message: {create_response.msg}"
+
+        create_result = create_response.body
+        if not create_result.get("data") or not create_result["data"].get("document"):
+            logger.error(f"Document creation response is invalid, {create_result}")
+            return None, f"Document creation response is invalid, {create_result}"
+
+        doc_id = create_result["data"]["document"]["document_id"]
+        logger.info(f"Successfully created document with ID: {doc_id}")
+
+        async def move_to_wiki() -> str:
+            """Step 2: Move document to wiki space, returns an error message or None"""
+            try:
+                logger.info(f"Moving document {doc_id} to wiki space {target_space_id}")
+                move_response = await lark_request(
+                    "POST",
+                    "/open-apis/wiki/v2/space-node/move",
+                    user_access_token=user_access_token,
+                    body={
+                        "space_id": target_space_id,
+                        "node_token": doc_id
+                    },
+                )
+
+                if not move_response.success():
+                    logger.error(f"Failed to move document: code {move_response.code}, message: {move_response.msg}")
+                    return f"Failed to move document: code {move_response.code}, message: {move_response.msg}"
+
+                logger.info(f"Successfully moved document {doc_id} to wiki space {target_space_id}")
+                return None
+
+            except Exception as e:
+                logger.error(f"Failed to move document to wiki space: {str(e)}", exc_info=True)
+                return f"Failed to move document to wiki space: {str(e)}"
+
+        async def insert_blocks() -> str:
+            """Step 3: Create document blocks, returns an error message or None"""
+            try:
+                logger.info(f"Creating document blocks for document {doc_id}")
+                blocks_data = await convert_task
+
+                # Extract the descendants list that contains all the blocks to create
+                if not isinstance(blocks_data, dict) or 'descendants' not in blocks_data:
+                    logger.error(f"Invalid blocks structure: {blocks_data}")
+                    return "Invalid blocks structure returned from markdown converter"
+
+                # Use the document-block-descendant/create API, split into batches for long documents
+                created, error = await _create_blocks(doc_id, blocks_data, user_access_token)
+                if error:
+                    logger.error(f"{error} ({created} blocks created before the failure)")
+                    return f"{error} ({created} blocks created before the failure)"
+
+                logger.info(f"Successfully created {created} document blocks for document {doc_id}")
+                return None
+
+            except Exception as e:
+                logger.error(f"Failed to create document blocks: {str(e)}", exc_info=True)
+                return f"Failed to create document blocks: {str(e)}"
+
+        # Steps 2 and 3 only depend on the document ID, so they run concurrently
+        steps = []
+        if target_space_id:
+            steps.append(move_to_wiki())
+        if convert_task:
+            steps.append(insert_blocks())
+        errors = [error for error in await asyncio.gather(*steps) if error]
+        if errors:
+            return None, "; ".join(errors)
+
+        # Format response
+        result = {
+            "document_id": doc_id,
+            "title": title,
+            "url": f"https://docs.feishu.cn/docx/{doc_id}"
+        }
+
+        logger.info(f"Successfully completed document creation process for {title}")
+        return result, None
+    except Exception as e:
+        logger.error(f"Failed to create document: {str(e)}", exc_info=True)
+        return None, f"Failed to create document: {str(e)}"
+    finally:
+        # The conversion result is not needed if the document could not be created
+        if convert_task and not convert_task.cancel() and not convert_task.cancelled():
+            convert_task.exception()  # Mark a conversion failure as retrieved
+
 
 @mcp.tool()
 async def create_doc(title: str, content: str = "", target_space_id: str = None) -> CallToolResult:
@@ -521,9 +1372,8 @@ async def create_doc(title: str, content: str = "", target_space_id: str = None)
                 content=[TextContent(type="text", text="Lark client not properly initialized")]
             )
                     
-        async with token_lock:
-            current_token = USER_ACCESS_TOKEN
-        if not current_token or await _check_token_expired():
+        current_token = token_manager.valid_token()
+        if not current_token:
             try:
                 logger.info("Token expired or not found, starting auth flow")
                 current_token = await _auth_flow()
@@ -544,146 +1394,291 @@ async def create_doc(title: str, content: str = "", target_space_id: str = None)
                 content=[TextContent(type="text", text="Folder token not configured")]
             )
 
-        try:
-            # Step 1: Create document
-            logger.info(f"Creating document with title: {title}")
-            create_request: lark.BaseRequest = lark.BaseRequest.builder() \
-                .http_method(lark.HttpMethod.POST) \
-                .uri("/open-apis/docx/v1/documents") \
-                .token_types({lark.AccessTokenType.USER}) \
-                .body({
-                    "folder_token": folder_token,
-                    "title": title
-                }) \
-                .build()
-
-            option = lark.RequestOption.builder().user_access_token(current_token).build()
-
-            # Send create document request
-            create_response: lark.BaseResponse = larkClient.request(create_request, option)
-
-            if not create_response.success():
-                logger.error(f"Failed to create document: code {create_response.code}, message: {create_response.msg}")
-                return CallToolResult(
-                    isError=True,
-                    content=[TextContent(type="text", text=f"Failed to create document: code {create_response.code}, message: {create_response.msg}")]
-                )
+        result, error = await _create_document(title, content, target_space_id, current_token, folder_token)
+        if error:
+            return CallToolResult(
+                isError=True,
+                content=[TextContent(type="text", text=error)]
+            )
+        return CallToolResult(
+            content=[TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
+        )
+    except Exception as e:
+        logger.error(f"Unexpected error in create_doc: {str(e)}", exc_info=True)
+        return CallToolResult(
+            isError=True,
+            content=[TextContent(type="text", text=f"Unexpected error in create_doc: {str(e)}")]
+        )
+
+def _read_markdown_dir(directory: str) -> list:
+    """Collect markdown files under a directory as bulk creation entries
+
+    Args:
+        directory: Local directory, searched recursively for .md / .markdown files
+
+    Returns:
+        list: Entries with title (file name without extension), content and source path, sorted by path
+    """
+    entries = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() not in (".md", ".markdown"):
+                continue
+            path = os.path.join(root, name)
+            with open(path, "r", encoding="utf-8") as f:
+                entries.append({"title": stem, "content": f.read(), "source": path})
+    return entries
+
+
+def _normalize_doc_entry(entry: Any, target_space_id: str = None) -> dict:
+    """Turn a bulk creation entry into a dict with title, content and target_space_id
+
+    Args:
+        entry: Dict with title / content / target_space_id, or a [title, content, target_space_id] list
+        target_space_id: Wiki space used when the entry does not name one
+
+    Raises:
+        ValueError: If the entry has no title or an unsupported shape
+    """
+    if isinstance(entry, dict):
+        normalized = dict(entry)
+    elif isinstance(entry, (list, tuple)) and 1 <= len(entry) <= 3:
+        normalized = dict(zip(("title", "content", "target_space_id"), entry))
+    else:
+        raise ValueError(f"Unsupported document entry: {entry!r}")
+    if not normalized.get("title"):
+        raise ValueError(f"Document entry without title: {entry!r}")
+    normalized["content"] = normalized.get("content") or ""
+    normalized["target_space_id"] = normalized.get("target_space_id") or target_space_id
+    return normalized
+
+
+@mcp.tool()
+async def create_docs(docs: list = None, directory: str = None, target_space_id: str = None,
+                      max_concurrency: int = None) -> CallToolResult:
+    """Create many Lark documents from markdown in one call
+
+    Args:
+        docs: List of documents, each {"title", "content", "target_space_id"} or [title, content, target_space_id] (optional)
+        directory: Local directory whose .md / .markdown files are created, titled by file name (optional)
+        target_space_id: Wiki space for entries that do not name one (optional)
+        max_concurrency: Maximum number of documents created at once (default: BATCH_CONCURRENCY)
+    """
+    try:
+        if not larkClient or not larkClient.auth or not larkClient.docx:
+            return CallToolResult(
+                isError=True,
+                content=[TextContent(type="text", text="Lark client not properly initialized")]
+            )
 
-            if not create_response.raw or not create_response.raw.content:
-                logger.error(f"Document creation response is empty, {create_response}")
+        entries = list(docs or [])
+        if directory:
+            if not os.path.isdir(directory):
                 return CallToolResult(
                     isError=True,
-                    content=[TextContent(type="text", text=f"Document creation response is empty, {create_response}")]
+                    content=[TextContent(type="text", text=f"Directory not found: {directory}")]
                 )
+            entries.extend(await asyncio.to_thread(_read_markdown_dir, directory))
+        if not entries:
+            return CallToolResult(
+                isError=True,
+                content=[TextContent(type="text", text="No documents provided")]
+            )
 
-            create_result = json.loads(create_response.raw.content.decode('utf-8'))
-            if not create_result.get("data") or not create_result["data"].get("document"):
-                logger.error(f"Document creation response is invalid, {create_result}")
+        current_token = token_manager.valid_token()
+        if not current_token:
+            try:
+                current_token = await _auth_flow()
+            except Exception as e:
                 return CallToolResult(
                     isError=True,
-                    content=[TextContent(type="text", text=f"Document creation response is invalid, {create_result}")]
+                    content=[TextContent(type="text", text=f"Failed to get user access token: {str(e)}")]
                 )
 
-            doc_id = create_result["data"]["document"]["document_id"]
-            logger.info(f"Successfully created document with ID: {doc_id}")
+        folder_token = await get_folder_token()
+        if not folder_token:
+            return CallToolResult(
+                isError=True,
+                content=[TextContent(type="text", text="Folder token not configured")]
+            )
 
-            # Step 2: Move document to wiki space if target_space_id is provided
-            if target_space_id:
-                try:
-                    logger.info(f"Moving document {doc_id} to wiki space {target_space_id}")
-                    move_request: lark.BaseRequest = lark.BaseRequest.builder() \
-                        .http_method(lark.HttpMethod.POST) \
-                        .uri("/open-apis/wiki/v2/space-node/move") \
-                        .token_types({lark.AccessTokenType.USER}) \
-                        .body({
-                            "space_id": target_space_id,
-                            "node_token": doc_id
-                        }) \
-                        .build()
-
-                    move_response: lark.BaseResponse = larkClient.request(move_request, option)
-
-                    if not move_response.success():
-                        logger.error(f"Failed to move document: code {move_response.code}, message: {move_response.msg}")
-                        return CallToolResult(
-                            isError=True,
-                            content=[TextContent(type="text", text=f"Failed to move document: code {move_response.code}, message: {move_response.msg}")]
-                        )
-
-                    logger.info(f"Successfully moved document {doc_id} to wiki space {target_space_id}")
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or BATCH_CONCURRENCY))
+        started = time.monotonic()
 
-                except Exception as e:
-                    logger.error(f"Failed to move document to wiki space: {str(e)}", exc_info=True)
-                    return CallToolResult(
-                        isError=True,
-                        content=[TextContent(type="text", text=f"Failed to move document to wiki space: {str(e)}")]
+        async def create(position: int, entry: Any) -> dict:
+            queued = time.monotonic()
+            try:
+                entry = _normalize_doc_entry(entry, target_space_id)
+            except ValueError as e:
+                return {"index": position, "status": "failed", "error": str(e)}
+            item = {"index": position, "title": entry["title"]}
+            if entry.get("source"):
+                item["source"] = entry["source"]
+            async with semaphore:
+                begin = time.monotonic()
+                try:
+                    result, error = await _create_document(
+                        entry["title"], entry["content"], entry["target_space_id"], current_token, folder_token,
                     )
+                except Exception as e:
+                    result, error = None, f"Failed to create document: {str(e)}"
+            if error:
+                item.update(status="failed", error=error)
+            else:
+                item.update(status="created", document_id=result["document_id"], url=result["url"])
+            item["wait_seconds"] = round(begin - queued, 3)
+            item["elapsed_seconds"] = round(time.monotonic() - begin, 3)
+            return item
 
-            # Step 3: Create document blocks
-            if content:
-                try:
-                    logger.info(f"Creating document blocks for document {doc_id}")
-                    blocks_data = convert_markdown_to_blocks(content)
-                    
-                    # Extract the descendants list that contains all the blocks to create
-                    if not isinstance(blocks_data, dict) or 'descendants' not in blocks_data:
-                        logger.error(f"Invalid blocks structure: {blocks_data}")
-                        return CallToolResult(
-                            isError=True,
-                            content=[TextContent(type="text", text=f"Invalid blocks structure returned from markdown converter")]
-                        )
-                    
-                    # Use the document-block-descendant/create API to create blocks in one request
-                    create_blocks_request: lark.BaseRequest = lark.BaseRequest.builder() \
-                        .http_method(lark.HttpMethod.POST) \
-                        .uri(f"/open-apis/docx/v1/documents/{doc_id}/blocks/{doc_id}/descendant") \
-                        .queries([("document_revision_id", "-1")]) \
-                        .token_types({lark.AccessTokenType.USER}) \
-                        .body({
-                            "index": 0,  # Insert at the beginning of the block
-                            "children_id": blocks_data.get('children_id', []),
-                            "descendants": blocks_data['descendants']
-                        }) \
-                        .build()
-
-                    create_blocks_response: lark.BaseResponse = larkClient.request(create_blocks_request, option)
-
-                    if not create_blocks_response.success():
-                        logger.error(f"Failed to create blocks: code {create_blocks_response.code}, message: {create_blocks_response.msg}, create_blocks_response: {create_blocks_response}")
-                        return CallToolResult(
-                            isError=True,
-                            content=[TextContent(type="text", text=f"Failed to create blocks: code {create_blocks_response.code}, message: {create_blocks_response.msg}, create_blocks_response: {create_blocks_response}")]
-                        )
-
-                    logger.info(f"Successfully created document blocks for document {doc_id}")
+        items = await asyncio.gather(*[create(position, entry) for position, entry in enumerate(entries)])
+        created = sum(1 for item in items if item["status"] == "created")
+        summary = {
+            "created": created,
+            "failed": len(items) - created,
+            "elapsed_seconds": round(time.monotonic() - started, 3),
+            "items": items,
+        }
+        logger.info(f"Bulk creation finished: {created}/{len(items)} documents created")
 
-                except Exception as e:
-                    logger.error(f"Failed to create document blocks: {str(e)}", exc_info=True)
-                    return CallToolResult(
-                        isError=True,
-                        content=[TextContent(type="text", text=f"Failed to create document blocks: {str(e)}")]
-                    )
+        return CallToolResult(
+            isError=created == 0,
+            content=[TextContent(type="text", text=json.dumps(summary, ensure_ascii=False, indent=2))]
+        )
+    except Exception as e:
+        logger.error(f"Unexpected error in create_docs: {str(e)}", exc_info=True)
+        return CallToolResult(
+            isError=True,
+            content=[TextContent(type="text", text=f"Unexpected error in create_docs: {str(e)}")]
+        )
 
-            # Format response
-            result = {
-                "document_id": doc_id,
-                "title": title,
-                "url": f"https://docs.feishu.cn/docx/{doc_id}"
-            }
-            
-            logger.info(f"Successfully completed document creation process for {title}")
+
+def _subtree_blocks(blocks_data: dict, children_id: list) -> dict:
+    """Cut the subtrees rooted at children_id out of converter output, keeping its block order"""
+    by_id = {block["block_id"]: block for block in blocks_data["descendants"]}
+    wanted = set()
+    stack = list(children_id)
+    while stack:
+        block_id = stack.pop()
+        if block_id in by_id and block_id not in wanted:
+            wanted.add(block_id)
+            stack.extend(by_id[block_id].get("children", []))
+    return {
+        "children_id": list(children_id),
+        "descendants": [block for block in blocks_data["descendants"] if block["block_id"] in wanted],
+    }
+
+
+async def _patch_blocks(doc_id: str, patches: list, user_access_token: str) -> str:
+    """Replace the text of existing blocks, BLOCK_PATCH_BATCH_SIZE blocks per request
+
+    Returns:
+        str: Error message, or None on success
+    """
+    for start in range(0, len(patches), BLOCK_PATCH_BATCH_SIZE):
+        updates = [
+            {"block_id": patch["block_id"], "update_text_elements": {"elements": patch["elements"]}}
+            for patch in patches[start:start + BLOCK_PATCH_BATCH_SIZE]
+        ]
+        response = await lark_request(
+            "PATCH",
+            f"/open-apis/docx/v1/documents/{doc_id}/blocks/batch_update",
+            user_access_token=user_access_token,
+            queries={"document_revision_id": "-1", "client_token": str(uuid.uuid4())},
+            body={"requests": updates},
+        )
+        if not response.success():
+            return f"Failed to update blocks: code {response.code}, message: {response.msg}"
+    return None
+
+
+@mcp.tool()
+async def update_doc(documentUrl: str, content: str) -> CallToolResult:
+    """Replace the content of an existing Lark document with markdown, changing only the blocks that differ
+
+    Args:
+        documentUrl: Lark document URL (docx or wiki)
+        content: New document content in Markdown format
+    """
+    try:
+        if not larkClient or not larkClient.auth or not larkClient.docx:
             return CallToolResult(
-                content=[TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
+                isError=True,
+                content=[TextContent(type="text", text="Lark client not properly initialized")]
             )
-        except Exception as e:
-            logger.error(f"Failed to create document: {str(e)}", exc_info=True)
+
+        current_token = token_manager.valid_token()
+        if not current_token:
+            try:
+                current_token = await _auth_flow()
+            except Exception as e:
+                return CallToolResult(
+                    isError=True,
+                    content=[TextContent(type="text", text=f"Failed to get user access token: {str(e)}")]
+                )
+
+        doc_id, error = await _resolve_document_id(documentUrl, current_token)
+        if error:
+            return CallToolResult(isError=True, content=[TextContent(type="text", text=error)])
+
+        # Read the current block tree while the new content is converted
+        convert_task = asyncio.ensure_future(asyncio.to_thread(convert_markdown_to_blocks, content or ""))
+        try:
+            old_blocks = {block["block_id"]: block async for block in _iter_document_blocks(doc_id, current_token)}
+        except LarkAPIError as e:
+            convert_task.cancel()
+            return CallToolResult(isError=True, content=[TextContent(type="text", text=str(e))])
+        blocks_data = await convert_task
+
+        page = old_blocks.get(doc_id) or {}
+        new_blocks = {block["block_id"]: block for block in blocks_data["descendants"]}
+        operations, patches = await asyncio.to_thread(
+            diff_blocks, old_blocks, page.get("children", []), new_blocks, blocks_data["children_id"], doc_id,
+        )
+        logger.info(f"Updating document {doc_id}: {len(operations)} structural operations, {len(patches)} text patches")
+
+        summary = {"document_id": doc_id, "inserted": 0, "deleted": 0, "patched": 0}
+        for operation in operations:
+            if operation["op"] == "delete":
+                response = await lark_request(
+                    "DELETE",
+                    f"/open-apis/docx/v1/documents/{doc_id}/blocks/{operation['parent_id']}/children/batch_delete",
+                    user_access_token=current_token,
+                    queries={"document_revision_id": "-1", "client_token": str(uuid.uuid4())},
+                    body={"start_index": operation["start_index"], "end_index": operation["end_index"]},
+                )
+                if not response.success():
+                    error = f"Failed to delete blocks: code {response.code}, message: {response.msg}"
+                    break
+                summary["deleted"] += operation["end_index"] - operation["start_index"]
+            else:
+                created, error = await _create_blocks(
+                    doc_id, _subtree_blocks(blocks_data, operation["children_id"]), current_token,
+                    parent_id=operation["parent_id"], index=operation["index"],
+                )
+                summary["inserted"] += created
+                if error:
+                    break
+        else:
+            error = await _patch_blocks(doc_id, patches, current_token)
+            if not error:
+                summary["patched"] = len(patches)
+
+        if error:
+            logger.error(f"Failed to update document {doc_id}: {error}, applied so far: {summary}")
             return CallToolResult(
                 isError=True,
-                content=[TextContent(type="text", text=f"Failed to create document: {str(e)}")]
+                content=[TextContent(type="text", text=f"{error} (applied before the failure: {json.dumps(summary)})")]
             )
+
+        summary["url"] = f"https://docs.feishu.cn/docx/{doc_id}"
+        return CallToolResult(
+            content=[TextContent(type="text", text=json.dumps(summary, ensure_ascii=False, indent=2))]
+        )
     except Exception as e:
-        logger.error(f"Unexpected error in create_doc: {str(e)}", exc_info=True)
+        logger.error(f"Unexpected error in update_doc: {str(e)}", exc_info=True)
         return CallToolResult(
             isError=True,
-            content=[TextContent(type="text", text=f"Unexpected error in create_doc: {str(e)}")]
-        )
\ No newline at end of file
+            content=[TextContent(type="text", text=f"Unexpected error in update_doc: {str(e)}")]
+        )
@@ -0,0 +1,101 @@
+import time
+import asyncio
+import threading
+import logging
+from dataclasses import dataclass, replace
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+TOKEN_EXPIRY_MARGIN = 60  # Consider tokens expired this many seconds early to avoid edge cases
+
+
+@dataclass(frozen=True)
+class TokenSnapshot:
+    """Immutable view of the user's OAuth tokens at one point in time."""
+
+    access_token: Optional[str] = None
+    expires_at: Optional[float] = None
+    refresh_token: Optional[str] = None
+    refresh_token_expires_at: Optional[float] = None
+
+    def is_expired(self, margin: float = TOKEN_EXPIRY_MARGIN) -> bool:
+        """Check whether the access token is missing or (about to be) expired.
+
+        Args:
+            margin: Seconds before the real expiry at which the token counts as expired
+
+        Returns:
+            bool: True if a new access token is needed
+        """
+        if not self.access_token or not self.expires_at:
+            return True
+        return time.time() + margin >= self.expires_at
+
+    def has_usable_refresh_token(self) -> bool:
+        """Check whether the refresh token exists and has not expired."""
+        if not self.refresh_token:
+            return False
+        return not self.refresh_token_expires_at or time.time() < self.refresh_token_expires_at
+
+
+class TokenManager:
+    """Owner of the user token state.
+
+    Reads return the current immutable snapshot and never lock, so the per-call
+    token check is a single attribute access. Writes go through ``update`` /
+    ``set``, which are serialized by one lock and never await while holding it,
+    so they cannot deadlock. Concurrent acquisitions of a new token are
+    coalesced by ``acquire`` into one in-flight task shared by all callers.
+    """
+
+    def __init__(self, snapshot: Optional[TokenSnapshot] = None):
+        self._snapshot = snapshot or TokenSnapshot()
+        self._write_lock = threading.Lock()
+        self._acquire_task: Optional[asyncio.Future] = None
+
+    @property
+    def snapshot(self) -> TokenSnapshot:
+        """Current token snapshot (lock-free)."""
+        return self._snapshot
+
+    def valid_token(self) -> Optional[str]:
+        """Return the access token if it is still valid, otherwise None (lock-free)."""
+        snapshot = self._snapshot
+        return None if snapshot.is_expired() else snapshot.access_token
+
+    def set(self, snapshot: TokenSnapshot) -> None:
+        """Replace the whole token state."""
+        with self._write_lock:
+            self._snapshot = snapshot
+
+    def update(self, expected: Optional[TokenSnapshot] = None, **changes) -> bool:
+        """Apply changes to the token state.
+
+        Args:
+            expected: If given, only apply the changes when the current snapshot
+                is still this one (compare-and-set)
+            **changes: TokenSnapshot fields to replace
+
+        Returns:
+            bool: True if the changes were applied
+        """
+        with self._write_lock:
+            if expected is not None and self._snapshot is not expected:
+                return False
+            self._snapshot = replace(self._snapshot, **changes)
+            return True
+
+    async def acquire(self, fetch: Callable[[], Awaitable[str]]) -> str:
+        """Obtain a new access token, sharing one in-flight fetch between callers.
+
+        Args:
+            fetch: Coroutine function performing the actual acquisition
+
+        Returns:
+            str: The acquired access token
+        """
+        if self._acquire_task is None or self._acquire_task.done():
+            self._acquire_task = asyncio.ensure_future(fetch())
+        # Shield the shared task so one cancelled caller does not abort it for the others
+        return await asyncio.shield(self._acquire_task)
@@ -0,0 +1,130 @@
+import os
+import json
+import base64
+import hashlib
+import logging
+import tempfile
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PBKDF2_ITERATIONS = 200_000  # Key derivation work factor for encrypted stores
+
+
+def _derive_key(passphrase: str, salt: bytes) -> bytes:
+    """Derive a Fernet key from a passphrase.
+
+    Args:
+        passphrase: User supplied secret
+        salt: Random per-file salt
+
+    Returns:
+        bytes: URL-safe base64 encoded 32-byte key
+    """
+    raw = hashlib.pbkdf2_hmac("sha256", passphrase.encode("utf-8"), salt, PBKDF2_ITERATIONS)
+    return base64.urlsafe_b64encode(raw)
+
+
+def _fernet(passphrase: str, salt: bytes):
+    """Create a Fernet cipher, requiring the optional cryptography package."""
+    try:
+        from cryptography.fernet import Fernet
+    except ImportError as e:
+        raise ImportError(
+            "Encrypted token store requires the 'cryptography' package, "
+            "install it with: pip install 'mcp-lark-doc-manage[encryption]'"
+        ) from e
+    return Fernet(_derive_key(passphrase, salt))
+
+
+class TokenStore:
+    """File-backed store that keeps OAuth tokens across process restarts.
+
+    The file is written atomically (temp file + rename) with owner-only
+    permissions, and is optionally encrypted with a passphrase.
+    """
+
+    def __init__(self, path: str, passphrase: Optional[str] = None):
+        """Initialize the store.
+
+        Args:
+            path: Location of the token file
+            passphrase: Secret used to encrypt the file (optional)
+        """
+        self.path = os.path.expanduser(path)
+        self.passphrase = passphrase or None
+        if self.passphrase:
+            # Fail at startup rather than on the first token write
+            _fernet(self.passphrase, b"\0" * 16)
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Read the stored tokens.
+
+        Returns:
+            dict: Stored token data, or None if the file is missing or unreadable
+        """
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Failed to read token store {self.path}: {str(e)}")
+            return None
+
+        try:
+            envelope = json.loads(raw.decode("utf-8"))
+            if "ciphertext" in envelope:
+                if not self.passphrase:
+                    logger.warning(f"Token store {self.path} is encrypted but no passphrase is configured")
+                    return None
+                salt = base64.b64decode(envelope["salt"])
+                plaintext = _fernet(self.passphrase, salt).decrypt(envelope["ciphertext"].encode("ascii"))
+                return json.loads(plaintext.decode("utf-8"))
+            return envelope.get("tokens")
+        except ImportError:
+            raise
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable token store {self.path}: {str(e)}")
+            return None
+
+    def save(self, tokens: Dict[str, Any]) -> None:
+        """Atomically write tokens to the store.
+
+        Args:
+            tokens: Token data to persist
+        """
+        if self.passphrase:
+            salt = os.urandom(16)
+            ciphertext = _fernet(self.passphrase, salt).encrypt(json.dumps(tokens).encode("utf-8"))
+            envelope = {
+                "salt": base64.b64encode(salt).decode("ascii"),
+                "ciphertext": ciphertext.decode("ascii"),
+            }
+        else:
+            envelope = {"tokens": tokens}
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        # mkstemp creates the file with 0600 permissions
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tokens-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(json.dumps(envelope).encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def clear(self) -> None:
+        """Remove the stored tokens."""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,392 @@
+import json
+import os
+import time
+import random
+import asyncio
+import logging
+import importlib.util
+from typing import Any, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Lark Open API endpoint configuration
+LARK_DOMAIN = os.getenv("LARK_DOMAIN", "https://open.feishu.cn")  # Open API base URL
+LARK_TIMEOUT = float(os.getenv("LARK_TIMEOUT", "30"))  # Per-request timeout in seconds
+LARK_MAX_CONNECTIONS = int(os.getenv("LARK_MAX_CONNECTIONS", "20"))  # Pool size shared by all tools
+LARK_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LARK_MAX_KEEPALIVE_CONNECTIONS", "10"))  # Idle connections kept warm
+LARK_KEEPALIVE_EXPIRY = float(os.getenv("LARK_KEEPALIVE_EXPIRY", "60"))  # Seconds an idle connection stays open
+LARK_HTTP2 = os.getenv("LARK_HTTP2", "true").lower() in ("1", "true", "yes")  # Enable HTTP/2 multiplexing
+LARK_RATE_LIMITS = os.getenv("LARK_RATE_LIMITS", "")  # Per-family requests/second overrides, e.g. "docx=5,wiki=10"
+LARK_THROTTLE_RETRIES = int(os.getenv("LARK_THROTTLE_RETRIES", "3"))  # Times a throttled request is re-sent
+
+DEFAULT_RATE_LIMITS = {"docx": 5.0, "wiki": 5.0, "drive": 5.0, "search": 5.0, "auth": 5.0, "default": 5.0}
+THROTTLE_CODES = {99991400}  # Lark "request trigger frequency limit"
+THROTTLE_DEFAULT_WAIT = 1.0  # Seconds to pause a family when Lark gives no reset hint
+THROTTLE_MAX_WAIT = 60.0  # Upper bound for server supplied reset hints
+LARK_RETRY_ATTEMPTS = int(os.getenv("LARK_RETRY_ATTEMPTS", "3"))  # Retries of a transient failure per call
+LARK_RETRY_BASE_DELAY = float(os.getenv("LARK_RETRY_BASE_DELAY", "0.5"))  # First backoff step in seconds
+LARK_RETRY_MAX_DELAY = float(os.getenv("LARK_RETRY_MAX_DELAY", "8"))  # Cap of a single backoff in seconds
+LARK_RETRY_BUDGET = float(os.getenv("LARK_RETRY_BUDGET", "30"))  # Seconds a call may spend retrying in total
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRYABLE_STATUS = {500, 502, 503, 504}  # Server-side failures that are usually transient
+# Failures raised before the request reached Lark, safe to retry for any method
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+_http_client: Optional[httpx.AsyncClient] = None  # Process-wide pooled async HTTP client
+_rate_limiters: Dict[str, "TokenBucket"] = {}  # Endpoint family -> token bucket
+
+
+class LarkResponse:
+    """Parsed response of a Lark Open API call.
+
+    Mirrors the parts of ``lark.BaseResponse`` the tools rely on (``success()``,
+    ``code`` and ``msg``) while exposing the decoded JSON body directly.
+    """
+
+    def __init__(self, status_code: int, body: Dict[str, Any], headers: Optional[httpx.Headers] = None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers if headers is not None else httpx.Headers()
+        self.code = body.get("code", -1)
+        self.msg = body.get("msg") or body.get("error_description") or ""
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        """Return the ``data`` section of the response body (empty dict if missing)."""
+        return self.body.get("data") or {}
+
+    def success(self) -> bool:
+        """Check whether Lark reported the call as successful."""
+        return self.code == 0
+
+    def __repr__(self) -> str:
+        return f"LarkResponse(status_code={self.status_code}, code={self.code}, msg={self.msg!r})"
+
+
+class LarkAPIError(Exception):
+    """Raised by internal helpers when a Lark Open API call reports a failure."""
+
+    def __init__(self, message: str, response: Optional[LarkResponse] = None):
+        super().__init__(message)
+        self.response = response
+
+
+class TokenBucket:
+    """Adaptive token-bucket rate limiter for one endpoint family.
+
+    Callers reserve a token before each request and sleep until it is
+    available. When Lark throttles a request, the rate is halved and the
+    bucket is paused until the reset time Lark reports; every successful
+    request then restores part of the rate (AIMD), up to the configured one.
+    Reservations happen without awaiting, so no lock is needed on the loop.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        """Initialize the bucket.
+
+        Args:
+            rate: Maximum sustained requests per second
+            burst: Requests allowed back to back (default: one second's worth)
+        """
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = rate / 8
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def reserve(self) -> float:
+        """Take a token, returning how many seconds to wait before using it."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent."""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_throttle(self, wait: float) -> None:
+        """Slow down after Lark reported a frequency limit.
+
+        Args:
+            wait: Seconds until Lark resets the limit
+        """
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.paused_until = max(self.paused_until, time.monotonic() + wait)
+        self.tokens = min(self.tokens, 0.0)
+
+    def on_success(self) -> None:
+        """Recover part of the rate after a request went through."""
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+def _configured_rate_limits() -> Dict[str, float]:
+    """Merge LARK_RATE_LIMITS overrides into the default per-family rates."""
+    limits = dict(DEFAULT_RATE_LIMITS)
+    for entry in LARK_RATE_LIMITS.split(","):
+        if "=" not in entry:
+            continue
+        family, rate = entry.split("=", 1)
+        try:
+            limits[family.strip()] = float(rate)
+        except ValueError:
+            logger.warning(f"Ignoring invalid LARK_RATE_LIMITS entry: {entry}")
+    return limits
+
+
+def endpoint_family(uri: str) -> str:
+    """Classify an Open API path into the family whose rate limit applies.
+
+    Args:
+        uri: API path starting with /open-apis/
+
+    Returns:
+        str: One of docx, wiki, drive, search, auth or default
+    """
+    if uri.startswith("/open-apis/authen/"):
+        return "auth"
+    if "/search" in uri:
+        return "search"
+    for family in ("docx", "wiki", "drive"):
+        if uri.startswith(f"/open-apis/{family}/"):
+            return family
+    return "default"
+
+
+def get_rate_limiter(family: str) -> Optional[TokenBucket]:
+    """Get the token bucket of an endpoint family (None if its rate is 0)."""
+    if family not in _rate_limiters:
+        rate = _configured_rate_limits().get(family, DEFAULT_RATE_LIMITS["default"])
+        _rate_limiters[family] = TokenBucket(rate) if rate > 0 else None
+    return _rate_limiters[family]
+
+
+def reset_rate_limiters() -> None:
+    """Forget all learned rates, e.g. after changing LARK_RATE_LIMITS."""
+    _rate_limiters.clear()
+
+
+def _is_throttled(response: LarkResponse) -> bool:
+    """Check whether Lark rejected the request for exceeding a frequency limit."""
+    return response.status_code == 429 or response.code in THROTTLE_CODES
+
+
+def _throttle_wait(response: LarkResponse) -> float:
+    """Seconds to wait before retrying a throttled request, from the rate headers."""
+    for header in ("x-ogw-ratelimit-reset", "retry-after"):
+        value = response.headers.get(header)
+        if value is None:
+            continue
+        try:
+            return min(THROTTLE_MAX_WAIT, max(0.0, float(value)))
+        except ValueError:
+            continue
+    return THROTTLE_DEFAULT_WAIT
+
+
+def _backoff_delay(retry: int) -> float:
+    """Capped exponential backoff with full jitter.
+
+    Args:
+        retry: Number of the retry about to be made, starting at 1
+
+    Returns:
+        float: Seconds to sleep before the retry
+    """
+    return random.uniform(0, min(LARK_RETRY_MAX_DELAY, LARK_RETRY_BASE_DELAY * 2 ** (retry - 1)))
+
+
+def _is_retryable_error(error: Exception, idempotent: bool) -> bool:
+    """Check whether a transport error may be retried.
+
+    Errors raised before the request was sent are always retryable. Errors
+    after that point (timeouts while reading, dropped connections) leave it
+    unknown whether Lark executed the request, so only idempotent requests
+    are retried.
+    """
+    if isinstance(error, UNSENT_ERRORS):
+        return True
+    return idempotent and isinstance(error, httpx.TransportError)
+
+
+def _http2_available() -> bool:
+    """Check whether the optional h2 package needed for HTTP/2 is installed."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Create the pooled HTTP client used for Lark Open API calls.
+
+    Returns:
+        httpx.AsyncClient: Client with keep-alive pooling and, when available, HTTP/2
+    """
+    http2 = LARK_HTTP2 and _http2_available()
+    if LARK_HTTP2 and not http2:
+        logger.warning("h2 package not installed, falling back to HTTP/1.1 for Lark API calls")
+    limits = httpx.Limits(
+        max_connections=LARK_MAX_CONNECTIONS,
+        max_keepalive_connections=LARK_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LARK_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(
+        base_url=LARK_DOMAIN,
+        timeout=LARK_TIMEOUT,
+        limits=limits,
+        http2=http2,
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get the shared pooled HTTP client, creating it on first use.
+
+    Every tool and the OAuth token exchange go through this client so bursts of
+    calls reuse warm connections instead of paying a TLS handshake each time.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = create_http_client()
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client, releasing its connections."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _parse_response(response: httpx.Response) -> LarkResponse:
+    """Decode an HTTP response into a LarkResponse.
+
+    Args:
+        response: Raw httpx response
+
+    Returns:
+        LarkResponse: Parsed response; non-JSON bodies are reported as failures
+    """
+    try:
+        body = json.loads(response.content.decode("utf-8")) if response.content else {}
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        body = {}
+    if not isinstance(body, dict):
+        body = {}
+    if "code" not in body:
+        # Lark always returns a JSON envelope; anything else is a transport-level failure
+        body = dict(body, code=response.status_code if response.is_error else -1)
+        body.setdefault("msg", f"HTTP {response.status_code}: {response.text[:200]}")
+    return LarkResponse(response.status_code, body, response.headers)
+
+
+async def lark_request(
+    method: str,
+    uri: str,
+    user_access_token: Optional[str] = None,
+    queries: Optional[Dict[str, Any]] = None,
+    body: Optional[Any] = None,
+    idempotent: Optional[bool] = None,
+    content: Optional[bytes] = None,
+) -> LarkResponse:
+    """Send a request to the Lark Open API without blocking the event loop.
+
+    Requests are paced by the rate limiter of their endpoint family. A request
+    Lark rejects with a frequency limit was not executed, so it is re-sent
+    after the reported reset time, up to LARK_THROTTLE_RETRIES times.
+
+    Transient failures (connection errors, 5xx responses) are retried with
+    capped exponential backoff and jitter, up to LARK_RETRY_ATTEMPTS times
+    within LARK_RETRY_BUDGET seconds. Failures that may have reached Lark are
+    only retried for idempotent requests.
+
+    Args:
+        method: HTTP method, e.g. "GET" or "POST"
+        uri: API path starting with /open-apis/
+        user_access_token: User access token sent as a bearer token (optional)
+        queries: Query string parameters (optional)
+        body: JSON request body (optional)
+        idempotent: Whether repeating the request is harmless (default: based on
+            the HTTP method; pass True for read-only POSTs such as searches)
+        content: Request body already encoded as JSON, sent instead of body (optional)
+
+    Returns:
+        LarkResponse: Parsed API response
+
+    Raises:
+        httpx.TransportError: If the request still fails after the allowed retries
+    """
+    headers = {"Content-Type": "application/json; charset=utf-8"}
+    if user_access_token:
+        headers["Authorization"] = f"Bearer {user_access_token}"
+
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    limiter = get_rate_limiter(endpoint_family(uri))
+    deadline = time.monotonic() + LARK_RETRY_BUDGET
+    throttled = 0
+    retries = 0
+
+    def may_retry() -> Optional[float]:
+        """Return the backoff before the next retry, or None if the budget is spent."""
+        if retries >= LARK_RETRY_ATTEMPTS:
+            return None
+        delay = _backoff_delay(retries + 1)
+        if time.monotonic() + delay > deadline:
+            return None
+        return delay
+
+    while True:
+        if limiter:
+            await limiter.acquire()
+        try:
+            response = await get_http_client().request(
+                method,
+                uri,
+                params=queries,
+                json=body if content is None else None,
+                content=content,
+                headers=headers,
+            )
+        except httpx.TransportError as e:
+            delay = may_retry() if _is_retryable_error(e, idempotent) else None
+            if delay is None:
+                raise
+            retries += 1
+            logger.warning(f"{method} {uri} failed ({type(e).__name__}: {str(e)}), retry {retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            continue
+
+        logger.debug(f"{method} {uri} -> HTTP {response.status_code}")
+        parsed = _parse_response(response)
+        if _is_throttled(parsed):
+            if throttled >= LARK_THROTTLE_RETRIES:
+                return parsed
+            throttled += 1
+            wait = _throttle_wait(parsed)
+            logger.warning(f"{method} {uri} throttled by Lark (code {parsed.code}), slowing down for {wait:.1f}s")
+            if limiter:
+                limiter.on_throttle(wait)
+            else:
+                await asyncio.sleep(wait)
+            continue
+
+        if parsed.status_code in RETRYABLE_STATUS and idempotent:
+            delay = may_retry()
+            if delay is not None:
+                retries += 1
+                logger.warning(f"{method} {uri} returned HTTP {parsed.status_code}, retry {retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+
+        if limiter:
+            limiter.on_success()
+        return parsed
@@ -2,7 +2,7 @@ import asyncio
 import os
 import json
 from dotenv import load_dotenv
-from mcp_lark_doc_manage.server import create_doc, larkClient, USER_ACCESS_TOKEN, TOKEN_EXPIRES_AT, token_lock
+from mcp_lark_doc_manage.server import create_doc
 
 async def test_create_doc():
     """测试创建文档功能"""
@@ -1,9 +1,15 @@
 import pytest
 import os
 import sys
+import json
+import time
+import asyncio
 import logging
 from importlib import reload
 import importlib
+from unittest.mock import patch
+
+import httpx
 
 # 不要在 conftest.py 中启动 coverage，让 pytest-cov 插件来处理
 # 这样可以避免与 pytest-cov 插件的冲突
@@ -17,6 +23,9 @@ os.environ["OAUTH_PORT"] = "9997"
 os.environ["LARK_APP_ID"] = "test_app_id"
 os.environ["LARK_APP_SECRET"] = "test_app_secret"
 os.environ["FOLDER_TOKEN"] = "test_folder_token"
+# 缩短重试退避，避免测试因失败重试而变慢
+os.environ["LARK_RETRY_BASE_DELAY"] = "0.01"
+os.environ["LARK_RETRY_MAX_DELAY"] = "0.05"
 
 @pytest.fixture(scope="session", autouse=True)
 def setup_test_session():
@@ -54,6 +63,182 @@ def setup_test_env():
         else:
             os.environ[var] = value
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """每个测试前清空服务器缓存，避免测试之间互相影响"""
+    import mcp_lark_doc_manage.server as server
+    import mcp_lark_doc_manage.transport as transport
+    transport.reset_rate_limiters()
+    server.wiki_node_cache.clear()
+    server.doc_content_cache.clear()
+    if server.local_index is not None:
+        server.local_index.clear()
+    yield
+
+@pytest.fixture
+def make_client():
+    """返回创建 MockTransport httpx 客户端的函数，处理函数模拟飞书开放接口"""
+    from mcp_lark_doc_manage import transport
+
+    def factory(handler):
+        return httpx.AsyncClient(base_url=transport.LARK_DOMAIN, transport=httpx.MockTransport(handler))
+    return factory
+
+@pytest.fixture
+def logged_in():
+    """让服务器使用一个有效的用户令牌，工具调用无需走登录流程"""
+    import mcp_lark_doc_manage.server as server
+    from mcp_lark_doc_manage.token_manager import TokenManager, TokenSnapshot
+    with patch.object(server, "token_manager", TokenManager(TokenSnapshot("test_token", time.time() + 3600))):
+        yield
+
+@pytest.fixture
+def folder_pages_handler():
+    """模拟分页的 drive/v1/files 接口，page_token 为下一页起始下标"""
+    def factory(total, page_size_seen=None):
+        def handler(request: httpx.Request):
+            page_size = int(request.url.params["page_size"])
+            start = int(request.url.params.get("page_token", "0"))
+            if page_size_seen is not None:
+                page_size_seen.append(start)
+            files = [{"name": f"file{i}", "type": "docx", "token": f"tok{i}"} for i in range(start, min(start + page_size, total))]
+            has_more = start + page_size < total
+            data = {"files": files, "has_more": has_more}
+            if has_more:
+                data["next_page_token"] = str(start + page_size)
+            return httpx.Response(200, json={"code": 0, "data": data})
+        return handler
+    return factory
+
+@pytest.fixture
+def wiki_search_handler():
+    """模拟分页的 wiki/v1/nodes/search 接口，page_token 为下一页起始下标"""
+    def factory(total, delay=0.0, log=None):
+        async def handler(request: httpx.Request):
+            page_size = int(request.url.params["page_size"])
+            start = int(request.url.params.get("page_token", "0"))
+            if log is not None:
+                log.append(("start", start, time.monotonic()))
+            await asyncio.sleep(delay)
+            items = [{"title": f"result{i}", "url": f"https://docs.feishu.cn/wiki/n{i}"} for i in range(start, min(start + page_size, total))]
+            has_more = start + page_size < total
+            data = {"items": items, "has_more": has_more}
+            if has_more:
+                data["page_token"] = str(start + page_size)
+            return httpx.Response(200, json={"code": 0, "data": data})
+        return handler
+    return factory
+
+@pytest.fixture
+def flaky_handler():
+    """前 failures 次请求返回 5xx，之后成功"""
+    def factory(failures, log, status=503):
+        def handler(request: httpx.Request):
+            log.append(request.method)
+            if len(log) <= failures:
+                return httpx.Response(status, text="Service Unavailable")
+            return httpx.Response(200, json={"code": 0, "data": {"ok": True}})
+        return handler
+    return factory
+
+@pytest.fixture
+def create_doc_handler():
+    """模拟创建文档与插入块的接口，记录每次插入请求"""
+    def factory(log):
+        def handler(request: httpx.Request):
+            path = request.url.path
+            if path == "/open-apis/docx/v1/documents":
+                return httpx.Response(200, json={"code": 0, "data": {"document": {"document_id": "doc1"}}})
+            if path.endswith("/descendant"):
+                body = json.loads(request.content)
+                log.append((path, dict(request.url.params), body))
+                relations = [{"temporary_block_id": block["block_id"], "block_id": f"real-{block['block_id']}"}
+                             for block in body["descendants"]]
+                return httpx.Response(200, json={"code": 0, "data": {"block_id_relations": relations}})
+            return httpx.Response(200, json={"code": 0, "data": {}})
+        return handler
+    return factory
+
+@pytest.fixture
+def lark_document():
+    """按飞书接口的返回格式手工构造文档块（而非经 markdown 转换）：段落之间没有空段落，
+    含文档提及、行内公式、下划线与 @用户；返回按文档顺序排列、带 parent_id 的块列表"""
+    plain = {"bold": False, "inline_code": False, "italic": False, "strikethrough": False, "underline": False}
+
+    def run(content, **style):
+        return {"text_run": {"content": content, "text_element_style": dict(plain, **style)}}
+
+    def block(block_id, block_type, key, elements, **style):
+        return {
+            "block_id": block_id, "block_type": block_type, "parent_id": "doc1",
+            key: {"elements": elements, "style": dict({"align": 1, "folded": False}, **style)},
+        }
+
+    def factory(paragraphs=3):
+        blocks = [block("h1", 3, "heading1", [run("标题")])]
+        blocks.append(block("p0", 2, "text", [
+            run("参见 "),
+            {"mention_doc": {
+                "token": "doxcnDesign", "obj_type": 22, "title": "设计文档",
+                "url": "https%3A%2F%2Fsample.feishu.cn%2Fdocx%2FdoxcnDesign", "text_element_style": plain,
+            }},
+            run("，公式 "),
+            {"equation": {"content": "E=mc^2\n", "text_element_style": plain}},
+            run("，"),
+            run("下划线", underline=True),
+            run(" 请 "),
+            {"mention_user": {"user_id": "ou_reviewer", "text_element_style": plain}},
+            run(" 确认"),
+        ]))
+        blocks += [block(f"p{i}", 2, "text", [run(f"第 {i} 段，"), run("加粗", bold=True)]) for i in range(1, paragraphs)]
+        blocks += [
+            block("b1", 12, "bullet", [run("要点一")]),
+            block("b2", 12, "bullet", [run("要点二")]),
+            block("o1", 13, "ordered", [run("步骤一")], sequence="1"),
+            block("o2", 13, "ordered", [run("步骤二")], sequence="auto"),
+            {"block_id": "c1", "block_type": 14, "parent_id": "doc1",
+             "code": {"elements": [run("print(1)")], "style": {"language": 49, "wrap": False}}},
+            block("tail", 2, "text", [run("")]),
+        ]
+        page = {"block_id": "doc1", "block_type": 1, "page": {"elements": [run("文档")]},
+                "children": [item["block_id"] for item in blocks]}
+        return [page] + blocks
+    return factory
+
+@pytest.fixture
+def document_blocks_handler():
+    """模拟分页的块列表接口（块树来自 markdown 转换，kept 为插入顶层的 (位置, 块)；
+    也可用 blocks 直接给出块列表），记录写请求"""
+    from mcp_lark_doc_manage.markdown_converter import convert_markdown_to_blocks
+
+    def factory(markdown, log, page_size=3, kept=(), blocks=None):
+        if blocks is not None:
+            items = blocks
+        else:
+            blocks_data = convert_markdown_to_blocks(markdown)
+            children = list(blocks_data["children_id"])
+            for position, block in kept:
+                children.insert(position, block["block_id"])
+            parents = {child: "doc1" for child in children}
+            for block in blocks_data["descendants"]:
+                parents.update((child, block["block_id"]) for child in block.get("children", []))
+            items = [{"block_id": "doc1", "block_type": 1, "page": {}, "children": children}]
+            descendants = list(blocks_data["descendants"]) + [block for _, block in kept]
+            items += [dict(block, parent_id=parents.get(block["block_id"])) for block in descendants]
+
+        def handler(request: httpx.Request):
+            if request.method == "GET" and request.url.path == "/open-apis/docx/v1/documents/doc1/blocks":
+                start = int(request.url.params.get("page_token") or 0)
+                end = start + page_size
+                data = {"items": items[start:end], "has_more": end < len(items)}
+                if end < len(items):
+                    data["page_token"] = str(end)
+                return httpx.Response(200, json={"code": 0, "data": data})
+            log.append((request.method, request.url.path, json.loads(request.content)))
+            return httpx.Response(200, json={"code": 0, "data": {}})
+        return handler
+    return factory
+
 # 定义测试标记
 def pytest_configure(config):
     """配置 pytest 测试标记"""
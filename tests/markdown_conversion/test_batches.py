@@ -0,0 +1,93 @@
+import pytest
+import sys
+import os
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from src.mcp_lark_doc_manage.markdown_converter import convert_markdown_to_blocks, encode_descendant_body, split_into_batches
+
+
+def check_batches(blocks_data, batches, max_blocks):
+    """校验批次合法：不超限、父块完整、按序插入后还原出原始树"""
+    original = {block['block_id']: block for block in blocks_data['descendants']}
+    created = {None: []}
+    for batch in batches:
+        assert 0 < len(batch['descendants']) <= max_blocks
+        # 父块必须已由之前的批次创建
+        assert batch['parent_id'] in created
+        sent = {block['block_id'] for block in batch['descendants']}
+        for block in batch['descendants']:
+            for child in block.get('children', []):
+                assert child in sent
+        for child in batch['children_id']:
+            assert child in sent
+        siblings = created[batch['parent_id']]
+        assert batch['index'] == len(siblings)
+        siblings.extend(batch['children_id'])
+        for block in batch['descendants']:
+            created.setdefault(block['block_id'], [])
+            created[block['block_id']].extend(block.get('children', []))
+
+    assert created.pop(None) == blocks_data['children_id']
+    assert set(created) == set(original)
+    for block_id, children in created.items():
+        assert children == original[block_id].get('children', [])
+
+
+def test_small_document_is_one_batch():
+    """测试小文档保持单次请求且内容不变"""
+    blocks_data = convert_markdown_to_blocks("# 标题\n\n正文\n\n- a\n- b\n")
+    batches = split_into_batches(blocks_data, 1000)
+
+    assert len(batches) == 1
+    assert batches[0]['parent_id'] is None
+    assert batches[0]['index'] == 0
+    assert batches[0]['children_id'] == blocks_data['children_id']
+    assert batches[0]['descendants'] == blocks_data['descendants']
+
+
+def test_ten_thousand_blocks_are_split():
+    """测试一万个块的文档被拆成不超限的有序批次"""
+    markdown = "\n".join(f"### 标题 {i}" for i in range(10000))
+    blocks_data = convert_markdown_to_blocks(markdown)
+    assert len(blocks_data['descendants']) == 10000
+
+    batches = split_into_batches(blocks_data, 1000)
+
+    assert len(batches) == 10
+    check_batches(blocks_data, batches, 1000)
+
+
+@pytest.mark.parametrize("max_blocks", [3, 5, 8, 50])
+def test_oversized_subtree_is_continued_under_its_root(max_blocks):
+    """测试超过上限的嵌套列表拆开后在父块下继续插入"""
+    lines = []
+    for i in range(12):
+        lines.append(f"- item {i}")
+        for j in range(4):
+            lines.append(f"  - child {i}.{j}")
+    markdown = "# 开头\n\n" + "\n".join(lines) + "\n\n结尾\n\n> 引用\n"
+    blocks_data = convert_markdown_to_blocks(markdown)
+
+    batches = split_into_batches(blocks_data, max_blocks)
+
+    assert len(batches) > 1
+    check_batches(blocks_data, batches, max_blocks)
+
+
+def test_encoded_body_matches_httpx_json():
+    """测试流式编码的请求体与 httpx 的 json= 编码逐字节一致"""
+    from httpx._content import encode_json
+
+    markdown = (
+        "# 标题 \"引号\" \\ 反斜杠\n\n"
+        "中文 **粗体** *斜体* `code` ~~删除~~ [链接](https://example.com/路径?a=1&b=2)\n\n"
+        "- 列表\n  - 子项\n\n1. 一\n2. 二\n\n- [x] 完成\n\n> 引用\n\n"
+        "```python\nprint('\\t')\n```\n"
+    )
+    blocks_data = convert_markdown_to_blocks(markdown)
+    for batch in split_into_batches(blocks_data, max_blocks=3):
+        body = {"index": 7, "children_id": batch['children_id'], "descendants": batch['descendants']}
+        encoded = encode_descendant_body(7, batch['children_id'], batch['descendants'])
+        assert encoded == b"".join(encode_json(body)[1])
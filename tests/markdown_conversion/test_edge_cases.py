@@ -154,4 +154,77 @@ def test_convert_markdown_to_blocks_unhandled_node():
     result = convert_markdown_to_blocks(markdown_text)
     assert isinstance(result, OrderedDict)
     assert 'children_id' in result
-    assert 'descendants' in result 
\ No newline at end of file
+    assert 'descendants' in result 
+def test_markdown_parser_is_cached_per_thread():
+    """Test the mistune parser is built once per thread and reused across conversions"""
+    import threading
+    from mcp_lark_doc_manage.markdown_converter import get_markdown_parser
+
+    parser = get_markdown_parser()
+    assert get_markdown_parser() is parser
+    first = convert_markdown_to_blocks("# Title\n\n- a\n- b\n")
+    assert convert_markdown_to_blocks("# Title\n\n- a\n- b\n") == first
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append((get_markdown_parser(), convert_markdown_to_blocks("# Title\n\n- a\n- b\n"))))
+    thread.start()
+    thread.join()
+    assert other[0][0] is not parser
+    assert other[0][1] == first
+
+def test_block_list_indexes_blocks_by_id():
+    """Test BlockList indexes appended blocks and still compares equal to a plain list"""
+    from mcp_lark_doc_manage.markdown_converter import BlockList, find_block
+
+    blocks = [{'block_id': '1', 'block_type': 2}, {'block_id': '2', 'block_type': 12}]
+    indexed = BlockList(blocks[:1])
+    indexed.append(blocks[1])
+    assert indexed == blocks
+    assert find_block({'descendants': indexed}, '2') is blocks[1]
+    assert find_block({'descendants': indexed}, 'missing') is None
+    # Plain lists fall back to a scan
+    assert find_block({'descendants': blocks}, '2') is blocks[1]
+    assert find_block({'descendants': blocks}, 'missing') is None
+
+def test_long_nested_list_links_every_child():
+    """Test every nested item of a long list is attached to its own parent"""
+    items = 10000
+    result = convert_markdown_to_blocks("".join(f"- item {i}\n  - child {i}\n" for i in range(items)))
+    descendants = result['descendants']
+    assert len(descendants) == 2 * items
+    assert len(result['children_id']) == items
+    assert set(descendants.by_id) == {block['block_id'] for block in descendants}
+    for parent_id in result['children_id'][:10] + result['children_id'][-10:]:
+        parent = descendants.by_id[parent_id]
+        child = descendants.by_id[parent['children'][0]]
+        assert child['bullet']['elements'][0]['text_run']['content'] == parent['bullet']['elements'][0]['text_run']['content'].replace('item', 'child')
+
+def test_styles_are_shared_and_read_only():
+    """Test equal styles are one shared read-only object that still equals a plain OrderedDict"""
+    import copy
+    import json
+    import pickle
+    from mcp_lark_doc_manage.markdown_converter import create_text_element_style, style_template
+
+    result = convert_markdown_to_blocks("# Title\n\nplain text\n\n- a\n- b\n")
+    payload_keys = {2: 'text', 3: 'heading1', 12: 'bullet'}
+    styles = [element['text_run']['text_element_style']
+              for block in result['descendants'] for element in block[payload_keys[block['block_type']]]['elements']]
+    assert len(styles) >= 4
+    assert all(style is create_text_element_style() for style in styles)
+    assert result['descendants'][0]['heading1']['style'] is create_block_style()
+    assert style_template(('language', 49), ('wrap', False)) is style_template(('language', 49), ('wrap', False))
+
+    style = create_text_element_style(bold=True, link="https://example.com")
+    assert style == OrderedDict([
+        ('bold', True), ('inline_code', False), ('italic', False),
+        ('link', OrderedDict([('url', 'https%3A%2F%2Fexample.com')])),
+        ('strikethrough', False), ('underline', False),
+    ])
+    assert json.loads(style.json_bytes, object_pairs_hook=OrderedDict) == style
+    with pytest.raises(TypeError):
+        style['bold'] = False
+    with pytest.raises(TypeError):
+        style['link'].update(url='other')
+    assert copy.deepcopy(style) is style
+    assert pickle.loads(pickle.dumps(style)) == style
@@ -5,6 +5,7 @@ import asyncio
 import json
 import time
 from unittest.mock import patch, MagicMock, AsyncMock
+import httpx
 from aiohttp import web
 
 # 添加项目根目录到 Python 路径
@@ -12,6 +13,8 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 # 导入测试模块
 import mcp_lark_doc_manage.server as server
+from mcp_lark_doc_manage.transport import LarkResponse
+from mcp_lark_doc_manage.token_manager import TokenSnapshot
 from mcp.types import CallToolResult, TextContent
 
 # 所有测试使用 server_test 标记
@@ -21,15 +24,13 @@ pytestmark = pytest.mark.server_test
 async def test_auth_flow():
     """测试鉴权流程"""
     # 保存原始值
-    original_token = server.USER_ACCESS_TOKEN
-    original_expires = server.TOKEN_EXPIRES_AT
+    original = server.token_manager.snapshot
     
     auth_code = "test_auth_code"  # 这是 _start_oauth_server 会返回的值
     
     try:
         # 设置测试环境
-        server.USER_ACCESS_TOKEN = None
-        server.TOKEN_EXPIRES_AT = None
+        server.token_manager.set(TokenSnapshot())
         
         # 模拟 _start_oauth_server 返回授权码
         with patch("mcp_lark_doc_manage.server.larkClient", MagicMock()), \
@@ -44,8 +45,7 @@ async def test_auth_flow():
             server._start_oauth_server.assert_called_once()
     finally:
         # 恢复原始值
-        server.USER_ACCESS_TOKEN = original_token
-        server.TOKEN_EXPIRES_AT = original_expires
+        server.token_manager.set(original)
 
 @pytest.mark.asyncio
 async def test_auth_flow_client_not_initialized():
@@ -71,15 +71,13 @@ async def test_auth_flow_client_not_initialized():
 async def test_auth_flow_no_auth_code():
     """测试鉴权流程中未获取到授权码的情况"""
     # 保存原始值
-    original_token = server.USER_ACCESS_TOKEN
-    original_expires = server.TOKEN_EXPIRES_AT
+    original = server.token_manager.snapshot
     original_ci = os.environ.get('CI')
     original_pytest = os.environ.get('PYTEST_RUNNING')
     
     try:
         # 设置测试环境
-        server.USER_ACCESS_TOKEN = None
-        server.TOKEN_EXPIRES_AT = None
+        server.token_manager.set(TokenSnapshot())
         
         # 确保CI环境变量被移除，这样_start_oauth_server不会自动生成token
         if 'CI' in os.environ:
@@ -98,8 +96,7 @@ async def test_auth_flow_no_auth_code():
             assert "Failed to get user access token" in str(excinfo.value)
     finally:
         # 恢复原始值
-        server.USER_ACCESS_TOKEN = original_token
-        server.TOKEN_EXPIRES_AT = original_expires
+        server.token_manager.set(original)
         
         # 恢复环境变量
         if original_ci is None:
@@ -114,11 +111,260 @@ async def test_auth_flow_no_auth_code():
         else:
             os.environ['PYTEST_RUNNING'] = original_pytest
 
+@pytest.mark.asyncio
+async def test_auth_flow_single_flight():
+    """测试并发鉴权请求只触发一次 OAuth 流程"""
+    # 保存原始值
+    original = server.token_manager.snapshot
+    
+    async def slow_oauth():
+        await asyncio.sleep(0.1)
+        return "shared_token"
+    
+    try:
+        server.token_manager.set(TokenSnapshot())
+        
+        mock_oauth = AsyncMock(side_effect=slow_oauth)
+        with patch("mcp_lark_doc_manage.server.larkClient", MagicMock()), \
+             patch("mcp_lark_doc_manage.server._start_oauth_server", mock_oauth):
+            # 多个工具同时发现令牌过期
+            tokens = await asyncio.gather(*[server._auth_flow() for _ in range(5)])
+        
+        # 所有等待者共享同一次获取结果
+        assert tokens == ["shared_token"] * 5
+        mock_oauth.assert_called_once()
+    finally:
+        server.token_manager.set(original)
+
+@pytest.mark.asyncio
+async def test_auth_flow_single_flight_failure_is_shared_and_retried():
+    """测试共享的鉴权失败会传递给所有等待者，且之后可以重新发起"""
+    # 保存原始值
+    original = server.token_manager.snapshot
+    
+    async def failing_oauth():
+        await asyncio.sleep(0.05)
+        return None
+    
+    try:
+        server.token_manager.set(TokenSnapshot())
+        
+        mock_oauth = AsyncMock(side_effect=failing_oauth)
+        with patch("mcp_lark_doc_manage.server.larkClient", MagicMock()), \
+             patch("mcp_lark_doc_manage.server._start_oauth_server", mock_oauth):
+            results = await asyncio.gather(
+                server._auth_flow(), server._auth_flow(), return_exceptions=True
+            )
+            assert all("Failed to get user access token" in str(r) for r in results)
+            assert mock_oauth.call_count == 1
+            
+            # 失败后的下一次调用会重新发起获取
+            with pytest.raises(Exception):
+                await server._auth_flow()
+            assert mock_oauth.call_count == 2
+    finally:
+        server.token_manager.set(original)
+
+@pytest.fixture
+def saved_tokens():
+    """保存并恢复所有令牌相关的全局状态"""
+    original = server.token_manager.snapshot
+    original_task = server._refresh_task
+    yield
+    task = server._refresh_task
+    if task is not None and task is not original_task and not task.done():
+        task.cancel()
+    server.token_manager.set(original)
+    server._refresh_task = original_task
+
+@pytest.mark.asyncio
+async def test_oauth_callback_stores_refresh_token(saved_tokens):
+    """测试 OAuth 回调保存刷新令牌"""
+    mock_request = MagicMock()
+    mock_request.query = {"code": "test_auth_code"}
+    token_response = LarkResponse(200, {
+        "code": 0,
+        "access_token": "access_1",
+        "expires_in": 7200,
+        "refresh_token": "refresh_1",
+        "refresh_token_expires_in": 604800
+    })
+    
+    with patch("mcp_lark_doc_manage.server.lark_request", AsyncMock(return_value=token_response)):
+        response = await server._handle_oauth_callback(mock_request)
+    
+    assert response.status == 200
+    snapshot = server.token_manager.snapshot
+    assert snapshot.access_token == "access_1"
+    assert snapshot.refresh_token == "refresh_1"
+    assert snapshot.refresh_token_expires_at > time.time()
+    # 保存刷新令牌后应启动后台刷新任务
+    assert server._refresh_task is not None and not server._refresh_task.done()
+
+@pytest.mark.asyncio
+async def test_refresh_user_token(saved_tokens):
+    """测试使用刷新令牌静默续期"""
+    server.token_manager.set(TokenSnapshot(refresh_token="refresh_1", refresh_token_expires_at=time.time() + 3600))
+    refresh_response = LarkResponse(200, {
+        "code": 0,
+        "access_token": "access_2",
+        "expires_in": 7200,
+        "refresh_token": "refresh_2"
+    })
+    mock_lark_request = AsyncMock(return_value=refresh_response)
+    
+    with patch("mcp_lark_doc_manage.server.lark_request", mock_lark_request):
+        token = await server._refresh_user_token()
+    
+    assert token == "access_2"
+    assert server.token_manager.snapshot.access_token == "access_2"
+    assert server.token_manager.snapshot.refresh_token == "refresh_2"
+    body = mock_lark_request.call_args.kwargs["body"]
+    assert body["grant_type"] == "refresh_token"
+    assert body["refresh_token"] == "refresh_1"
+
+@pytest.mark.asyncio
+async def test_refresh_user_token_rejected(saved_tokens):
+    """测试刷新令牌被拒绝时清除并回退到交互式授权"""
+    server.token_manager.set(TokenSnapshot(refresh_token="refresh_1"))
+    rejected = LarkResponse(400, {"code": 20037, "error_description": "refresh token revoked"})
+    
+    with patch("mcp_lark_doc_manage.server.lark_request", AsyncMock(return_value=rejected)):
+        assert await server._refresh_user_token() is None
+    assert server.token_manager.snapshot.refresh_token is None
+    
+    # 没有刷新令牌时不发送请求
+    mock_lark_request = AsyncMock()
+    with patch("mcp_lark_doc_manage.server.lark_request", mock_lark_request):
+        assert await server._refresh_user_token() is None
+    mock_lark_request.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_refresh_user_token_keeps_token_on_transient_failure(saved_tokens):
+    """测试令牌接口返回 503 或限流等临时错误时保留刷新令牌"""
+    server.token_manager.set(TokenSnapshot(refresh_token="refresh_1", refresh_token_expires_at=time.time() + 3600))
+    for transient in (LarkResponse(503, {"code": 503}), LarkResponse(400, {"code": 99991400, "msg": "frequency limit"})):
+        with patch("mcp_lark_doc_manage.server.lark_request", AsyncMock(return_value=transient)):
+            assert await server._refresh_user_token() is None
+        assert server.token_manager.snapshot.refresh_token == "refresh_1"
+
+@pytest.mark.asyncio
+async def test_background_refresh_retries_after_transient_failure(saved_tokens):
+    """测试后台续期失败后退避重试，而不是放弃刷新令牌"""
+    server.token_manager.set(TokenSnapshot(
+        "access_1", time.time() + server.TOKEN_REFRESH_MARGIN - 1, refresh_token="refresh_1"
+    ))
+    server._refresh_task = None
+    responses = [
+        LarkResponse(503, {"code": 503}),
+        httpx.ConnectError("connection reset"),
+        LarkResponse(200, {"code": 0, "access_token": "access_2", "expires_in": 7200, "refresh_token": "refresh_2"}),
+    ]
+    mock_lark_request = AsyncMock(side_effect=responses)
+
+    with patch("mcp_lark_doc_manage.server.lark_request", mock_lark_request), \
+         patch.object(server, "TOKEN_REFRESH_RETRY_DELAY", 0.01):
+        server._schedule_token_refresh()
+        await asyncio.sleep(0.2)
+
+    assert mock_lark_request.call_count == 3
+    assert server.token_manager.snapshot.access_token == "access_2"
+    assert server.token_manager.snapshot.refresh_token == "refresh_2"
+    assert not server._refresh_task.done()
+
+@pytest.mark.asyncio
+async def test_auth_flow_joins_background_refresh(saved_tokens):
+    """测试后台续期进行中时，工具调用共享该次续期，不重复提交刷新令牌也不打开浏览器"""
+    server.token_manager.set(TokenSnapshot("access_1", time.time() - 1, refresh_token="refresh_1"))
+    server._refresh_task = None
+
+    async def slow_refresh(*args, **kwargs):
+        await asyncio.sleep(0.1)
+        return LarkResponse(200, {"code": 0, "access_token": "access_2", "expires_in": 7200, "refresh_token": "refresh_2"})
+
+    mock_lark_request = AsyncMock(side_effect=slow_refresh)
+    mock_oauth = AsyncMock(return_value="interactive_token")
+
+    with patch("mcp_lark_doc_manage.server.larkClient", MagicMock()), \
+         patch("mcp_lark_doc_manage.server.lark_request", mock_lark_request), \
+         patch("mcp_lark_doc_manage.server._start_oauth_server", mock_oauth):
+        server._schedule_token_refresh()
+        await asyncio.sleep(0.01)
+        token = await server._auth_flow()
+
+    assert token == "access_2"
+    assert mock_lark_request.call_count == 1
+    mock_oauth.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_auth_flow_retries_after_joined_refresh_fails(saved_tokens):
+    """测试加入的后台续期因临时故障失败后，工具调用自行重新获取令牌"""
+    server.token_manager.set(TokenSnapshot("access_1", time.time() - 1, refresh_token="refresh_1"))
+    server._refresh_task = None
+    responses = [
+        LarkResponse(503, {"code": 503}),
+        LarkResponse(200, {"code": 0, "access_token": "access_2", "expires_in": 7200, "refresh_token": "refresh_2"}),
+    ]
+
+    async def slow_refresh(*args, **kwargs):
+        await asyncio.sleep(0.05)
+        return responses.pop(0)
+
+    mock_oauth = AsyncMock(return_value="interactive_token")
+
+    with patch("mcp_lark_doc_manage.server.larkClient", MagicMock()), \
+         patch("mcp_lark_doc_manage.server.lark_request", AsyncMock(side_effect=slow_refresh)), \
+         patch("mcp_lark_doc_manage.server._start_oauth_server", mock_oauth), \
+         patch.object(server, "TOKEN_REFRESH_RETRY_DELAY", 10):
+        server._schedule_token_refresh()
+        await asyncio.sleep(0.01)
+        token = await server._auth_flow()
+
+    assert token == "access_2"
+    mock_oauth.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_background_refresh_renews_before_expiry(saved_tokens):
+    """测试后台任务在令牌过期前完成续期，工具调用无需等待鉴权"""
+    server.token_manager.set(TokenSnapshot(
+        "access_1", time.time() + server.TOKEN_REFRESH_MARGIN + 0.05, refresh_token="refresh_1"
+    ))
+    server._refresh_task = None
+    refresh_response = LarkResponse(200, {
+        "code": 0,
+        "access_token": "access_2",
+        "expires_in": 7200,
+        "refresh_token": "refresh_2"
+    })
+    
+    with patch("mcp_lark_doc_manage.server.lark_request", AsyncMock(return_value=refresh_response)):
+        server._schedule_token_refresh()
+        await asyncio.sleep(0.2)
+    
+    assert server.token_manager.snapshot.access_token == "access_2"
+    assert server.token_manager.snapshot.expires_at > time.time() + 3600
+    # 续期后任务继续等待下一次续期
+    assert not server._refresh_task.done()
+
+@pytest.mark.asyncio
+async def test_acquire_token_prefers_refresh(saved_tokens):
+    """测试获取令牌时优先使用刷新令牌，而不是打开浏览器"""
+    server.token_manager.set(TokenSnapshot())
+    mock_oauth = AsyncMock(return_value="interactive_token")
+    
+    with patch("mcp_lark_doc_manage.server.larkClient", MagicMock()), \
+         patch("mcp_lark_doc_manage.server._refresh_user_token", AsyncMock(return_value="refreshed_token")), \
+         patch("mcp_lark_doc_manage.server._start_oauth_server", mock_oauth):
+        token = await server._auth_flow()
+    
+    assert token == "refreshed_token"
+    mock_oauth.assert_not_called()
+
 @pytest.mark.asyncio
 async def test_start_oauth_server():
     """测试 OAuth 服务器启动"""
     # 保存原始值
-    original_token = server.USER_ACCESS_TOKEN
+    original = server.token_manager.snapshot
     original_ci = os.environ.get('CI')
     original_pytest = os.environ.get('PYTEST_RUNNING')
     
@@ -139,7 +385,7 @@ async def test_start_oauth_server():
     try:
         # 第一部分：测试CI环境下的行为
         # 设置测试环境
-        server.USER_ACCESS_TOKEN = None
+        server.token_manager.set(TokenSnapshot())
         # 设置CI环境变量，模拟CI运行环境
         os.environ['CI'] = 'true'
         os.environ['PYTEST_RUNNING'] = 'true'
@@ -150,7 +396,7 @@ async def test_start_oauth_server():
         # 在CI环境中，应该直接返回模拟token而不启动服务器
         assert token is not None
         assert "mock_oauth_token" in token
-        assert server.USER_ACCESS_TOKEN is not None
+        assert server.token_manager.snapshot.access_token is not None
         
         # 只有在非CI环境下才测试真正的OAuth服务器行为
         # 如果当前在CI环境中运行，跳过后续测试
@@ -160,21 +406,29 @@ async def test_start_oauth_server():
             # 复位环境变量，测试非CI环境
             os.environ.pop('CI', None)
             os.environ.pop('PYTEST_RUNNING', None)
-            server.USER_ACCESS_TOKEN = None
+            server.token_manager.set(TokenSnapshot())
             
             # 模拟环境
+            callback_request = MagicMock()
+            callback_request.query = {"code": "test_auth_code"}
+            token_response = LarkResponse(200, {
+                "code": 0,
+                "access_token": "test_token_from_callback",
+                "expires_in": 7200
+            })
+            
             with patch("mcp_lark_doc_manage.server.web.Application", return_value=mock_app), \
                  patch("mcp_lark_doc_manage.server.web.AppRunner", return_value=mock_runner), \
                  patch("mcp_lark_doc_manage.server.web.TCPSite", return_value=mock_site), \
                  patch("mcp_lark_doc_manage.server.webbrowser.open", mock_webbrowser_open), \
-                 patch("mcp_lark_doc_manage.server.asyncio.sleep", AsyncMock()):
+                 patch("mcp_lark_doc_manage.server.lark_request", AsyncMock(return_value=token_response)):
                 
-                # 模拟设置 token 的任务
+                # 模拟浏览器回调（回调只能在服务器启动后到达）
                 async def set_token_after_delay():
-                    # 模拟短暂延迟后设置 token
-                    server.USER_ACCESS_TOKEN = "test_token_from_callback"
+                    await asyncio.sleep(0.05)
+                    await server._handle_oauth_callback(callback_request)
                 
-                # 立即执行 token 设置任务
+                # 启动回调任务
                 asyncio.create_task(set_token_after_delay())
                 
                 # 使用 asyncio.wait_for 设置超时，避免测试无限等待
@@ -191,7 +445,7 @@ async def test_start_oauth_server():
                 mock_runner.cleanup.assert_called_once()
     finally:
         # 恢复原始值
-        server.USER_ACCESS_TOKEN = original_token
+        server.token_manager.set(original)
         if original_ci is None:
             os.environ.pop('CI', None) if 'CI' in os.environ else None
         else:
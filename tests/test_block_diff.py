@@ -0,0 +1,222 @@
+import pytest
+import os
+import sys
+import copy
+import random
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mcp_lark_doc_manage.block_diff import MARKDOWN_BLOCK_TYPES, diff_blocks, _Tree
+from mcp_lark_doc_manage.markdown_converter import convert_markdown_to_blocks
+from mcp_lark_doc_manage.markdown_renderer import render_markdown
+
+
+def as_document(markdown, doc_id="doc"):
+    """把转换结果模拟成飞书返回的块树：块 ID 换成服务端 ID，根为页面块"""
+    blocks_data = convert_markdown_to_blocks(markdown)
+    rename = {block["block_id"]: f"old-{block['block_id']}" for block in blocks_data["descendants"]}
+    blocks = {doc_id: {"block_id": doc_id, "block_type": 1, "page": {}, "children": [rename[c] for c in blocks_data["children_id"]]}}
+    for block in blocks_data["descendants"]:
+        block = copy.deepcopy(block)
+        block["block_id"] = rename[block["block_id"]]
+        if "children" in block:
+            block["children"] = [rename[c] for c in block["children"]]
+        blocks[block["block_id"]] = block
+    return blocks
+
+
+def apply(document, operations, patches, new_blocks):
+    """按顺序在模拟文档上执行删除、插入与文本更新"""
+    counter = [0]
+
+    def copy_subtree(block_id):
+        counter[0] += 1
+        block = copy.deepcopy(new_blocks[block_id])
+        block["block_id"] = f"ins-{counter[0]}"
+        if "children" in block:
+            block["children"] = [copy_subtree(child) for child in block["children"]]
+        document[block["block_id"]] = block
+        return block["block_id"]
+
+    for operation in operations:
+        children = document[operation["parent_id"]].setdefault("children", [])
+        if operation["op"] == "delete":
+            assert 0 <= operation["start_index"] < operation["end_index"] <= len(children)
+            del children[operation["start_index"]:operation["end_index"]]
+        else:
+            assert 0 <= operation["index"] <= len(children)
+            children[operation["index"]:operation["index"]] = [copy_subtree(c) for c in operation["children_id"]]
+    for patch in patches:
+        block = document[patch["block_id"]]
+        key = next(k for k in block if k not in ("block_id", "block_type", "children"))
+        block[key]["elements"] = patch["elements"]
+
+
+def read_back(blocks, edit=None):
+    """以 markdown 读出飞书块列表（可选修改）后转换，返回 (现有块, 差异)"""
+    document = {block["block_id"]: block for block in blocks}
+    markdown = "".join(render_markdown(blocks))
+    if edit:
+        markdown = edit(markdown)
+    blocks_data = convert_markdown_to_blocks(markdown)
+    new_blocks = {block["block_id"]: block for block in blocks_data["descendants"]}
+    return document, diff_blocks(document, document["doc1"]["children"], new_blocks, blocks_data["children_id"], "doc1")
+
+
+def add_kept_blocks(document, rng):
+    """在顶层随机插入图片、分割线，并把一个块包进高亮块，模拟 Markdown 无法表达的块"""
+    children = document["doc"]["children"]
+    if children:
+        position = rng.randrange(len(children))
+        wrapped = children[position]
+        document["callout"] = {"block_id": "callout", "block_type": 19, "callout": {}, "children": [wrapped]}
+        children[position] = "callout"
+    for number in range(rng.randint(1, 3)):
+        block_id = f"image-{number}"
+        document[block_id] = {"block_id": block_id, "block_type": 27, "image": {"token": block_id}}
+        children.insert(rng.randint(0, len(children)), block_id)
+    document["divider"] = {"block_id": "divider", "block_type": 22, "divider": {}}
+    children.insert(rng.randint(0, len(children)), "divider")
+
+
+def update(old_markdown, new_markdown, rng=None):
+    """计算差异并应用，校验结果与新内容一致且保留的块仍在原处，返回操作与更新"""
+    document = as_document(old_markdown)
+    if rng is not None:
+        add_kept_blocks(document, rng)
+    kept = {block_id for block_id, block in document.items() if block["block_type"] not in MARKDOWN_BLOCK_TYPES | {1}}
+    blocks_data = convert_markdown_to_blocks(new_markdown)
+    new_blocks = {block["block_id"]: block for block in blocks_data["descendants"]}
+    operations, patches = diff_blocks(document, document["doc"]["children"], new_blocks, blocks_data["children_id"], "doc")
+
+    apply(document, operations, patches, new_blocks)
+    result, expected = _Tree(document), _Tree(new_blocks)
+    # 空段落只对应空行，不参与比较
+    assert [result.signature(c) for c in result.children("doc")] == \
+        [expected.signature(item[0]) for item in expected.items(None, blocks_data["children_id"])]
+    assert kept <= {child for block in document.values() for child in block.get("children", [])}
+    return operations, patches
+
+
+def test_unchanged_document_needs_no_requests():
+    """测试内容不变时不产生任何操作"""
+    markdown = "# 标题\n\n正文 **加粗**\n\n- a\n  - b\n\n> 引用\n"
+    assert update(markdown, markdown) == ([], [])
+
+
+@pytest.mark.parametrize("paragraphs", [3, 200])
+def test_markdown_read_back_from_lark_needs_no_requests(lark_document, paragraphs):
+    """测试飞书返回的文档（段落间无空段落，含提及、公式、下划线）以 markdown 读出后原样写回，不产生任何操作"""
+    _, result = read_back(lark_document(paragraphs))
+    assert result == ([], [])
+
+
+def test_editing_paragraph_read_back_from_lark_is_one_patch(lark_document):
+    """测试在读出的 markdown 中修改一段，只更新该段，提及所在的段落不受影响"""
+    document, (operations, patches) = read_back(lark_document(200), lambda markdown: markdown.replace("第 123 段", "第 123 段改"))
+
+    assert operations == []
+    assert [patch["block_id"] for patch in patches] == ["p123"]
+    assert "mention_doc" in document["p0"]["text"]["elements"][1]
+
+
+def test_deleting_blocks_takes_separating_empty_paragraphs_along():
+    """测试删除由 markdown 创建的文档中的段落时，其间的空段落一起删除，不留下连续空行"""
+    document = as_document("第一段\n\n第二段\n\n第三段\n\n第四段\n")
+    blocks_data = convert_markdown_to_blocks("第一段\n\n第四段\n")
+    new_blocks = {block["block_id"]: block for block in blocks_data["descendants"]}
+
+    operations, patches = diff_blocks(document, document["doc"]["children"], new_blocks, blocks_data["children_id"], "doc")
+    apply(document, operations, patches, new_blocks)
+
+    texts = [document[child]["text"]["elements"][0]["text_run"]["content"] for child in document["doc"]["children"]]
+    assert texts == ["第一段", "", "第四段"]
+    assert len(operations) == 1
+
+
+def test_editing_one_paragraph_of_large_document_is_one_patch():
+    """测试两千块文档中修改一段只产生一次文本更新"""
+    paragraphs = [f"### 段落 {i}" for i in range(2000)]
+    old = "\n".join(paragraphs)
+    paragraphs[1234] = "### 修改后的段落"
+    operations, patches = update(old, "\n".join(paragraphs))
+
+    assert operations == []
+    assert len(patches) == 1
+    assert patches[0]["block_id"] == "old-1235"
+
+
+def test_insert_and_delete_touch_only_changed_blocks():
+    """测试插入与删除只涉及变化的块，且索引按顺序有效"""
+    old = "\n".join(f"### 标题 {i}" for i in range(10))
+    new_lines = [f"### 标题 {i}" for i in range(10)]
+    del new_lines[7]
+    new_lines.insert(2, "```python\nprint(1)\n```")
+    operations, patches = update(old, "\n".join(new_lines))
+
+    assert patches == []
+    assert {operation["op"] for operation in operations} == {"insert", "delete"}
+    assert sum(len(op.get("children_id", [])) for op in operations) == 1
+
+
+def test_nested_list_change_is_diffed_in_place():
+    """测试嵌套列表中修改子项时只更新该子项"""
+    old = "# 标题\n\n- a\n  - b\n  - c\n- d\n"
+    new = "# 标题\n\n- a\n  - b\n  - C!\n- d\n"
+    operations, patches = update(old, new)
+
+    assert operations == []
+    assert len(patches) == 1
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_edits_converge(seed):
+    """随机编辑后应用差异，结果与新内容一致"""
+    rng = random.Random(seed)
+    pieces = ["# 标题", "正文", "- 列表\n  - 子项", "> 引用", "```\ncode\n```", "1. 一\n2. 二", "- [ ] 任务"]
+    old = [rng.choice(pieces) + f" {i}" for i in range(15)]
+    new = list(old)
+    for _ in range(rng.randint(1, 6)):
+        action = rng.choice(["insert", "delete", "edit"])
+        position = rng.randrange(len(new))
+        if action == "insert":
+            new.insert(position, rng.choice(pieces) + " 新")
+        elif action == "delete" and len(new) > 1:
+            del new[position]
+        else:
+            new[position] = new[position] + " 改"
+    update("\n\n".join(old), "\n\n".join(new))
+    update("\n\n".join(old), "\n\n".join(new), rng)
+
+
+def test_blocks_markdown_cannot_express_are_kept():
+    """测试图片等块不会因为 Markdown 中没有而被删除，编辑一个词只产生一次文本更新"""
+    document = as_document("第一段\n\n第二段\n")
+    document["img"] = {"block_id": "img", "block_type": 27, "image": {"token": "t"}}
+    document["doc"]["children"].insert(1, "img")
+    blocks_data = convert_markdown_to_blocks("第一段\n\n第二段已修改\n")
+    new_blocks = {block["block_id"]: block for block in blocks_data["descendants"]}
+
+    operations, patches = diff_blocks(document, document["doc"]["children"], new_blocks, blocks_data["children_id"], "doc")
+
+    assert operations == []
+    assert [patch["block_id"] for patch in patches] == [document["doc"]["children"][-1]]
+
+
+def test_table_cell_text_is_diffed_in_place():
+    """测试表格单元格中的文本原地更新，文末追加的内容插入到表格之后而不是单元格内"""
+    document = as_document("开头\n")
+    cell_text = as_document("单元格\n")
+    cell_id = cell_text["doc"]["children"][0]
+    document["cell-text"] = dict(cell_text[cell_id], block_id="cell-text")
+    document["cell"] = {"block_id": "cell", "block_type": 32, "table_cell": {}, "children": ["cell-text"]}
+    document["table"] = {"block_id": "table", "block_type": 31, "table": {}, "children": ["cell"]}
+    document["doc"]["children"].append("table")
+    blocks_data = convert_markdown_to_blocks("开头\n\n单元格改\n\n结尾\n")
+    new_blocks = {block["block_id"]: block for block in blocks_data["descendants"]}
+
+    operations, patches = diff_blocks(document, document["doc"]["children"], new_blocks, blocks_data["children_id"], "doc")
+
+    assert [patch["block_id"] for patch in patches] == ["cell-text"]
+    assert [(op["op"], op["parent_id"], op["index"]) for op in operations] == [("insert", "doc", 2)]
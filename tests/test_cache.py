@@ -0,0 +1,62 @@
+import os
+import sys
+from unittest.mock import patch
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mcp_lark_doc_manage.cache as cache
+from mcp_lark_doc_manage.cache import TTLCache, RevisionCache
+
+
+def test_ttl_cache_expiry():
+    """测试条目过期后不再返回，且支持单条目 TTL"""
+    now = [1000.0]
+    with patch.object(cache.time, "monotonic", lambda: now[0]):
+        store = TTLCache(maxsize=10, ttl=60)
+        store.set("a", 1)
+        store.set("b", None, ttl=5)
+        assert store.get("a") == 1
+        assert "b" in store and store.get("b", "default") is None
+        
+        now[0] += 10
+        assert "b" not in store
+        assert store.get("a") == 1
+        
+        now[0] += 60
+        assert store.get("a", "default") == "default"
+        assert len(store) == 0
+
+
+def test_ttl_cache_lru_eviction():
+    """测试超过容量时淘汰最近最少使用的条目"""
+    store = TTLCache(maxsize=2, ttl=60)
+    store.set("a", 1)
+    store.set("b", 2)
+    store.get("a")
+    store.set("c", 3)
+    assert "a" in store and "c" in store
+    assert "b" not in store
+    
+    store.invalidate("a")
+    assert "a" not in store
+    store.clear()
+    assert len(store) == 0
+
+
+def test_revision_cache():
+    """测试按版本号命中、LRU 淘汰与命中统计"""
+    store = RevisionCache(maxsize=2)
+    store.set("a", 1, "content a")
+    assert store.get("a", 1) == "content a"
+    assert store.get("a", 2) is None
+    
+    store.set("b", 1, "content b")
+    store.get("a", 1)
+    store.set("c", 1, "content c")
+    assert store.get("b", 1) is None
+    assert store.get("c", 1) == "content c"
+    assert store.stats() == {"hits": 3, "misses": 2, "size": 2, "maxsize": 2}
+    
+    store.clear()
+    assert store.stats()["hits"] == 0 and len(store) == 0
@@ -0,0 +1,62 @@
+import os
+import sys
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mcp_lark_doc_manage.local_index import LocalIndex, segment, build_match_query
+
+
+def test_segment_splits_cjk_runs_into_bigrams():
+    """测试中文连续字符被切分为二元组，其他文本保持不变"""
+    assert segment("飞书文档 API").split() == ["飞书", "书文", "文档", "档", "API"]
+    assert build_match_query("飞书 cache") == '"飞书" AND "cache"'
+    assert build_match_query("说") == '"说"*'
+    assert build_match_query('" AND') == '"AND"'
+    assert build_match_query("，。") == ""
+
+
+def test_local_index_search_cjk_and_latin():
+    """测试本地索引支持中文子串、单字与英文检索，并按文档更新"""
+    index = LocalIndex()
+    index.add("d1", "这是飞书文档的使用说明，包含 API 介绍", url="https://docs.feishu.cn/docx/d1", title="使用说明")
+    index.add("d2", "English only document about caching", title="Cache")
+    
+    for query in ["文档", "使用说明", "说", "明", "api", "飞书 API"]:
+        assert [r["document_id"] for r in index.search(query)] == ["d1"], query
+    assert [r["document_id"] for r in index.search("caching")] == ["d2"]
+    assert index.search("不存在") == []
+    
+    result = index.search("介绍")[0]
+    assert result["title"] == "使用说明"
+    assert result["url"] == "https://docs.feishu.cn/docx/d1"
+    assert "介绍" in result["snippet"]
+    
+    # 重新索引同一文档会替换旧内容
+    index.add("d1", "内容已更新")
+    assert index.search("文档") == []
+    assert len(index) == 2
+    index.clear()
+    assert len(index) == 0
+
+
+def test_local_index_persists_to_file(tmp_path):
+    """测试索引文件在重新打开后仍然可用"""
+    path = str(tmp_path / "index.db")
+    index = LocalIndex(path)
+    index.add("d1", "知识库搜索")
+    index.close()
+    
+    assert [r["document_id"] for r in LocalIndex(path).search("搜索")] == ["d1"]
+
+
+def test_local_index_evicts_least_recently_indexed():
+    """测试索引超过上限时淘汰最早索引的文档，重新索引会刷新其位置"""
+    index = LocalIndex(max_documents=2)
+    index.add("d1", "第一篇文档")
+    index.add("d2", "第二篇文档")
+    index.add("d1", "第一篇文档")
+    index.add("d3", "第三篇文档")
+
+    assert len(index) == 2
+    assert sorted(r["document_id"] for r in index.search("文档")) == ["d1", "d3"]
@@ -0,0 +1,97 @@
+import pytest
+import os
+import sys
+import glob
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mcp_lark_doc_manage.markdown_converter import convert_markdown_to_blocks
+from mcp_lark_doc_manage.markdown_renderer import MarkdownRenderer, render_markdown, render_elements
+from mcp_lark_doc_manage.block_diff import _Tree
+
+MARKDOWN_DIR = os.path.join(os.path.dirname(__file__), 'test_data', 'markdown')
+
+
+def lark_blocks(blocks_data, doc_id="doc"):
+    """把转换结果按飞书块列表接口的顺序（先父后子）展开，并补上 parent_id"""
+    by_id = {block['block_id']: block for block in blocks_data['descendants']}
+    blocks = [{"block_id": doc_id, "block_type": 1, "page": {}, "children": blocks_data['children_id']}]
+
+    def walk(block_id, parent_id):
+        block = dict(by_id[block_id], parent_id=parent_id)
+        blocks.append(block)
+        for child in block.get('children', []):
+            walk(child, block_id)
+
+    for child in blocks_data['children_id']:
+        walk(child, doc_id)
+    return blocks
+
+
+def content_signatures(blocks_data):
+    """文档内容的可比较形式，忽略表示空行的空段落"""
+    tree = _Tree({block['block_id']: block for block in blocks_data['descendants']})
+    return [tree.signature(child) for child in blocks_data['children_id'] if tree.signature(child)[1] or tree.signature(child)[2]]
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(MARKDOWN_DIR, '*.md'))), ids=os.path.basename)
+def test_render_round_trips_converter_output(path):
+    """测试渲染结果再次转换后与原块树一致"""
+    with open(path, 'r', encoding='utf-8') as f:
+        blocks_data = convert_markdown_to_blocks(f.read())
+
+    markdown = "".join(render_markdown(lark_blocks(blocks_data)))
+
+    assert content_signatures(convert_markdown_to_blocks(markdown)) == content_signatures(blocks_data)
+
+
+def test_render_structure():
+    """测试标题、嵌套列表、有序编号、代码、引用与行内样式的渲染"""
+    source = (
+        "# 标题\n\n"
+        "正文 **加粗** *斜体* ~~删除~~ `代码` [链接](https://example.com/a b)\n\n"
+        "1. 一\n2. 二\n   1. 二.一\n\n"
+        "- a\n  - b\n\n"
+        "```python\nprint(1)\n```\n\n"
+        "> 引用\n"
+    )
+    markdown = "".join(render_markdown(lark_blocks(convert_markdown_to_blocks(source))))
+
+    assert markdown == (
+        "# 标题\n\n"
+        "正文 **加粗** *斜体* ~~删除~~ `代码` [链接](https://example.com/a b)\n\n"
+        "1. 一\n2. 二\n   1. 二.一\n\n"
+        "- a\n  - b\n\n"
+        "```python\nprint(1)\n```\n\n"
+        "> 引用\n"
+    )
+
+
+def test_renderer_streams_without_tree():
+    """测试逐块输出，且只保留未闭合的祖先块"""
+    source = "\n".join(f"- item {i}\n  - child {i}" for i in range(500))
+    renderer = MarkdownRenderer()
+    chunks = []
+    depth = 0
+    for block in lark_blocks(convert_markdown_to_blocks(source)):
+        chunks.append(renderer.feed(block))
+        depth = max(depth, len(renderer._stack))
+    chunks.append(renderer.close())
+
+    assert depth <= 3
+    assert sum(1 for chunk in chunks if chunk) == 1001
+    assert "".join(chunks).startswith("- item 0\n  - child 0\n- item 1\n")
+
+
+def test_unsupported_blocks_are_marked():
+    """测试没有 Markdown 形式的块输出占位注释，容器块只输出子块"""
+    blocks = [
+        {"block_id": "doc", "block_type": 1, "page": {}},
+        {"block_id": "img", "parent_id": "doc", "block_type": 27, "image": {"token": "t"}},
+        {"block_id": "callout", "parent_id": "doc", "block_type": 19, "callout": {}, "children": ["t1"]},
+        {"block_id": "t1", "parent_id": "callout", "block_type": 2,
+         "text": {"elements": [{"mention_doc": {"title": "文档", "url": "https%3A%2F%2Fx.feishu.cn%2Fdocx%2Fabc"}}]}},
+    ]
+    assert "".join(render_markdown(blocks)) == "<!-- unsupported block type 27 -->\n\n[文档](https://x.feishu.cn/docx/abc)\n"
+    assert render_elements([{"equation": {"content": "E=mc^2\n"}}]) == "$E=mc^2$"
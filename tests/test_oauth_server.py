@@ -2,7 +2,6 @@ import pytest
 import os
 import sys
 import asyncio
-import json
 from unittest.mock import patch, MagicMock, AsyncMock
 from aiohttp import web
 import webbrowser
@@ -12,6 +11,8 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 # 导入测试模块
 import mcp_lark_doc_manage.server as server
+from mcp_lark_doc_manage.transport import LarkResponse
+from mcp_lark_doc_manage.token_manager import TokenSnapshot
 from mcp.types import CallToolResult, TextContent
 
 # 所有测试使用 server_test 标记
@@ -24,42 +25,38 @@ async def test_handle_oauth_callback_success():
     mock_request = MagicMock()
     mock_request.query = {"code": "test_auth_code"}
     
-    # Mock Lark client 请求
-    mock_client = MagicMock()
-    mock_response = MagicMock()
-    mock_response.success.return_value = True
-    mock_response.raw.content = json.dumps({
+    # Mock 令牌交换请求
+    mock_response = LarkResponse(200, {
         "code": 0,
         "access_token": "test_access_token",
         "expires_in": 7200
-    }).encode()
-    
-    # 注意：真实代码中 request 方法返回的是同步结果，而不是协程
-    # 因此这里需要使用 MagicMock 而不是异步函数
-    mock_client.request.return_value = mock_response
+    })
+    mock_lark_request = AsyncMock(return_value=mock_response)
     
     # 保存原始值
-    original_token = server.USER_ACCESS_TOKEN
-    original_expires = server.TOKEN_EXPIRES_AT
+    original = server.token_manager.snapshot
     
     try:
         # 设置测试环境
-        server.USER_ACCESS_TOKEN = None
-        server.TOKEN_EXPIRES_AT = None
+        server.token_manager.set(TokenSnapshot())
         
-        with patch("mcp_lark_doc_manage.server.larkClient", mock_client):
+        with patch("mcp_lark_doc_manage.server.lark_request", mock_lark_request):
             # 执行回调处理
             response = await server._handle_oauth_callback(mock_request)
             
             # 验证结果
             assert response.status == 200
             assert "Authorization successful" in response.text
-            assert server.USER_ACCESS_TOKEN == "test_access_token"
-            assert server.TOKEN_EXPIRES_AT is not None
+            assert server.token_manager.snapshot.access_token == "test_access_token"
+            assert server.token_manager.snapshot.expires_at is not None
+            
+            # 令牌交换通过共享的连接池客户端发送
+            args, kwargs = mock_lark_request.call_args
+            assert args == ("POST", "/open-apis/authen/v2/oauth/token")
+            assert kwargs["body"]["code"] == "test_auth_code"
     finally:
         # 恢复原始值
-        server.USER_ACCESS_TOKEN = original_token
-        server.TOKEN_EXPIRES_AT = original_expires
+        server.token_manager.set(original)
 
 @pytest.mark.asyncio
 async def test_handle_oauth_callback_no_code():
@@ -82,17 +79,10 @@ async def test_handle_oauth_callback_api_error():
     mock_request = MagicMock()
     mock_request.query = {"code": "test_auth_code"}
     
-    # Mock Lark client 请求
-    mock_client = MagicMock()
-    mock_response = MagicMock()
-    mock_response.success.return_value = False
-    mock_response.code = 401
-    mock_response.msg = "Unauthorized"
+    # Mock 令牌交换请求
+    mock_response = LarkResponse(401, {"code": 401, "msg": "Unauthorized"})
     
-    # 设置同步返回值
-    mock_client.request.return_value = mock_response
-    
-    with patch("mcp_lark_doc_manage.server.larkClient", mock_client):
+    with patch("mcp_lark_doc_manage.server.lark_request", AsyncMock(return_value=mock_response)):
         # 执行回调处理
         response = await server._handle_oauth_callback(mock_request)
         
@@ -108,19 +98,13 @@ async def test_handle_oauth_callback_invalid_response():
     mock_request = MagicMock()
     mock_request.query = {"code": "test_auth_code"}
     
-    # Mock Lark client 请求
-    mock_client = MagicMock()
-    mock_response = MagicMock()
-    mock_response.success.return_value = True
-    mock_response.raw.content = json.dumps({
+    # Mock 令牌交换请求
+    mock_response = LarkResponse(400, {
         "code": 1,  # 非 0 表示错误
         "error_description": "Invalid authorization code"
-    }).encode()
-    
-    # 设置同步返回值
-    mock_client.request.return_value = mock_response
+    })
     
-    with patch("mcp_lark_doc_manage.server.larkClient", mock_client):
+    with patch("mcp_lark_doc_manage.server.lark_request", AsyncMock(return_value=mock_response)):
         # 执行回调处理
         response = await server._handle_oauth_callback(mock_request)
         
@@ -133,13 +117,13 @@ async def test_handle_oauth_callback_invalid_response():
 async def test_start_oauth_server_with_mocks():
     """测试 OAuth 服务器启动"""
     # 保存原始值
-    original_token = server.USER_ACCESS_TOKEN
+    original = server.token_manager.snapshot
     original_ci = os.environ.get('CI')
     original_pytest = os.environ.get('PYTEST_RUNNING')
     
     try:
         # 设置测试环境
-        server.USER_ACCESS_TOKEN = None
+        server.token_manager.set(TokenSnapshot())
         
         # 检查是否在CI环境中
         is_ci_env = original_ci is not None or original_pytest is not None
@@ -174,12 +158,21 @@ async def test_start_oauth_server_with_mocks():
                 assert token is not None
                 assert "mock_oauth_token" in token
             else:
-                # 为了避免无限等待，模拟在 2 秒后设置 token
+                # 为了避免无限等待，模拟在短暂延迟后触发回调
+                callback_request = MagicMock()
+                callback_request.query = {"code": "test_auth_code"}
+                token_response = LarkResponse(200, {
+                    "code": 0,
+                    "access_token": "test_token_from_callback",
+                    "expires_in": 7200
+                })
+                
                 async def set_token_after_delay():
-                    await asyncio.sleep(2)
-                    server.USER_ACCESS_TOKEN = "test_token_from_callback"
+                    await asyncio.sleep(0.1)
+                    with patch("mcp_lark_doc_manage.server.lark_request", AsyncMock(return_value=token_response)):
+                        await server._handle_oauth_callback(callback_request)
                 
-                # 启动后台任务来设置 token
+                # 启动后台任务来触发回调
                 task = asyncio.create_task(set_token_after_delay())
                 
                 # 执行函数
@@ -204,7 +197,7 @@ async def test_start_oauth_server_with_mocks():
                 mock_runner.cleanup.assert_called_once()
     finally:
         # 恢复原始值
-        server.USER_ACCESS_TOKEN = original_token
+        server.token_manager.set(original)
         if original_ci is None:
             if 'CI' in os.environ:
                 del os.environ['CI']
@@ -221,13 +214,13 @@ async def test_start_oauth_server_with_mocks():
 async def test_oauth_server_timeout():
     """测试 OAuth 服务器超时"""
     # 保存原始值
-    original_token = server.USER_ACCESS_TOKEN
+    original = server.token_manager.snapshot
     original_ci = os.environ.get('CI')
     original_pytest = os.environ.get('PYTEST_RUNNING')
     
     try:
         # 设置测试环境
-        server.USER_ACCESS_TOKEN = None
+        server.token_manager.set(TokenSnapshot())
         
         # 清除CI环境变量确保测试可以运行
         if 'CI' in os.environ:
@@ -250,17 +243,7 @@ async def test_oauth_server_timeout():
              patch("mcp_lark_doc_manage.server.web.AppRunner", return_value=mock_runner), \
              patch("mcp_lark_doc_manage.server.web.TCPSite", return_value=mock_site), \
              patch("mcp_lark_doc_manage.server.webbrowser.open", MagicMock()), \
-             patch("mcp_lark_doc_manage.server.asyncio.get_event_loop") as mock_loop:
-            
-            # 模拟时间流逝以触发超时
-            start_time = 0
-            
-            def mock_time():
-                nonlocal start_time
-                start_time += 600  # 每次调用增加 10 分钟
-                return start_time
-            
-            mock_loop.return_value.time = mock_time
+             patch("mcp_lark_doc_manage.server.OAUTH_TIMEOUT", 0.1):
             
             # 预期函数会抛出超时异常
             with pytest.raises(TimeoutError) as excinfo:
@@ -273,7 +256,7 @@ async def test_oauth_server_timeout():
             mock_runner.cleanup.assert_called_once()
     finally:
         # 恢复原始值
-        server.USER_ACCESS_TOKEN = original_token
+        server.token_manager.set(original)
         if original_ci is None:
             if 'CI' in os.environ:
                 del os.environ['CI']
@@ -290,13 +273,11 @@ async def test_oauth_server_timeout():
 async def test_run_oauth_flow_with_mocks():
     """使用 mock 测试完整的 OAuth 流程"""
     # 保存原始值
-    original_token = server.USER_ACCESS_TOKEN
-    original_expires = server.TOKEN_EXPIRES_AT
+    original = server.token_manager.snapshot
     
     try:
         # 设置测试环境
-        server.USER_ACCESS_TOKEN = None
-        server.TOKEN_EXPIRES_AT = None
+        server.token_manager.set(TokenSnapshot())
         
         # 模拟 _start_oauth_server 直接返回访问令牌
         mock_access_token = "test_access_token"
@@ -312,5 +293,84 @@ async def test_run_oauth_flow_with_mocks():
             server._start_oauth_server.assert_called_once()
     finally:
         # 恢复原始值
-        server.USER_ACCESS_TOKEN = original_token
-        server.TOKEN_EXPIRES_AT = original_expires 
\ No newline at end of file
+        server.token_manager.set(original)
+def _free_port():
+    """获取一个可用的本地端口"""
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+@pytest.mark.asyncio
+async def test_oauth_callback_wakes_flow_immediately():
+    """使用本地回调测试授权流程被事件驱动唤醒，而不是轮询等待"""
+    import time
+    import httpx
+    
+    port = _free_port()
+    token_response = LarkResponse(200, {
+        "code": 0,
+        "access_token": "event_driven_token",
+        "expires_in": 7200
+    })
+    original = server.token_manager.snapshot
+    
+    try:
+        with patch.dict(os.environ, {}, clear=False), \
+             patch("mcp_lark_doc_manage.server.OAUTH_PORT", port), \
+             patch("mcp_lark_doc_manage.server.webbrowser.open", MagicMock()), \
+             patch("mcp_lark_doc_manage.server.lark_request", AsyncMock(return_value=token_response)):
+            os.environ.pop('CI', None)
+            os.environ.pop('PYTEST_RUNNING', None)
+            
+            flow = asyncio.create_task(server._start_oauth_server())
+            # 等待回调服务器就绪
+            while server._oauth_waiter is None:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.05)
+            
+            async with httpx.AsyncClient() as client:
+                response = await client.get(f"http://localhost:{port}/oauth/callback", params={"code": "abc"})
+            callback_done = time.monotonic()
+            token = await asyncio.wait_for(flow, timeout=5)
+            latency = time.monotonic() - callback_done
+        
+        assert response.status_code == 200
+        assert token == "event_driven_token"
+        # 轮询实现最多会多等待 1 秒
+        assert latency < 0.2
+        assert server._oauth_waiter is None
+    finally:
+        server.token_manager.set(original)
+
+@pytest.mark.asyncio
+async def test_oauth_callback_denied_fails_fast():
+    """测试用户拒绝授权时流程立即失败，而不是等待超时"""
+    mock_app = MagicMock()
+    mock_runner = MagicMock()
+    mock_runner.setup = AsyncMock()
+    mock_runner.cleanup = AsyncMock()
+    mock_site = MagicMock()
+    mock_site.start = AsyncMock()
+    denied_request = MagicMock()
+    denied_request.query = {"error": "access_denied"}
+    
+    with patch.dict(os.environ, {}, clear=False), \
+         patch("mcp_lark_doc_manage.server.web.Application", return_value=mock_app), \
+         patch("mcp_lark_doc_manage.server.web.AppRunner", return_value=mock_runner), \
+         patch("mcp_lark_doc_manage.server.web.TCPSite", return_value=mock_site), \
+         patch("mcp_lark_doc_manage.server.webbrowser.open", MagicMock()):
+        os.environ.pop('CI', None)
+        os.environ.pop('PYTEST_RUNNING', None)
+        
+        flow = asyncio.create_task(server._start_oauth_server())
+        while server._oauth_waiter is None:
+            await asyncio.sleep(0.01)
+        response = await server._handle_oauth_callback(denied_request)
+        
+        with pytest.raises(Exception) as excinfo:
+            await asyncio.wait_for(flow, timeout=1)
+    
+    assert response.status == 400
+    assert "access_denied" in str(excinfo.value)
+    mock_runner.cleanup.assert_called_once()
@@ -19,6 +19,7 @@ from mcp_lark_doc_manage.server import (
     get_folder_token,
     _check_token_expired
 )
+from mcp_lark_doc_manage.token_manager import TokenManager, TokenSnapshot
 
 # 验证各种工具功能的格式和接口
 def test_tool_interface_verification():
@@ -103,19 +104,18 @@ async def test_get_folder_token():
 async def test_check_token_expired():
     """Test check_token_expired function"""
     # Test with no token (expired)
-    with patch("mcp_lark_doc_manage.server.USER_ACCESS_TOKEN", None), \
-         patch("mcp_lark_doc_manage.server.TOKEN_EXPIRES_AT", None):
+    with patch("mcp_lark_doc_manage.server.token_manager", TokenManager()):
         expired = await _check_token_expired()
         assert expired is True
     
     # Test with expired token (time in past)
-    with patch("mcp_lark_doc_manage.server.USER_ACCESS_TOKEN", "test_token"), \
-         patch("mcp_lark_doc_manage.server.TOKEN_EXPIRES_AT", 100):  # Very old timestamp
+    with patch("mcp_lark_doc_manage.server.token_manager",
+               TokenManager(TokenSnapshot("test_token", 100))):  # Very old timestamp
         expired = await _check_token_expired()
         assert expired is True
     
     # Test with valid token (time in future)
-    with patch("mcp_lark_doc_manage.server.USER_ACCESS_TOKEN", "test_token"), \
-         patch("mcp_lark_doc_manage.server.TOKEN_EXPIRES_AT", 9999999999):  # Future timestamp
+    with patch("mcp_lark_doc_manage.server.token_manager",
+               TokenManager(TokenSnapshot("test_token", 9999999999))):  # Future timestamp
         expired = await _check_token_expired()
         assert expired is False
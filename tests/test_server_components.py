@@ -14,6 +14,8 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 # 导入测试模块
 import mcp_lark_doc_manage.server as server
+from mcp_lark_doc_manage.transport import LarkResponse
+from mcp_lark_doc_manage.token_manager import TokenManager, TokenSnapshot
 from mcp.types import CallToolResult, TextContent
 
 # 设置测试环境变量
@@ -31,38 +33,32 @@ async def test_check_token_expired_branches():
     """测试令牌过期检查的各种分支"""
     # 测试各种条件分支，避免嵌套 lock
     # 保存原始值以便后续恢复
-    original_token = server.USER_ACCESS_TOKEN
-    original_expires = server.TOKEN_EXPIRES_AT
+    original = server.token_manager.snapshot
     
     try:
-        # 通过打补丁的方式模拟 _check_token_expired 函数，避免使用实际的 token_lock
-        with patch("mcp_lark_doc_manage.server.token_lock", asyncio.Lock()):
-            # 测试无令牌情况
-            server.USER_ACCESS_TOKEN = None
-            server.TOKEN_EXPIRES_AT = None
-            # 使用 wait_for 设置超时，避免测试无限等待
-            result = await asyncio.wait_for(server._check_token_expired(), timeout=1)
-            assert result is True
-            
-            # 测试有令牌但无过期时间情况
-            server.USER_ACCESS_TOKEN = "test_token"
-            server.TOKEN_EXPIRES_AT = None
-            result = await asyncio.wait_for(server._check_token_expired(), timeout=1)
-            assert result is True
-            
-            # 测试令牌即将过期情况 (提前60秒视为过期)
-            server.TOKEN_EXPIRES_AT = time.time() + 30  # 30秒后过期
-            result = await asyncio.wait_for(server._check_token_expired(), timeout=1)
-            assert result is True
-            
-            # 测试有效令牌情况
-            server.TOKEN_EXPIRES_AT = time.time() + 3600  # 1小时后过期
-            result = await asyncio.wait_for(server._check_token_expired(), timeout=1)
-            assert result is False
+        # 测试无令牌情况
+        server.token_manager.set(TokenSnapshot())
+        # 使用 wait_for 设置超时，避免测试无限等待
+        result = await asyncio.wait_for(server._check_token_expired(), timeout=1)
+        assert result is True
+        
+        # 测试有令牌但无过期时间情况
+        server.token_manager.set(TokenSnapshot("test_token", None))
+        result = await asyncio.wait_for(server._check_token_expired(), timeout=1)
+        assert result is True
+        
+        # 测试令牌即将过期情况 (提前60秒视为过期)
+        server.token_manager.update(expires_at=time.time() + 30)  # 30秒后过期
+        result = await asyncio.wait_for(server._check_token_expired(), timeout=1)
+        assert result is True
+        
+        # 测试有效令牌情况
+        server.token_manager.update(expires_at=time.time() + 3600)  # 1小时后过期
+        result = await asyncio.wait_for(server._check_token_expired(), timeout=1)
+        assert result is False
     finally:
         # 恢复原始值
-        server.USER_ACCESS_TOKEN = original_token
-        server.TOKEN_EXPIRES_AT = original_expires
+        server.token_manager.set(original)
 
 @pytest.mark.asyncio
 async def test_get_folder_token_logic():
@@ -686,37 +682,19 @@ async def test_handle_oauth_callback():
     mock_request = MagicMock()
     mock_request.query = {"code": "test_auth_code"}
     
-    # 模拟lark客户端响应
-    class MockResponse:
-        def __init__(self):
-            self.raw = MagicMock()
-            self.raw.content = json.dumps({
-                "code": 0,
-                "access_token": "test_access_token",
-                "expires_in": 7200
-            }).encode('utf-8')
-            self.code = 0
-            self.msg = "Success"
-        
-        def success(self):
-            return True
+    # 模拟令牌交换响应
+    mock_response = LarkResponse(200, {
+        "code": 0,
+        "access_token": "test_access_token",
+        "expires_in": 7200
+    })
     
     # 保存原始TOKEN值
-    original_user_token = server.USER_ACCESS_TOKEN
-    original_expires_at = server.TOKEN_EXPIRES_AT
+    original = server.token_manager.snapshot
     
     try:
-        # 创建不会返回协程的请求函数
-        def mock_request_func(*args, **kwargs):
-            return MockResponse()
-        
-        # 模拟larkClient
-        mock_client = MagicMock()
-        mock_client.request = mock_request_func
-        
         # 使用补丁
-        with patch("mcp_lark_doc_manage.server.larkClient", mock_client), \
-             patch("mcp_lark_doc_manage.server.token_lock", asyncio.Lock()):
+        with patch("mcp_lark_doc_manage.server.lark_request", AsyncMock(return_value=mock_response)):
             
             # 调用原始函数
             response = await original_handle_oauth_callback(mock_request)
@@ -726,13 +704,12 @@ async def test_handle_oauth_callback():
             assert "Authorization successful" in response.text
             
             # 验证token已被设置
-            assert server.USER_ACCESS_TOKEN == "test_access_token"
-            assert server.TOKEN_EXPIRES_AT is not None
+            assert server.token_manager.snapshot.access_token == "test_access_token"
+            assert server.token_manager.snapshot.expires_at is not None
     
     finally:
         # 恢复原始值
-        server.USER_ACCESS_TOKEN = original_user_token
-        server.TOKEN_EXPIRES_AT = original_expires_at
+        server.token_manager.set(original)
 
 @pytest.mark.asyncio
 async def test_handle_oauth_callback_error_paths():
@@ -748,34 +725,17 @@ async def test_handle_oauth_callback_error_paths():
     mock_request_client_none = MagicMock()
     mock_request_client_none.query = {"code": "test_auth_code"}
 
-    # 模拟API错误响应类
-    class MockErrorResponse:
-        def __init__(self):
-            self.code = 400
-            self.msg = "Bad Request"
-        
-        def success(self):
-            return False
+    # 模拟API错误响应
+    error_response = LarkResponse(400, {"code": 400, "msg": "Bad Request"})
     
-    # 模拟空响应类
-    class MockEmptyResponse:
-        def __init__(self):
-            self.raw = None
-        
-        def success(self):
-            return True
+    # 模拟空响应（非 JSON 响应体）
+    empty_response = LarkResponse(200, {"code": -1, "msg": "HTTP 200: "})
     
-    # 模拟API错误的JSON响应类
-    class MockApiErrorResponse:
-        def __init__(self):
-            self.raw = MagicMock()
-            self.raw.content = json.dumps({
-                "code": 99999,
-                "error_description": "API Error"
-            }).encode('utf-8')
-        
-        def success(self):
-            return True
+    # 模拟API错误的JSON响应
+    api_error_response = LarkResponse(400, {
+        "code": 99999,
+        "error_description": "API Error"
+    })
 
     try:
         # 测试无code参数情况
@@ -790,36 +750,19 @@ async def test_handle_oauth_callback_error_paths():
             assert "Lark client not initialized" in response.text
 
         # 测试API错误响应
-        # 创建不会返回协程的请求函数
-        def mock_error_request(*args, **kwargs):
-            return MockErrorResponse()
-        
-        mock_client = MagicMock()
-        mock_client.request = mock_error_request
-        
-        with patch("mcp_lark_doc_manage.server.larkClient", mock_client):
+        with patch("mcp_lark_doc_manage.server.lark_request", AsyncMock(return_value=error_response)):
             response = await original_handle_oauth_callback(mock_request_client_none)
             assert response.status == 500
             assert "Failed to get token" in response.text
 
         # 测试空响应
-        def mock_empty_request(*args, **kwargs):
-            return MockEmptyResponse()
-        
-        mock_client.request = mock_empty_request
-        
-        with patch("mcp_lark_doc_manage.server.larkClient", mock_client):
+        with patch("mcp_lark_doc_manage.server.lark_request", AsyncMock(return_value=empty_response)):
             response = await original_handle_oauth_callback(mock_request_client_none)
             assert response.status == 500
-            assert "Empty response from server" in response.text
+            assert "Failed to get token" in response.text
 
         # 测试API错误的JSON响应
-        def mock_api_error_request(*args, **kwargs):
-            return MockApiErrorResponse()
-        
-        mock_client.request = mock_api_error_request
-        
-        with patch("mcp_lark_doc_manage.server.larkClient", mock_client):
+        with patch("mcp_lark_doc_manage.server.lark_request", AsyncMock(return_value=api_error_response)):
             response = await original_handle_oauth_callback(mock_request_client_none)
             assert response.status == 500
             assert "Failed to get token" in response.text
@@ -833,7 +776,7 @@ async def test_start_oauth_server():
     """测试OAuth服务器启动过程"""
     # 保存原始函数引用
     original_start_oauth_server = server._start_oauth_server
-    original_user_token = server.USER_ACCESS_TOKEN
+    original = server.token_manager.snapshot
     
     # 创建模拟对象
     mock_app = MagicMock()
@@ -848,8 +791,7 @@ async def test_start_oauth_server():
     # 创建一个简化版的_start_oauth_server实现，返回测试token
     async def mock_oauth_server_impl():
         # 设置token并立即返回，不等待
-        async with server.token_lock:
-            server.USER_ACCESS_TOKEN = "test_oauth_token"
+        server.token_manager.update(access_token="test_oauth_token")
         return "test_oauth_token"
     
     try:
@@ -861,16 +803,15 @@ async def test_start_oauth_server():
              patch("mcp_lark_doc_manage.server.web.Application", return_value=mock_app), \
              patch("mcp_lark_doc_manage.server.web.AppRunner", return_value=mock_runner), \
              patch("mcp_lark_doc_manage.server.web.TCPSite", return_value=mock_site), \
-             patch("mcp_lark_doc_manage.server.webbrowser.open", return_value=None), \
-             patch("mcp_lark_doc_manage.server.token_lock", asyncio.Lock()):
+             patch("mcp_lark_doc_manage.server.webbrowser.open", return_value=None):
             
             # 测试auth_flow调用
-            server.USER_ACCESS_TOKEN = None
+            server.token_manager.set(TokenSnapshot())
             result = await server._auth_flow()
             
             # 验证结果
             assert result == "test_oauth_token"
-            assert server.USER_ACCESS_TOKEN == "test_oauth_token"
+            assert server.token_manager.snapshot.access_token == "test_oauth_token"
             
             # 验证_start_oauth_server被调用
             server._start_oauth_server.assert_called_once()
@@ -878,14 +819,14 @@ async def test_start_oauth_server():
     finally:
         # 恢复原始函数和值
         server._start_oauth_server = original_start_oauth_server
-        server.USER_ACCESS_TOKEN = original_user_token
+        server.token_manager.set(original)
 
 @pytest.mark.asyncio
 async def test_auth_flow_error_paths():
     """测试认证流程的错误路径"""
     # 保存原始函数和值
     original_auth_flow = server._auth_flow
-    original_user_token = server.USER_ACCESS_TOKEN
+    original = server.token_manager.snapshot
     
     # 模拟客户端未初始化情况
     async def mock_auth_flow_client_none():
@@ -897,10 +838,9 @@ async def test_auth_flow_error_paths():
     
     try:
         # 模拟客户端为None的情况
-        with patch("mcp_lark_doc_manage.server.larkClient", None), \
-             patch("mcp_lark_doc_manage.server.token_lock", asyncio.Lock()):
+        with patch("mcp_lark_doc_manage.server.larkClient", None):
             server._auth_flow = AsyncMock(side_effect=mock_auth_flow_client_none)
-            server.USER_ACCESS_TOKEN = None
+            server.token_manager.set(TokenSnapshot())
             
             with pytest.raises(Exception) as excinfo:
                 await server._auth_flow()
@@ -908,8 +848,7 @@ async def test_auth_flow_error_paths():
         
         # 模拟OAuth服务器异常
         with patch("mcp_lark_doc_manage.server.larkClient", MagicMock()), \
-             patch("mcp_lark_doc_manage.server._start_oauth_server", AsyncMock(return_value=None)), \
-             patch("mcp_lark_doc_manage.server.token_lock", asyncio.Lock()):
+             patch("mcp_lark_doc_manage.server._start_oauth_server", AsyncMock(return_value=None)):
             server._auth_flow = AsyncMock(side_effect=mock_auth_flow_oauth_error)
             
             with pytest.raises(Exception) as excinfo:
@@ -919,7 +858,7 @@ async def test_auth_flow_error_paths():
     finally:
         # 恢复原始函数和值
         server._auth_flow = original_auth_flow
-        server.USER_ACCESS_TOKEN = original_user_token
+        server.token_manager.set(original)
 
 @pytest.mark.asyncio
 async def test_get_lark_doc_content_success():
@@ -967,8 +906,7 @@ async def test_get_lark_doc_content_success():
         
         with patch("mcp_lark_doc_manage.server.larkClient", mock_client), \
              patch("mcp_lark_doc_manage.server._check_token_expired", AsyncMock(return_value=False)), \
-             patch("mcp_lark_doc_manage.server.token_lock", asyncio.Lock()), \
-             patch("mcp_lark_doc_manage.server.USER_ACCESS_TOKEN", "test_token"):
+             patch("mcp_lark_doc_manage.server.token_manager", TokenManager(TokenSnapshot("test_token", time.time() + 3600))):
             
             # 调用函数
             result = await async_mock_get_content("https://docs.feishu.cn/docx/doxcnTestDocId")
@@ -1227,8 +1165,7 @@ async def test_create_doc_with_folder_token_none():
         with patch("mcp_lark_doc_manage.server.get_folder_token", AsyncMock(return_value=None)), \
              patch("mcp_lark_doc_manage.server._check_token_expired", AsyncMock(return_value=False)), \
              patch("mcp_lark_doc_manage.server.larkClient", MagicMock()), \
-             patch("mcp_lark_doc_manage.server.token_lock", asyncio.Lock()), \
-             patch("mcp_lark_doc_manage.server.USER_ACCESS_TOKEN", "test_token"):
+             patch("mcp_lark_doc_manage.server.token_manager", TokenManager(TokenSnapshot("test_token", time.time() + 3600))):
             
             # 调用测试函数
             result = await server.create_doc("测试文档")
@@ -1293,8 +1230,7 @@ async def test_create_doc_move_to_wiki_exception():
         with patch("mcp_lark_doc_manage.server.larkClient", mock_client), \
              patch("mcp_lark_doc_manage.server.get_folder_token", AsyncMock(return_value="test_folder")), \
              patch("mcp_lark_doc_manage.server._check_token_expired", AsyncMock(return_value=False)), \
-             patch("mcp_lark_doc_manage.server.token_lock", asyncio.Lock()), \
-             patch("mcp_lark_doc_manage.server.USER_ACCESS_TOKEN", "test_token"):
+             patch("mcp_lark_doc_manage.server.token_manager", TokenManager(TokenSnapshot("test_token", time.time() + 3600))):
             
             # 调用测试函数，指定wiki空间ID触发移动操作
             result = await server.create_doc("测试文档", target_space_id="wiki_space_123")
@@ -1333,8 +1269,7 @@ async def test_create_doc_invalid_blocks_structure():
              patch("mcp_lark_doc_manage.server.larkClient", MagicMock()), \
              patch("mcp_lark_doc_manage.server.get_folder_token", AsyncMock(return_value="test_folder")), \
              patch("mcp_lark_doc_manage.server._check_token_expired", AsyncMock(return_value=False)), \
-             patch("mcp_lark_doc_manage.server.token_lock", asyncio.Lock()), \
-             patch("mcp_lark_doc_manage.server.USER_ACCESS_TOKEN", "test_token"):
+             patch("mcp_lark_doc_manage.server.token_manager", TokenManager(TokenSnapshot("test_token", time.time() + 3600))):
             
             # 调用测试函数，提供Markdown内容
             result = await server.create_doc("测试文档", "# 标题\n\n内容")
@@ -1409,8 +1344,7 @@ async def test_create_doc_blocks_error():
              patch("mcp_lark_doc_manage.server.convert_markdown_to_blocks", return_value=valid_blocks), \
              patch("mcp_lark_doc_manage.server.get_folder_token", AsyncMock(return_value="test_folder")), \
              patch("mcp_lark_doc_manage.server._check_token_expired", AsyncMock(return_value=False)), \
-             patch("mcp_lark_doc_manage.server.token_lock", asyncio.Lock()), \
-             patch("mcp_lark_doc_manage.server.USER_ACCESS_TOKEN", "test_token"):
+             patch("mcp_lark_doc_manage.server.token_manager", TokenManager(TokenSnapshot("test_token", time.time() + 3600))):
             
             # 调用测试函数，提供Markdown内容
             result = await server.create_doc("测试文档", "# 标题\n\n内容")
@@ -4,6 +4,7 @@ import time
 import os
 from unittest.mock import patch, MagicMock
 import mcp_lark_doc_manage.server as server
+from mcp_lark_doc_manage.token_manager import TokenSnapshot
 from mcp.types import TextContent
 
 # Skip these tests if AsyncMock is not available
@@ -30,28 +31,23 @@ def test_server_constants():
 async def test_check_token_expired():
     """Test token expiration checking"""
     # Save original values
-    original_token = server.USER_ACCESS_TOKEN
-    original_expires = server.TOKEN_EXPIRES_AT
+    original = server.token_manager.snapshot
     
     try:
         # Test with no token
-        server.USER_ACCESS_TOKEN = None
-        server.TOKEN_EXPIRES_AT = None
+        server.token_manager.set(TokenSnapshot())
         assert await server._check_token_expired() is True
         
         # Test with expired token
-        server.USER_ACCESS_TOKEN = "test_token"
-        server.TOKEN_EXPIRES_AT = time.time() - 100  # Expired 100 seconds ago
+        server.token_manager.set(TokenSnapshot("test_token", time.time() - 100))  # Expired 100 seconds ago
         assert await server._check_token_expired() is True
         
         # Test with valid token
-        server.USER_ACCESS_TOKEN = "test_token"
-        server.TOKEN_EXPIRES_AT = time.time() + 3600  # Valid for next hour
+        server.token_manager.set(TokenSnapshot("test_token", time.time() + 3600))  # Valid for next hour
         assert await server._check_token_expired() is False
     finally:
         # Restore values
-        server.USER_ACCESS_TOKEN = original_token
-        server.TOKEN_EXPIRES_AT = original_expires
+        server.token_manager.set(original)
 
 @pytest.mark.skipif(not HAS_ASYNC_MOCK, reason="AsyncMock not available")
 @pytest.mark.asyncio
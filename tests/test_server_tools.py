@@ -0,0 +1,609 @@
+import pytest
+import os
+import sys
+import json
+import time
+import asyncio
+from unittest.mock import patch
+
+import httpx
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mcp_lark_doc_manage.server as server
+import mcp_lark_doc_manage.transport as transport
+from mcp_lark_doc_manage.local_index import LocalIndex
+
+# 所有测试使用 server_test 标记
+pytestmark = pytest.mark.server_test
+
+
+@pytest.mark.asyncio
+async def test_get_lark_doc_content_resolves_wiki_node(make_client, logged_in):
+    """测试 Wiki 文档通过节点信息解析真实文档 ID"""
+    paths = []
+
+    def handler(request: httpx.Request):
+        paths.append(request.url.path)
+        if request.url.path == "/open-apis/wiki/v2/spaces/get_node":
+            assert request.url.params["token"] == "wikiToken"
+            return httpx.Response(200, json={"code": 0, "data": {"node": {"obj_token": "realDoc", "obj_type": "docx"}}})
+        return httpx.Response(200, json={"code": 0, "data": {"content": "wiki body"}})
+
+    async with make_client(handler) as client:
+        with patch.object(transport, "_http_client", client):
+            result = await server.get_lark_doc_content("https://docs.feishu.cn/wiki/wikiToken")
+
+    assert result.isError is False
+    assert result.content[0].text == "wiki body"
+    assert paths == [
+        "/open-apis/wiki/v2/spaces/get_node",
+        "/open-apis/docx/v1/documents/realDoc",
+        "/open-apis/docx/v1/documents/realDoc/raw_content",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_wiki_node_resolution_is_cached(make_client, logged_in):
+    """测试 Wiki 节点解析结果被缓存，重复读取不再请求 get_node"""
+    paths = []
+
+    def handler(request: httpx.Request):
+        paths.append(request.url.path)
+        if request.url.path == "/open-apis/wiki/v2/spaces/get_node":
+            return httpx.Response(200, json={"code": 0, "data": {"node": {"obj_token": "realDoc", "obj_type": "docx"}}})
+        return httpx.Response(200, json={"code": 0, "data": {"content": "wiki body"}})
+
+    async with make_client(handler) as client:
+        with patch.object(transport, "_http_client", client):
+            for _ in range(3):
+                result = await server.get_lark_doc_content("https://docs.feishu.cn/wiki/wikiToken")
+                assert result.content[0].text == "wiki body"
+
+    assert paths.count("/open-apis/wiki/v2/spaces/get_node") == 1
+    assert paths.count("/open-apis/docx/v1/documents/realDoc/raw_content") == 3
+
+
+@pytest.mark.asyncio
+async def test_missing_wiki_node_is_negatively_cached(make_client):
+    """测试不存在的 Wiki 节点被短期缓存，而权限等其他错误不缓存"""
+    calls = {"missing": 0, "forbidden": 0}
+
+    def handler(request: httpx.Request):
+        token = request.url.params["token"]
+        calls[token] += 1
+        if token == "missing":
+            return httpx.Response(200, json={"code": 131005, "msg": "not found"})
+        return httpx.Response(403, json={"code": 131006, "msg": "permission denied"})
+
+    async with make_client(handler) as client:
+        with patch.object(transport, "_http_client", client):
+            for _ in range(2):
+                node, error = await server._resolve_wiki_node("missing", "test_token")
+                assert node is None and "131005" in error
+                node, error = await server._resolve_wiki_node("forbidden", "test_token")
+                assert node is None and "131006" in error
+
+            with patch.object(server, "WIKI_NODE_NEGATIVE_TTL", 0):
+                server.wiki_node_cache.clear()
+                await server._resolve_wiki_node("missing", "test_token")
+                await server._resolve_wiki_node("missing", "test_token")
+
+    assert calls == {"missing": 3, "forbidden": 2}
+
+
+@pytest.mark.asyncio
+async def test_document_content_cache_revalidates_by_revision(make_client, logged_in):
+    """测试文档内容按版本号缓存：版本未变时不重新下载，版本变化后重新下载"""
+    state = {"revision": 1, "downloads": 0}
+
+    def handler(request: httpx.Request):
+        if request.url.path == "/open-apis/docx/v1/documents/doc1":
+            return httpx.Response(200, json={"code": 0, "data": {"document": {"document_id": "doc1", "revision_id": state["revision"]}}})
+        state["downloads"] += 1
+        return httpx.Response(200, json={"code": 0, "data": {"content": f"revision {state['revision']}"}})
+
+    async with make_client(handler) as client:
+        with patch.object(transport, "_http_client", client):
+            first = await server.get_lark_doc_content("https://docs.feishu.cn/docx/doc1")
+            second = await server.get_lark_doc_content("https://docs.feishu.cn/docx/doc1")
+            assert state["downloads"] == 1
+            assert second.content[0].text == first.content[0].text == "revision 1"
+
+            state["revision"] = 2
+            third = await server.get_lark_doc_content("https://docs.feishu.cn/docx/doc1")
+
+    assert third.content[0].text == "revision 2"
+    assert state["downloads"] == 2
+    assert server.doc_content_cache.stats() == {"hits": 1, "misses": 2, "size": 1, "maxsize": server.DOC_CONTENT_CACHE_SIZE}
+
+
+@pytest.mark.asyncio
+async def test_get_lark_doc_contents_batch(make_client, logged_in):
+    """测试批量获取文档：并发受限、逐个返回结果，单个失败不影响其他文档"""
+    in_flight = 0
+    peak = 0
+
+    async def handler(request: httpx.Request):
+        nonlocal in_flight, peak
+        if not request.url.path.endswith("/raw_content"):
+            return httpx.Response(200, json={"code": 0, "data": {"document": {"revision_id": 1}}})
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        if "/bad/" in request.url.path:
+            return httpx.Response(403, json={"code": 1770032, "msg": "forbidden"})
+        return httpx.Response(200, json={"code": 0, "data": {"content": request.url.path.split("/")[-2]}})
+
+    urls = [f"https://docs.feishu.cn/docx/doc{i}" for i in range(6)]
+    urls += ["https://docs.feishu.cn/docx/bad", "not a url", urls[0]]
+
+    async with make_client(handler) as client:
+        with patch.object(transport, "_http_client", client):
+            result = await server.get_lark_doc_contents(urls, max_concurrency=2)
+
+    assert result.isError is False
+    items = json.loads(result.content[0].text)
+    assert [item["url"] for item in items] == urls
+    assert [item.get("content") for item in items[:6]] == [f"doc{i}" for i in range(6)]
+    assert "Failed to get document content" in items[6]["error"]
+    assert items[7]["error"] == "Invalid Lark document URL format"
+    assert items[8] == items[0]
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_list_folder_content_walks_all_pages(make_client, folder_pages_handler, logged_in):
+    """测试列出文件夹时跟随分页，返回所有文件"""
+    pages = []
+    async with make_client(folder_pages_handler(7, pages)) as client:
+        with patch.object(transport, "_http_client", client):
+            result = await server.list_folder_content(page_size=3)
+
+    assert result.isError is False
+    names = [item["name"] for item in json.loads(result.content[0].text)]
+    assert names == [f"file{i}" for i in range(7)]
+    assert pages == [0, 3, 6]
+    # 全部列出时不返回续传游标
+    assert len(result.content) == 1
+
+
+@pytest.mark.asyncio
+async def test_list_folder_content_limit_and_cursor(make_client, folder_pages_handler, logged_in):
+    """测试 limit 提前结束时返回游标，且可以从页中间继续"""
+    async with make_client(folder_pages_handler(7)) as client:
+        with patch.object(transport, "_http_client", client):
+            collected = []
+            cursor = None
+            while True:
+                result = await server.list_folder_content(page_size=3, limit=2, cursor=cursor)
+                collected += [item["name"] for item in json.loads(result.content[0].text)]
+                if len(result.content) == 1:
+                    break
+                cursor = json.loads(result.content[1].text)["next_cursor"]
+
+            invalid = await server.list_folder_content(cursor="not-a-cursor")
+
+    assert collected == [f"file{i}" for i in range(7)]
+    assert invalid.isError is True
+    assert "Invalid cursor" in invalid.content[0].text
+
+
+@pytest.mark.asyncio
+async def test_list_folder_tree_crawls_concurrently(make_client, logged_in):
+    """测试递归列出文件夹树：并发受限、深度限制、类型过滤与嵌套输出"""
+    folders = {
+        "root": [{"name": "a", "type": "folder", "token": "fa"}, {"name": "b", "type": "folder", "token": "fb"},
+                 {"name": "readme", "type": "docx", "token": "d0"}],
+        "fa": [{"name": "deep", "type": "folder", "token": "fdeep"}, {"name": "sheet", "type": "sheet", "token": "s1"}],
+        "fb": [{"name": "doc", "type": "docx", "token": "d1"}],
+        "fdeep": [{"name": "hidden", "type": "docx", "token": "d2"}],
+    }
+    in_flight = 0
+    peak = 0
+
+    async def handler(request: httpx.Request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        token = request.url.params["folder_token"]
+        if token == "fb":
+            return httpx.Response(403, json={"code": 1061004, "msg": "forbidden"})
+        return httpx.Response(200, json={"code": 0, "data": {"files": folders[token], "has_more": False}})
+
+    async with make_client(handler) as client:
+        with patch.object(transport, "_http_client", client):
+            flat = await server.list_folder_tree("root", max_depth=2, types=["docx", "sheet"], max_concurrency=1)
+            flat_peak = peak
+            nested = await server.list_folder_tree("root", max_depth=3, nested=True)
+
+    flat_result = json.loads(flat.content[0].text)
+    assert [item["path"] for item in flat_result["items"]] == ["/a/sheet", "/readme"]
+    assert flat_result["errors"][0]["path"] == "/b"
+    assert flat_peak == 1
+
+    tree = json.loads(nested.content[0].text)["items"]
+    folder_a = next(item for item in tree if item["name"] == "a")
+    deep = next(item for item in folder_a["children"] if item["name"] == "deep")
+    assert deep["children"][0]["path"] == "/a/deep/hidden"
+    assert deep["children"][0]["depth"] == 3
+
+
+@pytest.mark.asyncio
+async def test_search_wiki_follows_pages_with_cursor(make_client, wiki_search_handler, logged_in):
+    """测试搜索跟随分页直到 limit，并返回续传游标"""
+    log = []
+    async with make_client(wiki_search_handler(12, log=log)) as client:
+        with patch.object(transport, "_http_client", client):
+            first = await server.search_wiki("q", page_size=5, limit=7)
+            cursor = json.loads(first.content[1].text)["next_cursor"]
+            requests_for_first = len(log)
+            rest = await server.search_wiki("q", page_size=5, limit=100, cursor=cursor)
+
+    titles = [item["title"] for item in json.loads(first.content[0].text)]
+    assert titles == [f"result{i}" for i in range(7)]
+    # limit 已被覆盖时不再预取下一页
+    assert requests_for_first == 2
+    titles = [item["title"] for item in json.loads(rest.content[0].text)]
+    assert titles == [f"result{i}" for i in range(7, 12)]
+    assert len(rest.content) == 1
+
+
+@pytest.mark.asyncio
+async def test_search_wiki_limit_defaults_to_page_size(make_client, wiki_search_handler, logged_in):
+    """测试未指定 limit 时只返回 page_size 条结果，与旧调用行为一致"""
+    log = []
+    async with make_client(wiki_search_handler(12, log=log)) as client:
+        with patch.object(transport, "_http_client", client):
+            result = await server.search_wiki("q", page_size=5)
+
+    titles = [item["title"] for item in json.loads(result.content[0].text)]
+    assert titles == [f"result{i}" for i in range(5)]
+    assert len(log) == 1
+    assert "next_cursor" in json.loads(result.content[1].text)
+
+
+@pytest.mark.asyncio
+async def test_wiki_search_prefetches_next_page(make_client, wiki_search_handler):
+    """测试在消费当前页时，下一页请求已经发出"""
+    log = []
+    async with make_client(wiki_search_handler(9, delay=0.05, log=log)) as client:
+        with patch.object(transport, "_http_client", client):
+            consumed = []
+            async for item, _ in server._iter_wiki_search("q", "test_token", page_size=3):
+                if item["title"] == "result0":
+                    # 处理第一页时，第二页应已在请求中
+                    await asyncio.sleep(0.01)
+                    assert [entry[1] for entry in log] == [0, 3]
+                consumed.append(item["title"])
+
+    assert consumed == [f"result{i}" for i in range(9)]
+
+
+@pytest.mark.asyncio
+async def test_search_wiki_local_mode_uses_fetched_documents(make_client, logged_in):
+    """测试获取过的文档进入本地索引，本地搜索无需请求飞书，需要时回退到远程搜索"""
+    paths = []
+
+    def handler(request: httpx.Request):
+        paths.append(request.url.path)
+        if request.url.path == "/open-apis/docx/v1/documents/doc1":
+            return httpx.Response(200, json={"code": 0, "data": {"document": {"title": "部署指南", "revision_id": 3}}})
+        if request.url.path == "/open-apis/wiki/v1/nodes/search":
+            return httpx.Response(200, json={"code": 0, "data": {"items": [{"title": "remote hit"}], "has_more": False}})
+        return httpx.Response(200, json={"code": 0, "data": {"content": "服务部署步骤与回滚方案"}})
+
+    index = LocalIndex()
+    add = index.add
+
+    def slow_add(*args, **kwargs):
+        time.sleep(0.3)
+        add(*args, **kwargs)
+
+    async with make_client(handler) as client:
+        with patch.object(transport, "_http_client", client), \
+             patch.object(server, "local_index", index), \
+             patch.object(index, "add", slow_add):
+            start = time.monotonic()
+            await server.get_lark_doc_content("https://docs.feishu.cn/docx/doc1")
+            # 写入索引在后台进行，不阻塞获取文档
+            assert time.monotonic() - start < 0.3
+            fetched = len(paths)
+
+            local = await server.search_wiki("回滚", mode="local")
+            assert len(paths) == fetched
+            miss = await server.search_wiki("监控", mode="local")
+            fallback = await server.search_wiki("监控", mode="local", fallback=True)
+            invalid = await server.search_wiki("监控", mode="other")
+
+    results = json.loads(local.content[0].text)
+    assert results[0]["document_id"] == "doc1"
+    assert results[0]["title"] == "部署指南"
+    assert results[0]["url"] == "https://docs.feishu.cn/docx/doc1"
+    assert miss.content[0].text == "No results found"
+    assert json.loads(fallback.content[0].text)[0]["title"] == "remote hit"
+    assert paths[-1] == "/open-apis/wiki/v1/nodes/search"
+    assert invalid.isError is True
+
+
+@pytest.mark.asyncio
+async def test_create_doc_inserts_blocks_in_batches(make_client, create_doc_handler, logged_in):
+    """测试长文档分批插入，续插的子块挂到飞书分配的真实父块 ID 下"""
+    log = []
+    markdown = "# 标题\n\n- item\n" + "\n".join(f"  - child {i}" for i in range(6)) + "\n\n结尾\n"
+
+    with patch.object(transport, "_http_client", make_client(create_doc_handler(log))), \
+         patch.object(server, "DESCENDANT_BATCH_SIZE", 4):
+        result = await server.create_doc("长文档", markdown)
+
+    assert not result.isError
+    assert len(log) > 1
+    assert all(len(body["descendants"]) <= 4 for _, _, body in log)
+    # 每批使用不同的 client_token，以便安全重试
+    assert len({params["client_token"] for _, params, _ in log}) == len(log)
+    # 根级批次依次追加在文档末尾
+    root_batches = [body for path, _, body in log if path.endswith("/blocks/doc1/descendant")]
+    index = 0
+    for body in root_batches:
+        assert body["index"] == index
+        index += len(body["children_id"])
+    assert index == len(server.convert_markdown_to_blocks(markdown)["children_id"])
+    continued = [path for path, _, _ in log if not path.endswith("/blocks/doc1/descendant")]
+    assert continued
+    assert all(path.split("/blocks/")[1].startswith("real-") for path in continued)
+
+
+@pytest.mark.asyncio
+async def test_create_doc_reports_failed_batch(make_client, logged_in):
+    """测试某一批插入失败时返回错误并说明已创建的块数"""
+    calls = 0
+
+    def handler(request: httpx.Request):
+        nonlocal calls
+        if request.url.path == "/open-apis/docx/v1/documents":
+            return httpx.Response(200, json={"code": 0, "data": {"document": {"document_id": "doc1"}}})
+        calls += 1
+        if calls == 2:
+            return httpx.Response(400, json={"code": 1770001, "msg": "invalid param"})
+        return httpx.Response(200, json={"code": 0, "data": {"block_id_relations": []}})
+
+    markdown = "\n".join(f"### 标题 {i}" for i in range(10))
+    with patch.object(transport, "_http_client", make_client(handler)), \
+         patch.object(server, "DESCENDANT_BATCH_SIZE", 4):
+        result = await server.create_doc("长文档", markdown)
+
+    assert result.isError
+    assert "batch 2/3" in result.content[0].text
+    assert "4 blocks created" in result.content[0].text
+
+
+@pytest.mark.asyncio
+async def test_create_doc_overlaps_conversion_and_wiki_move(make_client, logged_in):
+    """测试 Markdown 转换与创建文档并行，移动到知识库与插入块并行"""
+    delay = 0.2
+    started = {}
+
+    async def handler(request: httpx.Request):
+        path = request.url.path
+        started.setdefault(path, time.monotonic())
+        await asyncio.sleep(delay)
+        if path == "/open-apis/docx/v1/documents":
+            return httpx.Response(200, json={"code": 0, "data": {"document": {"document_id": "doc1"}}})
+        return httpx.Response(200, json={"code": 0, "data": {}})
+
+    convert = server.convert_markdown_to_blocks
+
+    def slow_convert(content):
+        time.sleep(delay)
+        return convert(content)
+
+    begin = time.monotonic()
+    with patch.object(transport, "_http_client", make_client(handler)), \
+         patch.object(server, "convert_markdown_to_blocks", slow_convert):
+        result = await server.create_doc("文档", "# 标题\n\n正文", target_space_id="space1")
+    elapsed = time.monotonic() - begin
+
+    assert not result.isError
+    move = started["/open-apis/wiki/v2/space-node/move"]
+    insert = started["/open-apis/docx/v1/documents/doc1/blocks/doc1/descendant"]
+    assert abs(move - insert) < delay / 2
+    # 创建 + (移动 ∥ 插入)，转换被创建请求掩盖
+    assert elapsed < 3 * delay
+
+
+@pytest.mark.asyncio
+async def test_create_docs_bulk_with_bounded_parallelism(tmp_path, make_client, logged_in):
+    """测试批量创建：列表与目录输入、并发上限、逐项状态与耗时"""
+    active = 0
+    peak = 0
+    titles = []
+
+    async def handler(request: httpx.Request):
+        nonlocal active, peak
+        if request.url.path == "/open-apis/docx/v1/documents":
+            title = json.loads(request.content)["title"]
+            titles.append(title)
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.05)
+            active -= 1
+            if title == "坏文档":
+                return httpx.Response(400, json={"code": 1770002, "msg": "not found"})
+            return httpx.Response(200, json={"code": 0, "data": {"document": {"document_id": f"id-{title}"}}})
+        return httpx.Response(200, json={"code": 0, "data": {}})
+
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "a.md").write_text("# A", encoding="utf-8")
+    (tmp_path / "sub" / "b.markdown").write_text("正文", encoding="utf-8")
+    (tmp_path / "ignored.txt").write_text("x", encoding="utf-8")
+
+    docs = [
+        {"title": "文档1", "content": "# 一"},
+        ["文档2", "二", None],
+        {"title": "坏文档"},
+        {"content": "没有标题"},
+        ["文档3"],
+    ]
+    with patch.object(transport, "_http_client", make_client(handler)):
+        result = await server.create_docs(docs=docs, directory=str(tmp_path), max_concurrency=2)
+
+    summary = json.loads(result.content[0].text)
+    assert not result.isError
+    assert peak == 2
+    assert summary["created"] == 5
+    assert summary["failed"] == 2
+    items = summary["items"]
+    assert [item["index"] for item in items] == list(range(7))
+    assert items[0]["status"] == "created"
+    assert items[0]["document_id"] == "id-文档1"
+    assert items[2]["status"] == "failed" and "code 1770002" in items[2]["error"]
+    assert items[3]["status"] == "failed" and "without title" in items[3]["error"]
+    assert [item["title"] for item in items[5:]] == ["a", "b"]
+    assert items[6]["source"].endswith("b.markdown")
+    assert all(item["elapsed_seconds"] >= 0 and item["wait_seconds"] >= 0 for item in items if "title" in item)
+    assert "没有标题" not in titles
+
+
+@pytest.mark.asyncio
+async def test_create_docs_rejects_missing_input():
+    """测试没有输入或目录不存在时返回错误"""
+    result = await server.create_docs()
+    assert result.isError
+    assert "No documents provided" in result.content[0].text
+
+    result = await server.create_docs(directory="/nonexistent/dir")
+    assert result.isError
+    assert "Directory not found" in result.content[0].text
+
+
+@pytest.mark.asyncio
+async def test_update_doc_sends_only_changed_blocks(make_client, document_blocks_handler, logged_in):
+    """测试更新文档只发送变化块对应的少量请求"""
+    log = []
+    old = "\n".join(f"### 标题 {i}" for i in range(10))
+    new = old.replace("标题 4", "新标题").replace("### 标题 9", "### 标题 9\n- 新列表项")
+
+    with patch.object(transport, "_http_client", make_client(document_blocks_handler(old, log))):
+        result = await server.update_doc("https://xxx.feishu.cn/docx/doc1", new)
+
+    assert not result.isError
+    summary = json.loads(result.content[0].text)
+    assert summary["patched"] == 1
+    assert summary["deleted"] == 0
+    assert summary["inserted"] >= 1
+    methods = [method for method, _, _ in log]
+    assert methods == ["POST", "PATCH"]
+    _, path, body = log[0]
+    assert path == "/open-apis/docx/v1/documents/doc1/blocks/doc1/descendant"
+    assert body["index"] == 10
+    _, path, body = log[1]
+    assert path.endswith("/blocks/batch_update")
+    assert body["requests"][0]["block_id"] == "5"
+    assert body["requests"][0]["update_text_elements"]["elements"][0]["text_run"]["content"] == "新标题"
+
+
+@pytest.mark.asyncio
+async def test_update_doc_deletes_removed_blocks(make_client, document_blocks_handler, logged_in):
+    """测试删除内容时按索引范围删除子块"""
+    log = []
+    old = "\n".join(f"### 标题 {i}" for i in range(6))
+    new = "\n".join(f"### 标题 {i}" for i in range(6) if i not in (2, 3))
+
+    with patch.object(transport, "_http_client", make_client(document_blocks_handler(old, log))):
+        result = await server.update_doc("https://xxx.feishu.cn/docx/doc1", new)
+
+    assert not result.isError
+    assert log == [("DELETE", "/open-apis/docx/v1/documents/doc1/blocks/doc1/children/batch_delete",
+                    {"start_index": 2, "end_index": 4})]
+
+
+@pytest.mark.asyncio
+async def test_document_blocks_prefetch_next_page(make_client, document_blocks_handler):
+    """测试遍历块时下一页请求已经发出"""
+    log = []
+    markdown = "\n".join(f"### 标题 {i}" for i in range(8))
+    handler = document_blocks_handler(markdown, log, page_size=3)
+    pages = []
+
+    def logging_handler(request: httpx.Request):
+        pages.append(request.url.params.get("page_token"))
+        return handler(request)
+
+    async with make_client(logging_handler) as client:
+        with patch.object(transport, "_http_client", client):
+            seen = []
+            async for block in server._iter_document_blocks("doc1", "test_token", page_size=3):
+                if block["block_id"] == "doc1":
+                    await asyncio.sleep(0.01)
+                    assert pages == [None, "3"]
+                seen.append(block["block_id"])
+
+    assert seen == ["doc1"] + [str(i) for i in range(1, 9)]
+    assert pages == [None, "3", "6"]
+
+
+@pytest.mark.asyncio
+async def test_get_lark_doc_content_markdown_mode(make_client, document_blocks_handler, logged_in):
+    """测试 markdown 模式从块树渲染出标题、列表与代码，并按版本缓存"""
+    log = []
+    markdown = "# 标题\n\n正文 **加粗**\n\n- a\n  - b\n\n```python\nprint(1)\n```\n"
+    handler = document_blocks_handler(markdown, log, page_size=2)
+    block_pages = 0
+
+    def counting_handler(request: httpx.Request):
+        nonlocal block_pages
+        if request.url.path == "/open-apis/docx/v1/documents/doc1":
+            return httpx.Response(200, json={"code": 0, "data": {"document": {"document_id": "doc1", "revision_id": 7}}})
+        block_pages += request.url.path.endswith("/blocks")
+        return handler(request)
+
+    with patch.object(transport, "_http_client", make_client(counting_handler)):
+        result = await server.get_lark_doc_content("https://xxx.feishu.cn/docx/doc1", mode="markdown")
+        pages = block_pages
+        cached = await server.get_lark_doc_content("https://xxx.feishu.cn/docx/doc1", mode="markdown")
+        invalid = await server.get_lark_doc_content("https://xxx.feishu.cn/docx/doc1", mode="html")
+
+    assert not result.isError
+    assert result.content[0].text == markdown
+    assert pages > 1
+    assert cached.content[0].text == markdown
+    assert block_pages == pages
+    assert invalid.isError
+    assert "Invalid content mode" in invalid.content[0].text
+
+
+@pytest.mark.asyncio
+async def test_markdown_mode_round_trip_keeps_unsupported_blocks(make_client, document_blocks_handler, lark_document, logged_in):
+    """测试以 markdown 模式读取飞书文档、修改一个词后 update_doc，只更新该段，不会删除图片和分割线"""
+    log = []
+    blocks = lark_document()
+    blocks.insert(3, {"block_id": "img", "block_type": 27, "parent_id": "doc1", "image": {"token": "t"}})
+    blocks.insert(5, {"block_id": "hr", "block_type": 22, "parent_id": "doc1", "divider": {}})
+    blocks[0]["children"] = [block["block_id"] for block in blocks[1:]]
+    handler = document_blocks_handler(None, log, blocks=blocks)
+
+    def meta_handler(request: httpx.Request):
+        if request.url.path == "/open-apis/docx/v1/documents/doc1":
+            return httpx.Response(200, json={"code": 0, "data": {"document": {"document_id": "doc1", "revision_id": 1}}})
+        return handler(request)
+
+    with patch.object(transport, "_http_client", make_client(meta_handler)):
+        fetched = await server.get_lark_doc_content("https://xxx.feishu.cn/docx/doc1", mode="markdown")
+        markdown = fetched.content[0].text
+        assert "<!-- unsupported block type 27 -->" in markdown
+        unchanged = await server.update_doc("https://xxx.feishu.cn/docx/doc1", markdown)
+        assert not log
+        result = await server.update_doc("https://xxx.feishu.cn/docx/doc1", markdown.replace("第 2 段", "第 2 段改"))
+
+    assert not unchanged.isError
+    summary = json.loads(unchanged.content[0].text)
+    assert (summary["inserted"], summary["deleted"], summary["patched"]) == (0, 0, 0)
+    assert not result.isError
+    summary = json.loads(result.content[0].text)
+    assert (summary["inserted"], summary["deleted"], summary["patched"]) == (0, 0, 1)
+    assert [method for method, _, _ in log] == ["PATCH"]
+    assert [update["block_id"] for update in log[0][2]["requests"]] == ["p2"]
@@ -0,0 +1,121 @@
+import pytest
+import os
+import sys
+import time
+import asyncio
+import dataclasses
+from unittest.mock import patch, MagicMock, AsyncMock
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mcp_lark_doc_manage.server as server
+from mcp_lark_doc_manage.token_manager import TokenManager, TokenSnapshot
+
+# 所有测试使用 server_test 标记
+pytestmark = pytest.mark.server_test
+
+
+def test_snapshot_is_immutable():
+    """测试令牌快照不可修改"""
+    snapshot = TokenSnapshot("token", time.time() + 3600)
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        snapshot.access_token = "other"
+
+
+def test_snapshot_expiry():
+    """测试快照的过期判断（提前60秒视为过期）"""
+    assert TokenSnapshot().is_expired()
+    assert TokenSnapshot("token", None).is_expired()
+    assert TokenSnapshot("token", time.time() + 30).is_expired()
+    assert not TokenSnapshot("token", time.time() + 3600).is_expired()
+    assert TokenSnapshot(refresh_token="r").has_usable_refresh_token()
+    assert not TokenSnapshot(refresh_token="r", refresh_token_expires_at=time.time() - 1).has_usable_refresh_token()
+
+
+def test_valid_token_and_update():
+    """测试无锁读取与更新"""
+    manager = TokenManager()
+    assert manager.valid_token() is None
+    
+    assert manager.update(access_token="token", expires_at=time.time() + 3600)
+    assert manager.valid_token() == "token"
+    
+    manager.update(expires_at=time.time() - 1)
+    assert manager.valid_token() is None
+    assert manager.snapshot.access_token == "token"
+
+
+def test_update_compare_and_set():
+    """测试基于快照的比较并交换更新"""
+    manager = TokenManager(TokenSnapshot(refresh_token="refresh_1"))
+    stale = manager.snapshot
+    
+    # 其他写入者先替换了令牌
+    manager.update(refresh_token="refresh_2")
+    
+    # 基于旧快照的更新不会覆盖新令牌
+    assert manager.update(expected=stale, refresh_token=None) is False
+    assert manager.snapshot.refresh_token == "refresh_2"
+    
+    assert manager.update(expected=manager.snapshot, refresh_token=None) is True
+    assert manager.snapshot.refresh_token is None
+
+
+@pytest.mark.asyncio
+async def test_acquire_is_single_flight():
+    """测试并发获取只执行一次，且失败后可重新获取"""
+    manager = TokenManager()
+    calls = 0
+    
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        if calls == 1:
+            raise Exception("first attempt failed")
+        return "token"
+    
+    results = await asyncio.gather(*[manager.acquire(fetch) for _ in range(3)], return_exceptions=True)
+    assert all("first attempt failed" in str(r) for r in results)
+    assert calls == 1
+    
+    assert await manager.acquire(fetch) == "token"
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_acquire_survives_cancelled_caller():
+    """测试某个调用者被取消不会中断共享的获取"""
+    manager = TokenManager()
+    
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "token"
+    
+    first = asyncio.create_task(manager.acquire(fetch))
+    second = asyncio.create_task(manager.acquire(fetch))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    
+    assert await second == "token"
+
+
+@pytest.mark.asyncio
+async def test_expired_token_does_not_deadlock():
+    """测试令牌已存在但过期时，工具调用能完成鉴权而不会死锁"""
+    expired = TokenManager(TokenSnapshot("old_token", time.time() - 10))
+    response = MagicMock()
+    response.success.return_value = True
+    response.data = {"content": "body"}
+    
+    with patch.object(server, "token_manager", expired), \
+         patch("mcp_lark_doc_manage.server.larkClient", MagicMock()), \
+         patch("mcp_lark_doc_manage.server._start_oauth_server", AsyncMock(return_value="new_token")), \
+         patch("mcp_lark_doc_manage.server.lark_request", AsyncMock(return_value=response)) as mock_request:
+        result = await asyncio.wait_for(
+            server.get_lark_doc_content("https://docs.feishu.cn/docx/doc1"), timeout=2
+        )
+    
+    assert result.isError is False
+    assert mock_request.call_args.kwargs["user_access_token"] == "new_token"
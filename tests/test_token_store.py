@@ -0,0 +1,103 @@
+import pytest
+import os
+import sys
+import stat
+import time
+from unittest.mock import patch, MagicMock, AsyncMock
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mcp_lark_doc_manage.server as server
+from mcp_lark_doc_manage.token_store import TokenStore
+from mcp_lark_doc_manage.token_manager import TokenManager
+
+# 所有测试使用 server_test 标记
+pytestmark = pytest.mark.server_test
+
+TOKENS = {
+    "app_id": "test_app_id",
+    "access_token": "stored_access",
+    "expires_at": 9999999999,
+    "refresh_token": "stored_refresh",
+    "refresh_token_expires_at": None
+}
+
+
+def test_token_store_roundtrip(tmp_path):
+    """测试令牌写入与读取"""
+    store = TokenStore(str(tmp_path / "tokens.json"))
+    assert store.load() is None
+    
+    store.save(TOKENS)
+    
+    assert store.load() == TOKENS
+    # 仅所有者可读写，且没有遗留临时文件
+    mode = stat.S_IMODE(os.stat(store.path).st_mode)
+    assert mode == 0o600
+    assert os.listdir(tmp_path) == ["tokens.json"]
+    
+    store.clear()
+    assert store.load() is None
+
+
+def test_token_store_encrypted(tmp_path):
+    """测试加密存储不包含明文令牌"""
+    path = str(tmp_path / "tokens.json")
+    TokenStore(path, "secret passphrase").save(TOKENS)
+    
+    with open(path, "rb") as f:
+        raw = f.read()
+    assert b"stored_access" not in raw
+    assert TokenStore(path, "secret passphrase").load() == TOKENS
+    
+    # 错误口令或缺少口令时视为没有令牌
+    assert TokenStore(path, "wrong passphrase").load() is None
+    assert TokenStore(path).load() is None
+
+
+def test_token_store_ignores_corrupt_file(tmp_path):
+    """测试损坏的存储文件被忽略"""
+    path = tmp_path / "tokens.json"
+    path.write_text("{not json")
+    assert TokenStore(str(path)).load() is None
+
+
+@pytest.mark.asyncio
+async def test_auth_flow_uses_stored_token(tmp_path):
+    """测试重启后直接使用已保存的令牌，无需浏览器授权"""
+    store = TokenStore(str(tmp_path / "tokens.json"))
+    store.save(dict(TOKENS, expires_at=time.time() + 3600))
+    
+    original_task = server._refresh_task
+    try:
+        mock_oauth = AsyncMock(return_value="interactive_token")
+        with patch("mcp_lark_doc_manage.server.token_manager", TokenManager()), \
+             patch("mcp_lark_doc_manage.server.token_store", store), \
+             patch("mcp_lark_doc_manage.server.larkClient", MagicMock()), \
+             patch("mcp_lark_doc_manage.server._start_oauth_server", mock_oauth):
+            token = await server._auth_flow()
+            refresh_token = server.token_manager.snapshot.refresh_token
+        
+        assert token == "stored_access"
+        assert refresh_token == "stored_refresh"
+        mock_oauth.assert_not_called()
+    finally:
+        task = server._refresh_task
+        if task is not None and task is not original_task:
+            task.cancel()
+        server._refresh_task = original_task
+
+
+@pytest.mark.asyncio
+async def test_store_token_persists(tmp_path):
+    """测试获取到的新令牌会写入存储"""
+    store = TokenStore(str(tmp_path / "tokens.json"))
+    with patch("mcp_lark_doc_manage.server.token_manager", TokenManager()), \
+         patch("mcp_lark_doc_manage.server.token_store", store):
+        await server._store_token({"access_token": "new_access", "expires_in": 7200})
+    
+    saved = store.load()
+    assert saved["app_id"] == server.LARK_APP_ID
+    assert saved["access_token"] == "new_access"
+    assert saved["expires_at"] > time.time()
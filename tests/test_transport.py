@@ -0,0 +1,293 @@
+import pytest
+import os
+import sys
+import json
+import time
+import asyncio
+from unittest.mock import patch
+
+import httpx
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mcp_lark_doc_manage.server as server
+import mcp_lark_doc_manage.transport as transport
+
+# 所有测试使用 server_test 标记
+pytestmark = pytest.mark.server_test
+
+
+@pytest.mark.asyncio
+async def test_lark_request_sends_token_and_parses_body(make_client):
+    """测试请求携带用户令牌并解析响应"""
+    seen = {}
+
+    def handler(request: httpx.Request):
+        seen["auth"] = request.headers.get("Authorization")
+        seen["path"] = request.url.path
+        seen["params"] = dict(request.url.params)
+        seen["body"] = json.loads(request.content)
+        return httpx.Response(200, json={"code": 0, "msg": "success", "data": {"items": [1, 2]}})
+
+    async with make_client(handler) as client:
+        with patch.object(transport, "_http_client", client):
+            response = await transport.lark_request(
+                "POST", "/open-apis/wiki/v1/nodes/search",
+                user_access_token="u-token", queries={"page_size": 5}, body={"query": "q"},
+            )
+
+    assert response.success()
+    assert response.data == {"items": [1, 2]}
+    assert seen["auth"] == "Bearer u-token"
+    assert seen["path"] == "/open-apis/wiki/v1/nodes/search"
+    assert seen["params"] == {"page_size": "5"}
+    assert seen["body"] == {"query": "q"}
+
+
+@pytest.mark.asyncio
+async def test_lark_request_sends_encoded_content(make_client):
+    """测试预先编码的请求体原样发送"""
+    seen = {}
+
+    def handler(request: httpx.Request):
+        seen["content"] = request.content
+        seen["type"] = request.headers.get("Content-Type")
+        return httpx.Response(200, json={"code": 0, "msg": "success", "data": {}})
+
+    async with make_client(handler) as client:
+        with patch.object(transport, "_http_client", client):
+            response = await transport.lark_request(
+                "POST", "/open-apis/docx/v1/documents/doc1/blocks/doc1/descendant",
+                content='{"index":0,"children_id":["中"]}'.encode("utf-8"),
+            )
+
+    assert response.success()
+    assert seen["content"] == '{"index":0,"children_id":["中"]}'.encode("utf-8")
+    assert seen["type"] == "application/json; charset=utf-8"
+
+
+@pytest.mark.asyncio
+async def test_lark_request_error_responses(make_client):
+    """测试 Lark 错误码与非 JSON 响应的处理"""
+    def handler(request: httpx.Request):
+        if request.url.path.endswith("/lark-error"):
+            return httpx.Response(400, json={"code": 99991663, "msg": "token invalid"})
+        return httpx.Response(502, text="Bad Gateway")
+
+    async with make_client(handler) as client:
+        with patch.object(transport, "_http_client", client):
+            lark_error = await transport.lark_request("GET", "/open-apis/lark-error")
+            gateway_error = await transport.lark_request("GET", "/open-apis/gateway")
+
+    assert not lark_error.success()
+    assert lark_error.code == 99991663
+    assert lark_error.msg == "token invalid"
+    assert not gateway_error.success()
+    assert gateway_error.code == 502
+    assert "Bad Gateway" in gateway_error.msg
+
+
+@pytest.mark.asyncio
+async def test_concurrent_tool_calls_overlap(make_client, logged_in):
+    """测试并发的工具调用不会互相阻塞事件循环"""
+    delay = 0.2
+
+    async def handler(request: httpx.Request):
+        await asyncio.sleep(delay)
+        return httpx.Response(200, json={"code": 0, "data": {"content": f"content of {request.url.path}"}})
+
+    async with make_client(handler) as client:
+        with patch.object(transport, "_http_client", client), \
+             patch.object(server, "DOC_CONTENT_CACHE_SIZE", 0):
+            start = time.monotonic()
+            results = await asyncio.gather(
+                server.get_lark_doc_content("https://docs.feishu.cn/docx/doc1"),
+                server.get_lark_doc_content("https://docs.feishu.cn/docx/doc2"),
+                server.get_lark_doc_content("https://docs.feishu.cn/docx/doc3"),
+            )
+            elapsed = time.monotonic() - start
+
+    assert all(not result.isError for result in results)
+    assert "doc2" in results[1].content[0].text
+    # 三个请求应该重叠等待，而不是串行执行
+    assert elapsed < delay * 2
+
+
+@pytest.mark.asyncio
+async def test_shared_client_is_pooled_and_reused():
+    """测试所有调用共享同一个连接池客户端"""
+    with patch.object(transport, "_http_client", None), \
+         patch.object(transport, "LARK_MAX_CONNECTIONS", 7), \
+         patch.object(transport, "LARK_KEEPALIVE_EXPIRY", 12.5):
+        client = transport.get_http_client()
+        try:
+            assert transport.get_http_client() is client
+            pool = client._transport._pool
+            assert pool._max_connections == 7
+            assert pool._keepalive_expiry == 12.5
+            assert pool._http2 is transport._http2_available()
+        finally:
+            await transport.close_http_client()
+        assert transport._http_client is None
+
+
+def test_http2_falls_back_without_h2():
+    """测试未安装 h2 时回退到 HTTP/1.1"""
+    with patch.object(transport, "_http2_available", return_value=False):
+        client = transport.create_http_client()
+    assert client._transport._pool._http2 is False
+
+
+def test_endpoint_family_and_rate_config():
+    """测试接口族分类与限流配置解析"""
+    assert transport.endpoint_family("/open-apis/docx/v1/documents/x/raw_content") == "docx"
+    assert transport.endpoint_family("/open-apis/wiki/v2/spaces/get_node") == "wiki"
+    assert transport.endpoint_family("/open-apis/wiki/v1/nodes/search") == "search"
+    assert transport.endpoint_family("/open-apis/drive/v1/files") == "drive"
+    assert transport.endpoint_family("/open-apis/authen/v2/oauth/token") == "auth"
+    assert transport.endpoint_family("/open-apis/im/v1/messages") == "default"
+
+    with patch.object(transport, "LARK_RATE_LIMITS", "docx=12, wiki=0,bad"):
+        transport.reset_rate_limiters()
+        assert transport.get_rate_limiter("docx").max_rate == 12
+        assert transport.get_rate_limiter("wiki") is None
+        assert transport.get_rate_limiter("drive").max_rate == transport.DEFAULT_RATE_LIMITS["drive"]
+    transport.reset_rate_limiters()
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_paces_requests():
+    """测试令牌桶按速率放行请求"""
+    bucket = transport.TokenBucket(rate=50, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+        await bucket.acquire()
+    # 第一个请求立即放行，其余 5 个各间隔 1/50 秒
+    assert time.monotonic() - start >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_throttled_request_slows_down_and_is_resent(make_client):
+    """测试被限流的请求按重置时间等待后重发，且该接口族速率降低"""
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            return httpx.Response(400, json={"code": 99991400, "msg": "request trigger frequency limit"},
+                                  headers={"x-ogw-ratelimit-reset": "0.1"})
+        return httpx.Response(200, json={"code": 0, "data": {}})
+
+    async with make_client(handler) as client:
+        with patch.object(transport, "_http_client", client):
+            response = await transport.lark_request("GET", "/open-apis/drive/v1/files")
+
+    bucket = transport.get_rate_limiter("drive")
+    assert response.success()
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.1
+    assert bucket.rate < bucket.max_rate
+
+
+@pytest.mark.asyncio
+async def test_throttle_retries_are_bounded(make_client):
+    """测试持续限流时最终把限流错误返回给调用方"""
+    calls = 0
+
+    def handler(request: httpx.Request):
+        nonlocal calls
+        calls += 1
+        return httpx.Response(429, json={"code": 99991400, "msg": "frequency limit"}, headers={"Retry-After": "0"})
+
+    async with make_client(handler) as client:
+        with patch.object(transport, "_http_client", client), \
+             patch.object(transport, "LARK_THROTTLE_RETRIES", 2):
+            response = await transport.lark_request("GET", "/open-apis/docx/v1/documents/x")
+
+    assert response.code == 99991400
+    assert calls == 3
+
+
+@pytest.mark.asyncio
+async def test_transient_failure_is_retried_with_backoff(make_client, flaky_handler):
+    """测试幂等请求遇到 5xx 时退避重试直至成功"""
+    log = []
+    async with make_client(flaky_handler(2, log)) as client:
+        with patch.object(transport, "_http_client", client):
+            response = await transport.lark_request("GET", "/open-apis/docx/v1/documents/x")
+
+    assert response.success()
+    assert len(log) == 3
+
+
+@pytest.mark.asyncio
+async def test_non_idempotent_request_is_not_retried(make_client, flaky_handler):
+    """测试非幂等 POST 遇到 5xx 不重试，显式声明幂等时才重试"""
+    log = []
+    async with make_client(flaky_handler(1, log)) as client:
+        with patch.object(transport, "_http_client", client):
+            response = await transport.lark_request("POST", "/open-apis/docx/v1/documents", body={})
+
+    assert response.status_code == 503
+    assert len(log) == 1
+
+    log.clear()
+    async with make_client(flaky_handler(1, log)) as client:
+        with patch.object(transport, "_http_client", client):
+            response = await transport.lark_request(
+                "POST", "/open-apis/wiki/v1/nodes/search", body={"query": "q"}, idempotent=True,
+            )
+
+    assert response.success()
+    assert len(log) == 2
+
+
+@pytest.mark.asyncio
+async def test_unsent_request_is_retried_for_any_method(make_client):
+    """测试连接失败（请求未发出）时即使是 POST 也会重试，读超时则不重试"""
+    log = []
+
+    def handler(request: httpx.Request):
+        log.append(request.method)
+        if len(log) == 1:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, json={"code": 0, "data": {}})
+
+    async with make_client(handler) as client:
+        with patch.object(transport, "_http_client", client):
+            response = await transport.lark_request("POST", "/open-apis/docx/v1/documents", body={})
+
+    assert response.success()
+    assert len(log) == 2
+
+    def timeout_handler(request: httpx.Request):
+        raise httpx.ReadTimeout("read timed out", request=request)
+
+    async with make_client(timeout_handler) as client:
+        with patch.object(transport, "_http_client", client):
+            with pytest.raises(httpx.ReadTimeout):
+                await transport.lark_request("POST", "/open-apis/docx/v1/documents", body={})
+
+
+@pytest.mark.asyncio
+async def test_retries_stop_at_attempt_limit_and_budget(make_client, flaky_handler):
+    """测试重试次数与总耗时预算均有上限"""
+    log = []
+    async with make_client(flaky_handler(100, log)) as client:
+        with patch.object(transport, "_http_client", client), \
+             patch.object(transport, "LARK_RETRY_ATTEMPTS", 2):
+            response = await transport.lark_request("GET", "/open-apis/docx/v1/documents/x")
+
+    assert response.status_code == 503
+    assert len(log) == 3
+
+    log.clear()
+    async with make_client(flaky_handler(100, log)) as client:
+        with patch.object(transport, "_http_client", client), \
+             patch.object(transport, "LARK_RETRY_BUDGET", 0), \
+             patch.object(transport, "_backoff_delay", lambda retry: 0.01):
+            response = await transport.lark_request("GET", "/open-apis/docx/v1/documents/x")
+
+    assert response.status_code == 503
+    assert len(log) == 1